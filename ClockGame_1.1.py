@@ -7,13 +7,22 @@ Clicking the upper-left red button exits the program.
 Author: Michael McCain
 Date: 9 October 2013
 """
+from __future__ import print_function
 import pygame, random, Leap, sys, ctypes, nml
+from acquisition import CaptureStats, CatchUpReader
+from paths import CORNER_NAMES, PathCoverage, balanced_sequence
+from pointer import LatestSlot
+from timing import ClockSync
+from render import DirtyRenderer
+from writer import StreamWriter
 from math import pi, sqrt, isnan
 from os import system, path
 from time import strftime
 
 HITS = 1
 DEFAULT_FILENAME = "..\\data\\clock"
+# Present targets in a generated order that covers every path HITS times in
+# the fewest moves, rather than at random
 CREATE_PATH = True
 # Radius of the Clock Game in pixels (distance from center to perimeter targets)
 DIST_FROM_EDGE = 200
@@ -33,7 +42,6 @@ GREEN = (  0, 255,   0)
 RED   = (255,   0,   0)
 
 
-data = []
 class Circle:
     """Simple object to store position and radius
     """
@@ -59,6 +67,11 @@ class ClockLeapListener(Leap.Listener):
         self.cur_x = 0
         self.cur_y = 0
         self.first = True
+        self.capture = CaptureStats() # Frames missed during the game
+        self.reader = CatchUpReader() # Frames the callback fell behind on
+        self.sync = ClockSync() # Host time each frame was captured
+        # Newest cursor, read by the game loop once per tick
+        self.pointer = LatestSlot()
     def moveMouse(self, x, y, zf):
         """Updates the cursor position and size
 
@@ -67,17 +80,13 @@ class ClockLeapListener(Leap.Listener):
         y -- vertical position, in pixels, from top of graphics window
         zf -- depth factor to determine how big the cursor is
         """
-        global screen
-        global cursor
         if self.cur_x != x or self.cur_y != y:      
             self.cur_x = x
             self.cur_y = y
             rad = 15 + int(zf)
             if rad <= 0:
                 rad = 1
-            cursor = Circle((int(x),int(y)),rad)
-            pygame.event.post(pygame.event.\
-                              Event(pygame.USEREVENT, {'pos':(x,y)}))
+            self.pointer.publish(Circle((int(x),int(y)),rad))
             
     def on_frame(self, controller):
         """Runs everytime the Leap detects interaction, anywhere from 50 to 200
@@ -87,18 +96,27 @@ class ClockLeapListener(Leap.Listener):
         controller -- Leap controller object that had this listener instance
                       added to it.
         """
-        frame = controller.frame()
-        if self.first:
-            self.startup = frame.timestamp/1000.0
-            self.first = False
+        # Every frame since the last callback is logged, read back from the
+        # device history if the callback fell behind
+        frames = self.reader.frames(controller)
+        for frame in frames:
+            if not self.capture.update(frame.id, frame.timestamp):
+                continue # Already handled this frame
+            captured = self.sync.update(frame.timestamp)
+            if self.first:
+                self.startup = captured
+                self.first = False
+            if not frame.fingers.is_empty:
+                row = [(captured - self.startup) / 1e6] # Milliseconds
+                row.extend(nml.finger_positions_to_list(frame.fingers))
+                writer.write(row) # Written to file by a background thread
+        if not frames:
+            return # Already handled this frame
         global screen_x
         global screen_y
-        global cursor
-        if not frame.fingers.is_empty:
-            fingers = frame.fingers
-            row = [frame.timestamp/1000.0 - self.startup]
-            row.extend(nml.finger_positions_to_list(fingers))
-            data.append(row)
+        # Only the newest frame moves the cursor
+        fingers = frames[-1].fingers
+        if not fingers.is_empty:
             monitor = controller.located_screens[0]
             normal = monitor.intersect(fingers[0],True)
             if normal and not (isnan(normal[0]) or isnan(normal[1])):
@@ -107,8 +125,10 @@ class ClockLeapListener(Leap.Listener):
                 yPoint = screen_y * normal[1]
                 zFactor = fingers[0].tip_position[2] / -20.0
                 self.moveMouse(int(xPoint), int(screen_y - yPoint), zFactor)
-            else:
-                cursor = None
+            elif self.pointer.latest().value is not None:
+                # Hide the cursor until the finger points at the screen again
+                self.cur_x = self.cur_y = None
+                self.pointer.publish(None)
         
 def initialize_graphics():
     """Set up the game screen, which gets WINDOWS system data for fullscreen.
@@ -119,6 +139,7 @@ def initialize_graphics():
     global screen_x
     global screen_y
     global locations
+    global renderer
     
     # Get the monitor dimensions for fullscreen and Leap pointing
     user32 = ctypes.windll.user32
@@ -127,6 +148,8 @@ def initialize_graphics():
     screen_size = (screen_x,screen_y)
     screen = pygame.display.set_mode(screen_size,pygame.FULLSCREEN)
     pygame.display.set_caption("Clock Game")
+    # Only the parts of the screen that change are redrawn and updated
+    renderer = DirtyRenderer(screen, WHITE)
     
     # Target locations start at center, then north and proceed clockwise
     locations = [(DIST_FROM_EDGE, DIST_FROM_EDGE), (screen_x - DIST_FROM_EDGE, DIST_FROM_EDGE), \
@@ -152,90 +175,42 @@ def update_screen(target, load=None, cursor=None):
     load -- Circle object representing green loading circle in target
     cursor -- Circle object representing the cursor
     """
-    global screen
-    screen.fill(WHITE)
-    pygame.draw.circle(screen, BLACK, target.position, target.radius)
+    circles = [(BLACK, target.position, target.radius)]
     if load:
-        pygame.draw.circle(screen, GREEN, load.position, load.radius)
+        circles.append((GREEN, load.position, load.radius))
     if cursor:
-        pygame.draw.circle(screen, RED, cursor.position, cursor.radius)
-    pygame.display.flip()
+        circles.append((RED, cursor.position, cursor.radius))
+    renderer.draw(circles)
 
-def log_path(current, new):
-    if current == 0 and new == 1:
-        paths['NW-NE'] += 1
-    elif current == 1 and new == 0:
-        paths['NE-NW'] += 1
-    elif current == 2 and new == 3:
-        paths['SW-SE'] += 1
-    elif current == 3 and new == 2:
-        paths['SE-SW'] += 1
-    elif current == 0 and new == 2:
-        paths['NW-SW'] += 1
-    elif current == 2 and new == 0:
-        paths['SW-NW'] += 1
-    elif current == 1 and new == 3:
-        paths['NE-SE'] += 1
-    elif current == 3 and new == 1:
-        paths['SE-NE'] += 1
-    elif current == 0 and new == 3:
-        paths['NW-SE'] += 1
-    elif current == 3 and new == 0:
-        paths['SE-NW'] += 1
-    elif current == 1 and new == 2:
-        paths['NE-SW'] += 1
-    elif current == 2 and new == 1:
-        paths['SW-NE'] += 1
-        
-def find_path(current, new):
-    if current == 0 and new == 1:
-        return'NW-NE'
-    elif current == 1 and new == 0:
-        return 'NE-NW'
-    elif current == 2 and new == 3:
-        return 'SW-SE'
-    elif current == 3 and new == 2:
-        return 'SE-SW'
-    elif current == 0 and new == 2:
-        return 'NW-SW'
-    elif current == 2 and new == 0:
-        return 'SW-NW'
-    elif current == 1 and new == 3:
-        return 'NE-SE'
-    elif current == 3 and new == 1:
-        return 'SE-NE'
-    elif current == 0 and new == 3:
-        return 'NW-SE'
-    elif current == 3 and new == 0:
-        return 'SE-NW'
-    elif current == 1 and new == 2:
-        return 'NE-SW'
-    elif current == 2 and new == 1:
-        return 'SW-NE'
-print ""
-print "Clock Game Data Logger"
-print "BYU Neuromechanics Lab 2013"
-print ""
-print "This application will track and log data from a single finger."
-print "Use a single index finger to point at the screen. A red cursor will"
-print "track the motion. Black targets will be displayed, appearing in random"
-print "order around a central target. Move your hand to point at the current"
-print "target. Pause for a moment in the target for the green loading circle to"
-print "complete, then proceed to the next target. Use the mouse to click the"
-print "circle in the upper-left corner to exit."
-print ""
+print("")
+print("Clock Game Data Logger")
+print("BYU Neuromechanics Lab 2013")
+print("")
+print("This application will track and log data from a single finger.")
+print("Use a single index finger to point at the screen. A red cursor will")
+print("track the motion. Black targets will be displayed, appearing in random")
+print("order around a central target. Move your hand to point at the current")
+print("target. Pause for a moment in the target for the green loading circle to")
+print("complete, then proceed to the next target. Use the mouse to click the")
+print("circle in the upper-left corner to exit.")
+print("")
 
 while True:
     run_timestamp = strftime("%Y%m%d%H%M%S")
-    global paths
-    paths = {'NW-NE':0,'NE-NW':0,'SW-SE':0,'SE-SW':0,'NW-SW':0,'SW-NW':0,'NE-SE':0,'SE-NE':0,\
-             'NW-SE':0,'SE-NW':0,'NE-SW':0,'SW-NE':0,}
 
-    data = []
+    # Data is streamed to file while the game runs
+    filename = DEFAULT_FILENAME + "_"+ run_timestamp + ".csv"
+    writer = StreamWriter(filename,
+                          header='Time (ms),Position Data for Clock Game(mm)\n' + \
+                                 ',x,y,z\n')
     
-    print "Press Enter to Begin"
-    raw_input()
+    print("Press Enter to Begin")
+    nml.read_line()
     initialize_graphics()
+    # Moves between each pair of targets, and the order to present them in
+    coverage = PathCoverage(len(locations), HITS, CORNER_NAMES)
+    sequence = balanced_sequence(len(locations), HITS)
+    step = 0
     listener = ClockLeapListener()
     controller = Leap.Controller()
     controller.add_listener(listener)
@@ -258,8 +233,8 @@ while True:
     #drawTarget(currentTarget, clear=True)
     ct = Circle(locations[0])
     load_circle = None
-    global cursor
     cursor = None
+    seen = 0 # Sequence number of the last cursor drawn
     update_screen(ct)
     increment = 0
     last_one = False
@@ -285,16 +260,14 @@ while True:
             increment = 0
             load_circle = None
             temp = currentTarget
-            while temp == currentTarget:
-                temp = random.randrange(0,len(locations))
-            log_path(currentTarget, temp)
-            #paths[find_path(currentTarget, temp)] += 1
-        
-            last_one = True
-            for path in paths:
-                if paths[path] < HITS:
-                    last_one = False
-                    break
+            if CREATE_PATH:
+                step += 1
+                temp = sequence[step]
+            else:
+                while temp == currentTarget:
+                    temp = random.randrange(0,len(locations))
+            # True once every path has been covered HITS times
+            last_one = coverage.log(currentTarget, temp)
             currentTarget = temp        
             ct.position = locations[currentTarget]
 
@@ -304,19 +277,6 @@ while True:
             if event.type == pygame.QUIT:
                 done = True
 
-            # Mouse is moving or finger is in Leap range (Custom-defined USEREVENT
-            # above)
-            elif event.type == pygame.USEREVENT:
-                update = True
-                # Toggle loading if mouse is in target
-                if isInTarget(event.pos, locations[currentTarget]):
-                    if not load_circle:
-                        load_circle = Circle(ct.position,0)
-
-                # Reset loading if mouse leaves target
-                elif load_circle:
-                    increment = 0
-                    load_circle = None
             elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and isInTarget(event.pos, (50,50)):
                 done = True
             if event.type == pygame.MOUSEMOTION:
@@ -326,6 +286,23 @@ while True:
                     mouse_frames_count = 0
                 else:
                     motion_bug = False
+
+        # Finger has moved, left or come back into Leap range since the last
+        # tick. Only the newest position matters.
+        pointer = listener.pointer.changed_since(seen)
+        if pointer:
+            seen = pointer.sequence
+            cursor = pointer.value
+            update = True
+            # Toggle loading if cursor is in target
+            if cursor and isInTarget(cursor.position, locations[currentTarget]):
+                if not load_circle:
+                    load_circle = Circle(ct.position,0)
+
+            # Reset loading if cursor leaves target
+            elif cursor and load_circle:
+                increment = 0
+                load_circle = None
         if update:
             update_screen(ct, load_circle, cursor)
 
@@ -342,16 +319,9 @@ while True:
     controller.remove_listener(listener)
     pygame.quit() # Be IDLE friendly by formally quitting game engine
     
-    filename = DEFAULT_FILENAME + "_"+ run_timestamp + ".csv"
-    writeFile = open(filename, 'w')
-    writeFile.write ('Time (ms),Position Data for Clock Game(mm)\n' + \
-                     ',x,y,z\n')
-    # Write the gathered data to file
-    for row in data:
-        for element in row:
-            writeFile.write(str(element) + ',')
-        writeFile.write('\n')
-    writeFile.close()
+    # Write any remaining data and close the file
+    writer.close()
+    print("Capture:", listener.capture.summary_line())
     prompt = "Run the program again? (y/n):"
     error = "Please press 'Y' or 'N' and then ENTER"
     if nml.two_choice_input_loop(prompt, "y", "n", error) == "n":
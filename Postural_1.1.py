@@ -11,12 +11,28 @@ TODO: GUI feedback of position in interaction box
     reformat file to be function-friendly for GUI replacement
 """
 
-import Leap, nml
-from time import clock
+from __future__ import print_function
+import Leap, nml, session
+from acquisition import Acquisition
+from fingers import FINGER_NAMES, FingerTracker
+from framebuffer import FrameBuffer
+from tremor import SlidingSpectrum, TremorWindow
+from writer import StreamWriter
+from time import strftime
+from timing import now
 from os import system, path
 
 DEFAULT_TIMER = 2 # Time interval to collect data in seconds
 DEFAULT_FILENAME = 'postural_data'
+# Seconds between redrawing the live tremor window, which is also when
+# recorded rows are handed to the writer
+REFRESH_INTERVAL = 0.1
+LIVE_DISPLAY = True # Show the tremor spectrum while recording
+# Frames kept from before the trial is triggered; half a second at 200 fps
+PRE_TRIGGER = 100
+# Hand being recorded, 'right' or 'left', for putting the fingers in order
+# when the Leap doesn't report which hand it sees
+HAND = 'right'
  
 class PostureListener(Leap.Listener):
     """Once activated, listens for any Leap input, interrupting any current
@@ -31,7 +47,12 @@ class PostureListener(Leap.Listener):
         controller -- Leap controller object that had this listener instance
                       added to it.
         """
-        self.data = [] # Hand Data is stored here until ready to write to file.
+        # Hand Data is stored here until ready to write to file. Until the
+        # trial is triggered only the last PRE_TRIGGER frames are kept.
+        self.data = FrameBuffer(pre_trigger=PRE_TRIGGER)
+        # Keeps each finger in its own columns
+        self.fingers = FingerTracker(HAND)
+        self.spectrum = SlidingSpectrum() # Live tremor of the palm
 
     def on_frame(self, controller):
         """Runs everytime the Leap detects interaction, anywhere from 50 to 200
@@ -44,51 +65,41 @@ class PostureListener(Leap.Listener):
         
         frame = controller.frame() # Grab current frame of Leap data        
 
-        global positioning # If True, initial positioning still not complete.
-        if not keyboard_activated and positioning:
-            if len(frame.hands) == 1: # Checks for 1 hand                
-                hand1 = frame.hands[0]
-
-                # End initial positioning if hand is clearly visible
-                if nml.is_in_interaction_box(frame, hand1.palm_position):
-                    positioning = False                   
+        # Until the hand is positioned, check whether it is clearly
+        # visible. Doing so wakes main() to start the trial.
+        if not keyboard_activated and not acquisition.hand_positioned.is_set():
+            acquisition.check_hand(frame)
                 
-        # Once reading data, only record if hand is still visible        
-        elif len(frame.hands) > 0:
-            currentTime = clock() # Timestamp
-            hand = frame.hands[0]     
-            position = hand.palm_position
-
-            # XYZ for palm center
-            x = position[0] 
-            y = position[1] 
-            z = position[2] 
-
-            #Vector for the palm normal
-            pn = hand.palm_normal           
-
-            # Palm velocity vector
-            pv = hand.palm_velocity
-
-            row = [currentTime-start,x,y,z,pn[0],pn[1],pn[2],pv[0],pv[1],pv[2]]
-            
-            # Loop through all visible fingers, appending their position data
-            # to the current row
-            for finger in frame.fingers:
-                pos = finger.tip_position
-                row.extend([pos[0],pos[1],pos[2]])
-
-            self.data.append(row)
+        # Recording runs from device ready on, so the trial can start with
+        # the frames from just before it was triggered. Take every frame
+        # since the last callback from the device history, note the frame
+        # ids so missed frames are counted, and only record if hand is
+        # visible.
+        for frame in acquisition.reader.frames(controller, frame):
+            if not acquisition.record_frame(frame) or len(frame.hands) == 0:
+                continue
+            # Host time the frame was captured, free of callback delay
+            currentTime = acquisition.sync.update(frame.timestamp) / 1e9
+
+            # Palm position, normal and velocity plus the position of every
+            # visible finger, thumb to pinky, go straight into the
+            # preallocated buffer
+            hand = frame.hands[0]
+            self.data.append_hand(currentTime, hand,
+                                  self.fingers.track(hand, hand.fingers),
+                                  frame.id, frame.timestamp / 1e6)
+            self.spectrum.update(currentTime,
+                                 hand.palm_position.to_float_array())
 
 def main():
-    print ""
-    print "Postural Tremor Data Logger for Two Hands"
-    print "BYU Neuromechanics Lab 2013"
-    print ""
-    print "This application will track and log data from one of your hands"
-    print "as you hold it in a fixed position above the sensor for a set"
-    print "period of time."
-    print ""
+    print("")
+    print("Postural Tremor Data Logger for Two Hands")
+    print("BYU Neuromechanics Lab 2013")
+    print("")
+    print("This application will track and log data from one of your hands")
+    print("as you hold it in a fixed position above the sensor for a set")
+    print("period of time.")
+    print("")
 
     
 
@@ -101,14 +112,14 @@ def main():
         error = "Please press 'Y' or 'N' and then ENTER"
         choice = nml.two_choice_input_loop(prompt, "y", "n", error)
         if choice == "n":
-            print "CSV Filename (exclude .csv extension):",
-            filename = raw_input()
-            print "Timer:",
-            timer_string = raw_input()
+            print("CSV Filename (exclude .csv extension):", end=" ")
+            filename = nml.read_line()
+            print("Timer:", end=" ")
+            timer_string = nml.read_line()
             while not nml.is_number(timer_string):
-                print "Please enter a valid number."
-                print "Timer:",
-                timer_string = raw_input()
+                print("Please enter a valid number.")
+                print("Timer:", end=" ")
+                timer_string = nml.read_line()
             timer = float(timer_string)
 
         # If filename has previously been used, append a number to it
@@ -129,20 +140,29 @@ def main():
 
         # See if writing to the file results in an error.
         try:
-            writeFile = open(filename,'w')
+            writer = StreamWriter(filename,
+                        header='Postural Tremor Data for One Hand\n' + \
+                        'Time (s),' + \
+                        'Palm position (mm),,,' + \
+                        'Palm normal vector,,,' + \
+                        'Palm velocity (mm/s),,,' + \
+                        'Individual Finger Positions - xyz (Thumb to Pinky)\n'+ \
+                        ',x,y,z,i,j,k,x,y,z,' + \
+                        'Thumb,,,Index,,,Middle,,,Ring,,,' + \
+                        'Pinky\n')
         except:
-            print "Couldn't access",filename, "because it is open in another " + \
-                  "program.\nPlease close",filename, "and try again."
-            print "Press ENTER to exit."
-            raw_input()
+            print("Couldn't access",filename, "because it is open in another " + \
+                  "program.\nPlease close",filename, "and try again.")
+            print("Press ENTER to exit.")
+            nml.read_line()
             return
 
         # Instuctions
-        print ""
-        print "You have the option of starting the data logging process by"
-        print "having an assistant press enter on the keyboard, or by having"
-        print "the sensor detect that your hands are in position automatically."
-        print ""
+        print("")
+        print("You have the option of starting the data logging process by")
+        print("having an assistant press enter on the keyboard, or by having")
+        print("the sensor detect that your hands are in position automatically.")
+        print("")
         
         global keyboard_activated # If True, no initial positioning necessary.
         keyboard_activated = True
@@ -151,61 +171,72 @@ def main():
         if nml.two_choice_input_loop(prompt, "k", "h") == "h":
             keyboard_activated = False
             
-        global start  # Time of initial recording  
-        writeFile.write('Postural Tremor Data for One Hand\n' + \
-                        'Time (s),' + \
-                        'Palm position (mm),,,' + \
-                        'Palm normal vector,,,' + \
-                        'Palm velocity (mm/s),,,' + \
-                        'Individual Finger Positions - xyz (Unordered)\n'+ \
-                        ',x,y,z,i,j,k,x,y,z,' + \
-                        'Finger 1,,,Finger 2,,,Finger 3,,,Finger 4,,,' + \
-                        'Finger 5\n')
-        
         # Create a listener and controller
+        global acquisition # Wakes main() when the listener sees the hand
+        acquisition = Acquisition()
         listener = PostureListener()
         controller = Leap.Controller()
 
         height = nml.interaction_height(controller, False)
-        print ""
-        print "Place your hand about " + str(height) + " inches above the"
-        print "controller with fingers extended."
+        # Once the device is ready the listener records every frame, keeping
+        # only the last PRE_TRIGGER until the trial is triggered
+        controller.add_listener(listener)
+        print("")
+        print("Place your hand about " + str(height) + " inches above the")
+        print("controller with fingers extended.")
         if keyboard_activated:
-            print "Assistant may press Enter to begin"
-            raw_input()
-            controller.add_listener(listener)
-        
+            print("Assistant may press Enter to begin")
+            nml.read_line()
         else:
-            global positioning # If True, initial positioning still not complete.
-            positioning = True
-
-            # Once added, the listener is able to disrupt any process with on_frame
-            # method if it detects any data.
-            controller.add_listener(listener) 
-
-            # Loop indefinitely until hands are in position.
-            while positioning:
-                pass
-        start = clock() # Start the clock to reference all measurements.
-        print "Reading hand data. . ."
+            # Sleep until the listener signals that hands are in position.
+            acquisition.wait_hand_positioned()
+        # Triggering only marks where the trial starts in the recording
+        start = now() # Start the clock to reference all measurements.
+        first = listener.data.trigger()
+        acquisition.restart_counts()
+        display = TremorWindow(listener.spectrum) if LIVE_DISPLAY else None
+        print("Reading hand data. . .")
         
-        # This empty loop runs until the time runs out. The listener's on_frame
+        # Sleep until the time runs out, counted from the trigger so opening
+        # the display doesn't lengthen the trial. The listener's on_frame
         # method will execute every time the Leap senses an input.
-        while clock() - start < timer:
-            pass
+        # Meanwhile, rows recorded so far are handed to the writer thread
+        # and the live tremor estimate is redrawn.
+        acquisition.start_timer(max(0.0, timer - (now() - start)))
+        written = first
+        while not acquisition.wait_timer(REFRESH_INTERVAL):
+            recorded = len(listener.data)
+            writer.write_rows(listener.data.to_rows(written, recorded, start))
+            written = recorded
+            if display:
+                display.draw()
             
         # Remove the listener when done
         controller.remove_listener(listener)
-
-        # Write the gathered data to file
-        data = listener.data
-        for row in data:
-            for element in row:
-                writeFile.write(str(element))
-                writeFile.write(',')
-            writeFile.write('\n')
-        writeFile.close()
-        print ""
+        if display:
+            display.close()
+        estimate = listener.spectrum.estimate()
+        if estimate:
+            print("Palm tremor: %.1f Hz, %.2f mm" % estimate)
+
+        # Write the remaining data to file
+        writer.write_rows(listener.data.to_rows(written, origin=start))
+        writer.close()
+
+        # Keep a session file with the frame ids and the capture statistics,
+        # so trials that lost frames can be found and rejected later
+        header = session.make_header('postural', session.POSTURAL_COLUMNS,
+                                     hand=listener.fingers.hand,
+                                     date=strftime("%m/%d/%Y"),
+                                     fingers=list(FINGER_NAMES),
+                                     capture=acquisition.capture.summary())
+        session.write_session(path.splitext(filename)[0] + session.EXTENSION,
+                              header, listener.data.to_array(first,
+                                                             origin=start))
+        print("Capture:", acquisition.capture.summary_line())
+        print("Read back from the device history: %d frames, %d already gone"
+              % (acquisition.reader.recovered, acquisition.reader.lost))
+        print("")
         prompt = "Open " + filename + " to view results? (y/n):"
         error = "Please press 'Y' or 'N' and then ENTER"
         if nml.two_choice_input_loop(prompt, "y", "n", error) == "y":
@@ -215,8 +246,8 @@ def main():
         if nml.two_choice_input_loop(prompt, "y", "n", error) == "n":
             return
         else:
-            print "Remembmer to choose a new filename if you wish to keep"
-            print "previous data."
+            print("Remembmer to choose a new filename if you wish to keep")
+            print("previous data.")
 
 # This independent statement should be at the bottom of all Python scripts
 # that you wish to have a main().
@@ -1,11 +1,32 @@
-import pygame, Leap, nml
-from time import clock, strftime
+from __future__ import print_function
+import pygame, Leap, nml, segment, sys
+import numpy as np
+from acquisition import CaptureStats, CatchUpReader, wait_for_device
+from capture import CAPTURED, CaptureDaemon, RingDrain, fingertip, fingertips
+from fingers import FingerTracker, relabel, slot_positions
+from framebuffer import TriggeredRows
+from render import StaticLayer, TextCache
+from taps import TapCounter
+from timing import ClockSync, now
+from session import EXTENSION
+from time import strftime
 from os import path, listdir
-from pylab import plot, show
-from easygui import msgbox, textbox
 
 DEFAULT_TIMER = 10
 DEFAULT_FILENAME = "..\\data\\tapping"
+# Capture in a separate process, so rendering can't delay the Leap callback.
+# Needs Python 3.8 or later.
+CAPTURE_DAEMON = False
+# Frames kept from before the finger crosses the lower line and starts the
+# trial; half a second at 200 fps
+PRE_TRIGGER = 100
+# Record every trial in one stream, saved with the trial boundaries so the
+# trials can be cut out again later, instead of setting the device and
+# display up again for each trial
+CONTINUOUS = False
+# Hand being recorded, 'right' or 'left', for putting the fingers in order
+# when the Leap doesn't report which hand it sees
+HAND = 'right'
 
 MARGIN = 5
 SUCCESSES = 5
@@ -29,13 +50,44 @@ GAP = 50
 TOP_LINE = 140
 BOT_LINE = TOP_LINE + GAP
 
+def draw_guides(surface, w, h):
+    """Draws the interaction box outline, its center and the tap lines."""
+    pygame.draw.rect(surface, RED, (BUFF,BUFF,w,h), STROKE)
+    pygame.draw.line(surface, BLACK, (BUFF+w/2-10, BUFF+h/2),(BUFF+w/2+10, BUFF+h/2))
+    pygame.draw.line(surface, BLACK, (BUFF+w/2, BUFF+h/2-10),(BUFF+w/2, BUFF+h/2+10))
+    pygame.draw.line(surface, BLUE, (BUFF, TOP_LINE),(BUFF+w, TOP_LINE))
+    pygame.draw.line(surface, BLUE, (BUFF, BOT_LINE),(BUFF+w, BOT_LINE))
+
+def daemon_rows(records, start):
+    """Returns the rows of a trial read from the capture daemon, in the
+    columns of TapListener.data.
+
+    Keyword arguments:
+    records -- array returned by CaptureClient.read()
+    start -- host time the trial started, in seconds
+    """
+    # The daemon keeps fingers in the order they appeared, so they are
+    # sorted thumb to pinky by position afterwards
+    tips = relabel(fingertips(records), hand=HAND).tolist()
+    rows = []
+    for time, tip in zip((records[:, CAPTURED] - start).tolist(), tips):
+        if any(x == x for x in tip): # Skip frames without fingers
+            rows.append([time] + ['' if x != x else x for x in tip])
+    return rows
+
 class TapListener(Leap.Listener):
     """Once activated, listens for any Leap input, interrupting any current
     process.
     """
 
     def on_init(self, controller):
-        self.data = []
+        # Only the last PRE_TRIGGER rows are kept until the trial starts
+        self.data = TriggeredRows(PRE_TRIGGER)
+        self.capture = CaptureStats() # Frames missed during the trial
+        self.reader = CatchUpReader() # Frames the callback fell behind on
+        self.sync = ClockSync() # Host time each frame was captured
+        # Keeps each finger in its own columns
+        self.fingers = FingerTracker(HAND)
     def on_frame(self, controller):
         """Runs everytime the Leap detects interaction, anywhere from 50 to 200
         frames per second.
@@ -44,19 +96,23 @@ class TapListener(Leap.Listener):
         controller -- Leap controller object that had this listener instance
                       added to it.
         """
-        
-        global start # Time of initial recording
-        frame = controller.frame() # Grab current frame of Leap data 
-
-        # If hand and fingers are visible, record timestamp and y-position
-        # for each finger.
-        fingers = frame.fingers
-        if not fingers.is_empty:
-            frame_data = [clock() - start] # Row to be added to y_data
-            frame_data.extend(nml.finger_positions_to_list(fingers))
+        # Every frame since the last callback, read back from the device
+        # history if the callback fell behind. If hand and fingers are
+        # visible, record timestamp and position for each finger, thumb to
+        # pinky, with blanks for the rest.
+        for frame in self.reader.frames(controller):
+            fingers = frame.fingers
+            if not self.capture.update(frame.id, frame.timestamp) or \
+               fingers.is_empty:
+                continue
+            # Row to be added to y_data, timed from the trigger afterwards
+            frame_data = [self.sync.update(frame.timestamp) / 1e9]
+            hand = frame.hands[0] if len(frame.hands) else None
+            frame_data.extend(slot_positions(self.fingers.track(hand, fingers),
+                                             ''))
             self.data.append(frame_data)
             
-msgbox( "This application will track and log data from a single finger as you quickly wag it up and down above the sensor for a set period of time.", \
+nml.message_box( "This application will track and log data from a single finger as you quickly wag it up and down above the sensor for a set period of time.", \
          "Finger Tapping Data Logger")
 
 trials =[]
@@ -64,55 +120,71 @@ datalog = []
 # Determine whether to use program defaults or user values
 pygame.init()
 run_timestamp = strftime("%Y%m%d%H%M%S")
+text = TextCache() # The trial label only changes with each tap
+# Keeps capturing between trials, and is the only process with the device
+# open; its client gives the cursor as well as the recorded frames
+daemon = CaptureDaemon().start() if CAPTURE_DAEMON else None
+client = None
+set_up = False
+# Once the first trial has started, when CONTINUOUS; until then frames are
+# only kept from PRE_TRIGGER before each trigger, and counted from it
+recording = False
+events = segment.EventLog() # Trial boundaries of the continuous recording
+recorded = [] # Records read from the daemon's client when CONTINUOUS
+# Missed frames over the whole continuous recording, added up from the
+# counts of each trial
+total = CaptureStats()
 while len(trials) < SUCCESSES:    
     
-    frame_clock = pygame.time.Clock()
-    controller = Leap.Controller()
-    listener = TapListener()
-    
-    while controller.frame().interaction_box.width == 0:
-        pass
-    box = controller.frame().interaction_box
+    if not set_up:
+        set_up = True
+        frame_clock = pygame.time.Clock()
+        if daemon:
+            client = daemon.client()
+            box = client.box
+        else:
+            controller = Leap.Controller()
+            listener = TapListener()
+
+            box = wait_for_device(controller).interaction_box
+            # Recording runs from device ready on, so the trial starts with
+            # the frames from just before the finger crossed the line
+            controller.add_listener(listener)
+        w = box.width
+        h = box.height
+        
+        screen_size = (int(w+2*BUFF),int(h+2*BUFF))
+        screen = pygame.display.set_mode(screen_size)
+        pygame.display.set_caption("Visual Feedback")
+        guides = StaticLayer(screen_size, draw_guides, WHITE)
     running = True
-    counter = 0
-    past_down = False
     first = True
     ready = False
     start = 0
-    frame = controller.frame()
-    box = frame.interaction_box
-    w = box.width
-    h = box.height
-    
-    screen_size = (int(w+2*BUFF),int(h+2*BUFF))
-    screen = pygame.display.set_mode(screen_size)
-    pygame.display.set_caption("Visual Feedback")
+    # Counts taps between the two blue lines, converted from screen pixels
+    # to Leap millimeters (one pixel per millimeter)
+    taps = TapCounter(box.center[1] + h/2 + BUFF - TOP_LINE,
+                      box.center[1] + h/2 + BUFF - BOT_LINE)
     screen.fill(WHITE)
     while running:
         for event in pygame.event.get(): 
             if event.type == pygame.QUIT:
-                controller.remove_listener(listener)
+                if daemon:
+                    daemon.stop()
+                else:
+                    controller.remove_listener(listener)
                 pygame.quit()
-                exit()
-        frame = controller.frame()
-
-        screen.fill(WHITE)
-        pygame.draw.rect(screen, RED, (BUFF,BUFF,w,h), STROKE)
-        pygame.draw.line(screen, BLACK, (BUFF+w/2-10, BUFF+h/2),(BUFF+w/2+10, BUFF+h/2))
-        pygame.draw.line(screen, BLACK, (BUFF+w/2, BUFF+h/2-10),(BUFF+w/2, BUFF+h/2+10))
-        pygame.draw.line(screen, BLUE, (BUFF, TOP_LINE),(BUFF+w, TOP_LINE))
-        pygame.draw.line(screen, BLUE, (BUFF, BOT_LINE),(BUFF+w, BOT_LINE))
-        
-        # Writing text on the screen is surprisingly complex
-        font = pygame.font.Font(None, FONT_SIZE)
-        text = font.render("Trial #"+str(len(trials)+1)+", taps: " + str(counter), 1, BLACK)
-        textpos = text.get_rect()
-        textpos.center = (int(BUFF +w/2),int(BUFF/2))
-        screen.blit(text, textpos)
-        if len(frame.fingers) > 0:
-            finger = frame.fingers[0]
-            pos = finger.tip_position
-    
+                sys.exit()
+        if daemon:
+            pos = fingertip(client.latest())
+        else:
+            frame = controller.frame()
+            pos = frame.fingers[0].tip_position if len(frame.fingers) else None
+
+        guides.blit(screen, w, h)
+        text.blit(screen, "Trial #"+str(len(trials)+1)+", taps: " + str(taps.count),
+                  (BUFF+w/2, BUFF/2), BLACK, FONT_SIZE)
+        if pos is not None:
             x = pos[0]
             y = pos[1]
             z = pos[2]
@@ -130,16 +202,25 @@ while len(trials) < SUCCESSES:
     
             if BUFF+h/2-yc > BOT_LINE and ready:
                 ready = False
-                start = clock()
-                print "Reading data. . ."
-                controller.add_listener(listener)
-            if BUFF+h/2-yc > BOT_LINE and not first and not past_down:
-                past_down = True
-                counter +=1
-            if BUFF+h/2-yc < TOP_LINE and past_down:
-                past_down = False
-            if start > 0 and clock() - start > DEFAULT_TIMER:
+                start = now()
+                print("Reading data. . .")
+                if CONTINUOUS:
+                    events.log(segment.START, start, trial=len(trials) + 1)
+                counts = client if daemon else listener
+                if recording:
+                    total.extend(counts.capture)
+                elif daemon:
+                    client.reset()
+                    client.rewind(PRE_TRIGGER)
+                else:
+                    listener.data.trigger()
+                counts.capture = CaptureStats() # Missed during this trial
+                recording = CONTINUOUS
+            taps.update(now(), y)
+            if start > 0 and now() - start > DEFAULT_TIMER:
                 break
+        if recording and daemon:
+            recorded.append(client.read()) # Keep the ring from wrapping
                 
     
     
@@ -147,37 +228,68 @@ while len(trials) < SUCCESSES:
             
         frame_clock.tick(60)
 
-    controller.remove_listener(listener)
+    counter = taps.count
+    if CONTINUOUS:
+        # Cut out of the recording once every trial is done
+        events.log(segment.END, trial=len(trials) + 1, taps=counter)
+        capture, data = client.capture if daemon else listener.capture, None
+    elif daemon:
+        records = client.read()
+        capture, data = client.capture, daemon_rows(records, start)
+    else:
+        controller.remove_listener(listener)
+        capture = listener.capture
+        data = [[row[0] - start] + row[1:] for row in listener.data.trial()]
+    if not (CONTINUOUS or daemon):
+        set_up = False # Set up again for the next trial
 
+    print("Trial", len(trials) + 1, "capture:", capture.summary_line())
     msg = "Finished trial"
     for trial in trials:
         if abs(counter - trial) > MARGIN:
             msg += " unsuccessfully. Starting over"
             trials = []
             datalog = []
+            if CONTINUOUS:
+                events.log(segment.RESTART, start)
             break
     trials.append(counter)
-    datalog.append(listener.data)
-    msgbox(msg)
+    datalog.append(data)
+    # The daemon keeps recording while the dialog is open, which may be for
+    # longer than its ring holds
+    drain = RingDrain(client) if recording and daemon else None
+    nml.message_box(msg)
+    if drain:
+        recorded.extend(drain.close())
 # If filename has previously been used, append a number to it
 
+if CONTINUOUS:
+    if daemon:
+        rows = daemon_rows(np.concatenate(recorded), 0.0)
+    else:
+        controller.remove_listener(listener)
+        rows = listener.data.trial()
+    total.extend(counts.capture)
+    # The whole recording is kept, so the trials can be cut again with
+    # other rules by segment.py
+    recording = segment.to_array(rows)
+    segment.save_recording(DEFAULT_FILENAME + "_" + run_timestamp +
+                           segment.SUFFIX + EXTENSION, recording,
+                           events.events, upper=taps.upper, lower=taps.lower,
+                           pre_trigger=PRE_TRIGGER,
+                           hand=HAND if daemon else listener.fingers.hand,
+                           capture=total.summary_line())
+    kept = segment.trials(events.events)
+    cuts = segment.segment(recording[:, 0], [trial[0] for trial in kept],
+                           [trial[1] for trial in kept], pre=PRE_TRIGGER)
+    datalog = [segment.to_rows(recording[a:b], trial[0])
+               for a, b, trial in zip(cuts[0], cuts[1], kept)]
 for i in range(len(datalog)):
     filename = DEFAULT_FILENAME+"_"+run_timestamp+"_"+ str(i+1) +".csv"
-    writeFile = open(filename, 'w')
-    writeFile.write ('Position Data for Tapping Exercise, Total Taps:,' + str(trials[i]) + '\n' + \
-                 'Time (s),' + \
-                 'Finger 1,,,' + \
-                 'Finger 2,,,' + \
-                 'Finger 3,,,' + \
-                 'Finger 4,,,' + \
-                 'Finger 5\n' + \
-                 ',x,y,z,x,y,z,x,y,z,x,y,z,x,y,z\n')
 # Write the gathered data to file
-    for row in datalog[i]:
-        for element in row:
-            writeFile.write(str(element) + ',')
-        writeFile.write('\n')
-    writeFile.close()  
+    segment.write_trial(filename, datalog[i], trials[i])
+if daemon:
+    daemon.stop()
 pygame.quit()
  
 
@@ -0,0 +1,438 @@
+"""Neuromechanics Lab Acquisition Events
+
+Lets the main thread of a logger sleep while the Leap listener thread does
+the work. The listener signals "device ready", "hand positioned" and "timer
+elapsed" through threading events instead of the main thread spinning on a
+global flag, which pinned a core and fought the callback thread for the
+interpreter lock right when frames were being captured.
+
+CaptureStats follows the device frame ids and timestamps the listener sees,
+so frames lost while the callback fell behind show up as gaps in the ids
+rather than going unnoticed. CatchUpReader fills most of those gaps: the
+Leap only calls on_frame for the newest frame when a callback runs late,
+but keeps the frames in between in its history, so they can still be
+recorded in order.
+
+Run this file directly to measure callback jitter with and without a spin
+loop on the main thread, and frames recovered from the history when
+callbacks are delayed.
+"""
+
+import threading
+import nml
+from timing import ClockSync
+
+try:
+    from Leap import Listener
+except ImportError:
+    # Lets the module be used headless, without the Leap SDK installed
+    Listener = object
+
+# Frames the Leap SDK keeps for controller.frame(n)
+HISTORY_FRAMES = 60
+
+
+class CaptureStats(object):
+    """Running gap statistics over the frames of one trial, updated with
+    constant work per frame from the listener thread.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forgets every frame seen so far, ready for a new trial."""
+        self.frames = 0
+        self.missed = 0
+        self.repeated = 0
+        self.max_gap = 0 # microseconds
+        self.first_id = None
+        self.last_id = None
+        self.first_time = None
+        self.last_time = None
+
+    def update(self, frame_id, timestamp):
+        """Notes a frame handed to the listener. Returns False if it isn't
+        newer than the last frame seen, which should then not be recorded.
+
+        Keyword arguments:
+        frame_id -- frame.id, which the device increases by one every frame
+        timestamp -- frame.timestamp, device time in microseconds
+        """
+        if self.last_id is None:
+            self.first_id = frame_id
+            self.first_time = timestamp
+        else:
+            step = frame_id - self.last_id
+            if step <= 0:
+                self.repeated += 1
+                return False
+            self.missed += step - 1
+            if timestamp - self.last_time > self.max_gap:
+                self.max_gap = timestamp - self.last_time
+        self.last_id = frame_id
+        self.last_time = timestamp
+        self.frames += 1
+        return True
+
+    def extend(self, later):
+        """Adds the frames counted by another CaptureStats that started
+        after this one stopped, as if this one had seen them all.
+
+        Keyword argument:
+        later -- CaptureStats whose first frame came after this one's last
+        """
+        if later.last_id is None:
+            return
+        if self.last_id is None:
+            self.first_id = later.first_id
+            self.first_time = later.first_time
+        else:
+            self.missed += later.first_id - self.last_id - 1
+            self.max_gap = max(self.max_gap,
+                               later.first_time - self.last_time)
+        self.frames += later.frames
+        self.missed += later.missed
+        self.repeated += later.repeated
+        self.max_gap = max(self.max_gap, later.max_gap)
+        self.last_id = later.last_id
+        self.last_time = later.last_time
+
+    def summary(self):
+        """Returns the statistics as a dictionary of plain numbers, ready to
+        be stored in a session header.
+        """
+        duration = 0.0
+        if self.frames > 1:
+            duration = (self.last_time - self.first_time) / 1e6
+        return {'frames': self.frames,
+                'missed_frames': self.missed,
+                'repeated_frames': self.repeated,
+                'first_frame_id': self.first_id,
+                'last_frame_id': self.last_id,
+                'max_gap_ms': self.max_gap / 1e3,
+                'duration_s': duration,
+                'effective_rate_hz': (self.frames - 1) / duration
+                                     if duration else 0.0,
+                'device_rate_hz': (self.last_id - self.first_id) / duration
+                                  if duration else 0.0}
+
+    def summary_line(self):
+        """Returns a one line description of the statistics for the
+        console.
+        """
+        s = self.summary()
+        seen = s['frames'] + s['missed_frames']
+        return '%d frames, %d missed (%.1f%%), largest gap %.1f ms, ' \
+               '%.1f Hz recorded of %.1f Hz from the device' % \
+               (s['frames'], s['missed_frames'],
+                100.0 * s['missed_frames'] / seen if seen else 0.0,
+                s['max_gap_ms'], s['effective_rate_hz'], s['device_rate_hz'])
+
+
+class Acquisition(object):
+    """Events shared between a Leap listener and the thread waiting on it."""
+
+    def __init__(self):
+        self.device_ready = threading.Event()
+        self.hand_positioned = threading.Event()
+        self.timer_elapsed = threading.Event()
+        self.capture = CaptureStats()
+        self.sync = ClockSync() # Host time each frame was captured
+        self.reader = CatchUpReader() # Frames the callback fell behind on
+        self._timer = None
+
+    def check_device(self, frame):
+        """Signals device_ready once the Leap reports a usable interaction
+        box. Called from the listener thread.
+
+        Keyword argument:
+        frame -- the most recent frame of Leap data
+        """
+        if not self.device_ready.is_set() and frame.interaction_box.width != 0:
+            self.device_ready.set()
+
+    def check_hand(self, frame):
+        """Signals hand_positioned once a single hand is clearly visible in
+        the interaction box. Called from the listener thread.
+
+        Keyword argument:
+        frame -- the most recent frame of Leap data
+        """
+        if len(frame.hands) == 1 and \
+           nml.is_in_interaction_box(frame, frame.hands[0].palm_position):
+            self.hand_positioned.set()
+
+    def record_frame(self, frame):
+        """Adds a frame to the capture statistics. Returns False if the
+        frame was already seen. Called from the listener thread.
+
+        Keyword argument:
+        frame -- the most recent frame of Leap data
+        """
+        return self.capture.update(frame.id, frame.timestamp)
+
+    def restart_counts(self):
+        """Counts missed and read-back frames again from the next frame, so
+        the statistics cover the trial rather than the wait before it.
+        """
+        self.capture = CaptureStats() # Taken up by the listener's next frame
+        self.reader.recovered = 0
+        self.reader.lost = 0
+
+    def start_timer(self, seconds):
+        """Signals timer_elapsed after the given number of seconds.
+
+        Keyword argument:
+        seconds -- length of the trial
+        """
+        self.timer_elapsed.clear()
+        self._timer = threading.Timer(seconds, self.timer_elapsed.set)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def cancel(self):
+        """Stops a running timer and wakes anything waiting on it."""
+        if self._timer:
+            self._timer.cancel()
+        self.timer_elapsed.set()
+
+    def wait_device_ready(self, timeout=None):
+        """Sleeps until the Leap is ready. Returns False on timeout."""
+        return self.device_ready.wait(timeout)
+
+    def wait_hand_positioned(self, timeout=None):
+        """Sleeps until the hand is in position. Returns False on timeout."""
+        return self.hand_positioned.wait(timeout)
+
+    def wait_timer(self, timeout=None):
+        """Sleeps until the trial timer runs out. Returns False on timeout."""
+        return self.timer_elapsed.wait(timeout)
+
+
+class ReadyListener(Listener):
+    """Listener that does nothing but signal device_ready, for programs that
+    poll controller.frame() themselves.
+    """
+
+    def __init__(self, acquisition):
+        Listener.__init__(self)
+        self.acquisition = acquisition
+
+    def on_frame(self, controller):
+        self.acquisition.check_device(controller.frame())
+
+class CatchUpReader(object):
+    """Returns every frame since the last one a listener processed, oldest
+    first, instead of only controller.frame(). Frames that dropped out of
+    the history before the callback came round are counted as lost.
+    """
+
+    def __init__(self, history=HISTORY_FRAMES):
+        """Keyword argument:
+        history (optional) -- frames the controller keeps
+        """
+        self.history = history
+        self.reset()
+
+    def reset(self):
+        """Starts again from the next frame, as at the start of a trial."""
+        self.last_id = None
+        self.recovered = 0 # Frames read from the history
+        self.lost = 0 # Frames already gone from the history
+
+    def frames(self, controller, latest=None):
+        """Returns the frames not yet returned, oldest first, ending with
+        controller.frame(). Returns an empty list if there is nothing new.
+        Called from the listener thread.
+
+        Keyword arguments:
+        controller -- Leap controller object the listener was added to
+        latest (optional) -- controller.frame(), if the listener already
+                             has it
+        """
+        if latest is None:
+            latest = controller.frame()
+        last_id = self.last_id
+        if last_id is not None and latest.id <= last_id:
+            return []
+        frames = [latest]
+        if last_id is not None and latest.id - last_id > 1:
+            # Newer frames arriving during the walk only shift the history
+            # back, which repeats a frame but never skips one
+            for n in range(1, self.history):
+                frame = controller.frame(n)
+                if not frame.is_valid or frame.id <= last_id:
+                    break
+                if frame.id < frames[-1].id:
+                    frames.append(frame)
+            frames.reverse()
+            self.recovered += len(frames) - 1
+            self.lost += latest.id - last_id - len(frames)
+        self.last_id = latest.id
+        return frames
+
+
+def wait_for_device(controller, timeout=None):
+    """Blocks without spinning until the controller reports a usable
+    interaction box. Returns the latest frame, whose interaction box may still
+    be empty if the timeout ran out.
+
+    Keyword arguments:
+    controller -- instance of Leap.Controller
+    timeout (optional) -- seconds to wait before giving up, None for forever
+    """
+    acquisition = Acquisition()
+    # The device may already be connected, in which case no listener is needed
+    acquisition.check_device(controller.frame())
+    if not acquisition.device_ready.is_set():
+        listener = ReadyListener(acquisition)
+        controller.add_listener(listener)
+        acquisition.wait_device_ready(timeout)
+        controller.remove_listener(listener)
+    return controller.frame()
+
+
+def _benchmark(rate=200, seconds=3.0, work=40):
+    """Fires on_frame from a timer thread the way the Leap service does and
+    prints callback jitter while the main thread either spins on a flag or
+    sleeps on an Event.
+
+    Keyword arguments:
+    rate (optional) -- frames per second emitted by the fake controller
+    seconds (optional) -- length of each run
+    work (optional) -- loop iterations of Python work done per callback
+    """
+    import time
+    import numpy as np
+    from timeit import default_timer
+
+    class FakeBox(object):
+        width = 235.0
+
+    class FakeFrame(object):
+        interaction_box = FakeBox()
+        hands = []
+
+    class FakeController(object):
+        """Emits frames to a single listener from its own thread."""
+
+        def __init__(self):
+            self._frame = FakeFrame()
+            self.arrivals = []
+
+        def frame(self):
+            return self._frame
+
+        def add_listener(self, listener):
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(listener,))
+            self._thread.daemon = True
+            self._thread.start()
+
+        def remove_listener(self, listener):
+            self._stop.set()
+            self._thread.join()
+
+        def _run(self, listener):
+            period = 1.0 / rate
+            due = default_timer()
+            while not self._stop.is_set():
+                due += period
+                wait = due - default_timer()
+                if wait > 0:
+                    time.sleep(wait)
+                # Lateness of the callback against the device schedule
+                self.arrivals.append(default_timer() - due)
+                listener.on_frame(self)
+
+    class WorkListener(object):
+        def on_frame(self, controller):
+            controller.frame()
+            total = 0
+            for n in range(work):
+                total += n
+
+    def run(name, spin):
+        controller = FakeController()
+        acquisition = Acquisition()
+        controller.add_listener(WorkListener())
+        acquisition.start_timer(seconds)
+        if spin:
+            start = default_timer()
+            while default_timer() - start < seconds:
+                pass
+        else:
+            acquisition.wait_timer()
+        controller.remove_listener(None)
+        late = np.array(controller.arrivals) * 1e3
+        print('%-12s late p50 %6.3f  p99 %7.3f  max %7.3f ms  (%d frames)' %
+              ((name,) + tuple(np.percentile(late, [50, 99])) +
+               (late.max(), len(late))))
+
+    print('Callback lateness at %d Hz for %.1f s' % (rate, seconds))
+    run('spin loop', True)
+    run('Event wait', False)
+
+
+def _catch_up_benchmark(rate=200, seconds=2.0,
+                        delays=(0.0, 2.0, 5.0, 10.0, 20.0, 50.0)):
+    """Drives listeners that sleep in on_frame with the simulated
+    controller, once reading only controller.frame() and once reading
+    through a CatchUpReader, and prints how many of the frames the device
+    made each one recorded.
+
+    Keyword arguments:
+    rate (optional) -- frames per second from the controller
+    seconds (optional) -- length of each run
+    delays (optional) -- milliseconds slept per callback
+    """
+    import time
+    import fakeleap
+
+    class DelayListener(fakeleap.Listener):
+        def __init__(self, delay, catch_up):
+            fakeleap.Listener.__init__(self)
+            self.delay = delay
+            self.reader = CatchUpReader() if catch_up else None
+            self.capture = CaptureStats()
+
+        def on_frame(self, controller):
+            if self.reader:
+                frames = self.reader.frames(controller)
+            else:
+                frames = [controller.frame()]
+            for frame in frames:
+                self.capture.update(frame.id, frame.timestamp)
+            # Work that makes the callback fall behind, with a long stall
+            # every second
+            if self.capture.frames % rate < len(frames):
+                time.sleep(0.4)
+            else:
+                time.sleep(self.delay)
+
+    print('Frames recorded at %d Hz over %.1f s, with a 400 ms stall every '
+          'second; the history holds %d frames' %
+          (rate, seconds, HISTORY_FRAMES))
+    for delay in delays:
+        results = []
+        for catch_up in (False, True):
+            controller = fakeleap.Controller(fakeleap.TremorMotion(), rate)
+            listener = DelayListener(delay / 1e3, catch_up)
+            controller.add_listener(listener)
+            time.sleep(seconds)
+            controller.remove_listener(listener)
+            controller.stop()
+            stats = listener.capture.summary()
+            made = stats['last_frame_id'] - stats['first_frame_id'] + 1
+            results.append((stats['frames'], made))
+        print('    %4.0f ms per callback: frame() only %4d of %4d (%5.1f%%)'
+              '   catch-up %4d of %4d (%5.1f%%)' %
+              (delay, results[0][0], results[0][1],
+               100.0 * results[0][0] / results[0][1], results[1][0],
+               results[1][1], 100.0 * results[1][0] / results[1][1]))
+
+
+if __name__ == "__main__":
+    _benchmark()
+    _catch_up_benchmark()
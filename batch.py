@@ -0,0 +1,447 @@
+"""Neuromechanics Lab Batch Analysis
+
+Analyzes every session in the data folder in one go, instead of opening the
+files one at a time in MATLAB. Sessions are found by the names the task
+programs give them:
+
+    tapping_<timestamp>_<n>.csv                   Tapping_0.4.py
+    clock_<timestamp>.csv                         ClockGame_1.1.py
+    corners_<name>_<timestamp>_<hand><trial>.csv  CornersGame
+    postural_data<n>.csv                          Postural_1.1.py
+
+Files are parsed and analyzed in a pool of processes: tap counts and rates
+for Tapping, the palm tremor spectrum for Postural, movement times between
+targets for CornersGame and the length of the fingertip's path for the
+Clock Game, whose files don't record the targets. Results are cached per
+file in CACHE_NAME inside the folder, keyed by size and modification time
+and then by a hash of the contents, so a rerun only analyzes files that are
+new or have changed. One summary table with a row per session is written as
+CSV.
+
+Usage:
+    python batch.py [folder] [--jobs N] [--output FILE] [--no-cache]
+    python batch.py --benchmark [--sessions N]
+"""
+
+import argparse, hashlib, json, multiprocessing, os, re
+from timeit import default_timer
+import numpy as np
+
+import session, tremor
+from paths import CORNER_NAMES
+from taps import count_taps
+
+# Where the task programs write their data
+DATA_FOLDER = os.path.join('..', 'data')
+CACHE_NAME = '.batch_cache.json'
+SUMMARY_NAME = 'summary.csv'
+# Cached results from another version of the analyses are redone
+ANALYSIS_VERSION = 1
+# Distance between the two Tapping lines, one pixel per millimeter
+TAP_GAP = 50.0 # mm
+
+# Task and file name pattern of every kind of session
+NAME_PATTERNS = (
+    ('tapping', re.compile(r'^tapping_(?P<timestamp>\d+)_(?P<trial>\d+)'
+                           r'\.csv$')),
+    ('clock', re.compile(r'^clock_(?P<timestamp>\d+)\.csv$')),
+    ('corners', re.compile(r'^corners_(?P<subject>.+)_(?P<timestamp>\d+)_'
+                           r'(?P<hand>[A-Za-z]+)(?P<trial>\d+)\.csv$')),
+    ('postural', re.compile(r'^postural_data(?P<trial>\d*)\.csv$')),
+)
+
+SUMMARY_COLUMNS = ('file', 'task', 'subject', 'hand', 'trial', 'timestamp',
+                   'frames', 'duration_s', 'taps_recorded', 'taps_counted',
+                   'tap_rate_hz', 'peak_hz', 'band_power', 'path_length_mm',
+                   'paths', 'mean_path_s', 'slowest_path', 'error')
+
+
+def discover(folder):
+    """Returns a (file name, task, name fields) tuple for every session in
+    a folder, sorted by file name.
+
+    Keyword argument:
+    folder -- folder holding the session files
+    """
+    sessions = []
+    for name in sorted(os.listdir(folder)):
+        for task, pattern in NAME_PATTERNS:
+            found = pattern.match(name)
+            if found:
+                sessions.append((name, task, found.groupdict()))
+                break
+    return sessions
+
+
+def file_hash(filename):
+    """Returns the SHA-1 hex digest of a file's contents."""
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _finger_path(data, columns):
+    """Returns the xyz columns of the finger slot seen in the most frames."""
+    first = columns.index(session.FINGER_COLUMNS[0])
+    tips = data[:, first:first + len(session.FINGER_COLUMNS)]
+    seen = np.sum(~np.isnan(tips[:, ::3]), axis=0)
+    slot = int(np.argmax(seen))
+    return tips[:, 3 * slot:3 * slot + 3]
+
+
+def _path_length(xyz):
+    """Returns the distance travelled along the visible samples."""
+    xyz = xyz[~np.isnan(xyz).any(axis=1)]
+    if len(xyz) < 2:
+        return 0.0
+    return float(np.sqrt((np.diff(xyz, axis=0) ** 2).sum(axis=1)).sum())
+
+
+def analyze_tapping(header, data):
+    """Recounts the taps of a Tapping trial with lines TAP_GAP apart around
+    the middle of the finger's travel.
+    """
+    columns = list(header['columns'])
+    t = data[:, columns.index('time')]
+    y = _finger_path(data, columns)[:, 1]
+    visible = ~np.isnan(y)
+    result = {'taps_recorded': header.get('taps')}
+    if visible.any():
+        middle = float(np.median(y[visible]))
+        counted = count_taps(t[visible], y[visible], middle + TAP_GAP / 2,
+                             middle - TAP_GAP / 2)
+        duration = t[-1] - t[0]
+        result.update(taps_counted=counted,
+                      tap_rate_hz=counted / duration if duration > 0 else None)
+    return result
+
+
+def analyze_postural(header, data):
+    """Finds the peak frequency and tremor band power of the palm, summed
+    over its three axes, as tremor.py does for each channel.
+    """
+    columns = list(header['columns'])
+    t = data[:, columns.index('time')]
+    first = columns.index('palm_x')
+    palm = data[:, first:first + 3]
+    keep = ~np.isnan(t) & ~np.isnan(palm).any(axis=1)
+    if keep.sum() < 2:
+        return {}
+    grid, palm, fs = tremor.resample(t[keep], palm[keep])
+    freqs, psd = tremor.welch(palm, fs)
+    peak, power = tremor.band_metrics(freqs, psd.sum(axis=1)[:, np.newaxis])
+    return {'peak_hz': float(peak[0]), 'band_power': float(power[0])}
+
+
+def analyze_clock(header, data):
+    """Measures the path of the pointing finger. Clock Game files hold no
+    targets, so there are no movement times to report.
+    """
+    columns = list(header['columns'])
+    return {'path_length_mm': _path_length(_finger_path(data, columns))}
+
+
+def analyze_corners(header, data):
+    """Times each move between targets: from one target being shown to the
+    next, named as in paths.py.
+    """
+    columns = list(header['columns'])
+    result = {'path_length_mm': _path_length(_finger_path(data, columns))}
+    target = data[:, columns.index('target')]
+    t = data[:, columns.index('time_ms')] / 1000.0
+    known = ~np.isnan(target)
+    target, t = target[known].astype(int), t[known]
+    changes = np.nonzero(target[1:] != target[:-1])[0] + 1
+    if len(changes) < 2:
+        return result
+    # A move starts when its target appears and ends when the next one does
+    times = np.diff(t[changes])
+    moves = zip(target[changes[:-1] - 1], target[changes[:-1]])
+    names = [CORNER_NAMES[a] + '-' + CORNER_NAMES[b] for a, b in moves]
+    means = dict((name, float(np.mean([time for n, time in zip(names, times)
+                                       if n == name])))
+                 for name in set(names))
+    result.update(paths=len(times), mean_path_s=float(times.mean()),
+                  slowest_path=max(means, key=means.get))
+    return result
+
+
+ANALYSES = {'tapping': analyze_tapping, 'postural': analyze_postural,
+            'clock': analyze_clock, 'corners': analyze_corners}
+
+
+def analyze_file(job):
+    """Analyzes one session in a worker process. Returns the file name, its
+    hash and the result dictionary, or None for the result when the hash
+    matches the cached one.
+
+    Keyword argument:
+    job -- (folder, file name, task, name fields, cached hash or None)
+    """
+    folder, name, task, fields, cached = job
+    filename = os.path.join(folder, name)
+    digest = file_hash(filename)
+    if digest == cached:
+        return name, digest, None
+    result = dict(fields, file=name, task=task)
+    try:
+        header, data = session.read_csv(filename)
+        columns = list(header['columns'])
+        time = data[:, 0] / (1000.0 if columns[0] == 'time_ms' else 1.0)
+        result.update(frames=len(data),
+                      duration_s=float(time[-1] - time[0]) if len(data)
+                      else 0.0)
+        for key in ('subject', 'hand'):
+            if header.get(key) and not result.get(key):
+                result[key] = header[key]
+        result.update(ANALYSES[task](header, data))
+    except Exception as e:
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+    return name, digest, result
+
+
+def load_cache(filename):
+    """Returns the cached results in a file, an empty dictionary if there
+    are none or they came from another ANALYSIS_VERSION.
+    """
+    try:
+        with open(filename) as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    if cache.get('version') != ANALYSIS_VERSION:
+        return {}
+    return cache.get('files', {})
+
+
+def save_cache(filename, files):
+    """Writes the cached results of every file."""
+    with open(filename, 'w') as f:
+        json.dump({'version': ANALYSIS_VERSION, 'files': files}, f)
+
+
+def write_summary(filename, results):
+    """Writes one row per session, sorted by task and file name.
+
+    Keyword arguments:
+    filename -- path of the CSV file
+    results -- result dictionaries from analyze_file
+    """
+    def cell(value):
+        if value is None:
+            return ''
+        if isinstance(value, float):
+            return '%.6g' % value
+        return str(value).replace(',', ';')
+
+    rows = sorted(results, key=lambda r: (r['task'], r['file']))
+    with open(filename, 'w') as f:
+        f.write(','.join(SUMMARY_COLUMNS) + '\n')
+        for result in rows:
+            f.write(','.join(cell(result.get(column))
+                             for column in SUMMARY_COLUMNS) + '\n')
+
+
+def run(folder, jobs=None, output=None, use_cache=True):
+    """Analyzes every session in a folder and writes the summary table.
+    Returns the results, sorted by file name, and the number of files that
+    were analyzed rather than taken from the cache.
+
+    Keyword arguments:
+    folder -- folder holding the session files
+    jobs (optional) -- worker processes, one per CPU by default
+    output (optional) -- path of the summary table, SUMMARY_NAME in the
+                         folder by default; '' to skip writing it
+    use_cache (optional) -- False to analyze every file again
+    """
+    jobs = jobs or multiprocessing.cpu_count()
+    cache_file = os.path.join(folder, CACHE_NAME)
+    cache = load_cache(cache_file) if use_cache else {}
+    files = {}
+    todo = []
+    for name, task, fields in discover(folder):
+        stat = os.stat(os.path.join(folder, name))
+        entry = cache.get(name)
+        if entry and entry['size'] == stat.st_size and \
+           entry['mtime'] == stat.st_mtime:
+            files[name] = entry
+        else:
+            files[name] = {'size': stat.st_size, 'mtime': stat.st_mtime}
+            todo.append((folder, name, task, fields,
+                         entry['hash'] if entry else None))
+
+    if jobs > 1 and len(todo) > 1:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            done = pool.imap_unordered(analyze_file, todo,
+                                       max(1, len(todo) // (8 * jobs)))
+            done = list(done)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        done = [analyze_file(job) for job in todo]
+
+    analyzed = 0
+    for name, digest, result in done:
+        if result is None:
+            # Touched but not changed: keep the cached result
+            result = cache[name]['result']
+        else:
+            analyzed += 1
+        files[name].update(hash=digest, result=result)
+    if use_cache:
+        save_cache(cache_file, files)
+    results = [files[name]['result'] for name in sorted(files)]
+    if output is None:
+        output = os.path.join(folder, SUMMARY_NAME)
+    if output:
+        write_summary(output, results)
+    return results, analyzed
+
+
+def _make_corpus(folder, sessions, first=0, seconds=4.0, rate=200.0):
+    """Writes synthetic sessions of every task, named as the programs name
+    them, in equal numbers.
+
+    Keyword arguments:
+    folder -- folder to write them to
+    sessions -- number of sessions
+    first (optional) -- number of the first session, also the random seed
+    seconds (optional) -- length of each session
+    rate (optional) -- frame rate
+    """
+    rng = np.random.RandomState(first)
+    frames = int(seconds * rate)
+    t = np.arange(frames) / rate
+    nan = np.full((frames, 3), np.nan)
+    finger_header = ',x,y,z' * 5 + '\n'
+
+    def write(name, header, data):
+        with open(os.path.join(folder, name), 'w') as f:
+            f.write(header)
+            np.savetxt(f, data, fmt='%.5g', delimiter=',')
+
+    for n in range(first, first + sessions):
+        stamp = '%d%02d%02d%02d%02d%02d' % (2014 + n // 10000, 1 + n % 12,
+                                             1 + n % 28, n % 24, n % 60,
+                                             n // 60 % 60)
+        task = ('tapping', 'postural', 'clock', 'corners')[n % 4]
+        tip = np.column_stack((rng.normal(0, 1, frames),
+                               200 + rng.normal(0, 1, frames),
+                               rng.normal(0, 1, frames)))
+        if task == 'tapping':
+            tip[:, 1] += 40 * np.cos(2 * np.pi * rng.uniform(2, 5) * t)
+            write('tapping_%s_%d.csv' % (stamp, n % 5 + 1),
+                  'Position Data for Tapping Exercise, Total Taps:,0\n'
+                  'Time (s),Thumb,,,Index,,,Middle,,,Ring,,,Pinky\n' +
+                  finger_header,
+                  np.column_stack((t, nan, tip, nan, nan, nan)))
+        elif task == 'postural':
+            palm = rng.normal(0, 0.2, (frames, 3)) + np.sin(
+                2 * np.pi * rng.uniform(4, 10) * t)[:, np.newaxis]
+            palm[:, 1] += 200
+            write('postural_data%d.csv' % n,
+                  'Postural Tremor Data for One Hand\n\n\n',
+                  np.column_stack([t, palm, np.zeros((frames, 6))] +
+                                  [palm + 20 * f for f in range(5)]))
+        elif task == 'clock':
+            write('clock_%s.csv' % stamp,
+                  'Time (ms),Position Data for Clock Game(mm)\n,x,y,z\n',
+                  np.column_stack((1000 * t, tip)))
+        else:
+            # A new target about every 0.8 s
+            target = np.cumsum(rng.rand(frames) < 1.0 / (0.8 * rate)) % 4
+            lines = ['%.5g,%s,%.5g,%.5g,%.5g,%.5g,\n' %
+                     (1000 * t[i], CORNER_NAMES[target[i]], 10.0,
+                      tip[i, 0], tip[i, 1], tip[i, 2]) for i in range(frames)]
+            with open(os.path.join(folder, 'corners_subject%d_%s_Right%d.csv' %
+                                   (n, stamp, n % 2 + 1)), 'w') as f:
+                f.write('Subject:,subject%d,Hand:,Right,Date:,01/02/2014\n'
+                        'Time (ms),Target,Speed (mm/s),Position (mm)\n'
+                        ',,,x,y,z\n' % n)
+                f.writelines(lines)
+
+
+def _benchmark(sessions=2000):
+    """Writes a synthetic corpus and times a full analysis with 1 worker
+    and with every power of two up to the CPU count (at least 4), then a
+    rerun from the cache and a rerun after adding a few sessions.
+
+    Keyword argument:
+    sessions (optional) -- sessions in the corpus
+    """
+    import shutil, tempfile
+    folder = tempfile.mkdtemp()
+    try:
+        start = default_timer()
+        _make_corpus(folder, sessions)
+        size = sum(os.path.getsize(os.path.join(folder, name))
+                   for name in os.listdir(folder))
+        print('%d sessions, %.0f MB, written in %.1f s; %d CPUs' %
+              (sessions, size / 1e6, default_timer() - start,
+               multiprocessing.cpu_count()))
+        workers = [1]
+        while workers[-1] < max(4, multiprocessing.cpu_count()):
+            workers.append(workers[-1] * 2)
+        single = None
+        for jobs in workers:
+            start = default_timer()
+            results, analyzed = run(folder, jobs, '', use_cache=False)
+            elapsed = default_timer() - start
+            single = single or elapsed
+            print('    %2d workers: %6.2f s  (%.1f ms per session, '
+                  'speedup %.2fx)' % (jobs, elapsed, 1e3 * elapsed / sessions,
+                                      single / elapsed))
+        errors = [r for r in results if r.get('error')]
+        assert not errors, errors[0]
+
+        run(folder)
+        start = default_timer()
+        results, analyzed = run(folder)
+        print('    rerun from cache: %.2f s, %d analyzed' %
+              (default_timer() - start, analyzed))
+        _make_corpus(folder, 20, first=sessions)
+        start = default_timer()
+        results, analyzed = run(folder)
+        print('    rerun with new sessions added: %.2f s, %d analyzed' %
+              (default_timer() - start, analyzed))
+    finally:
+        shutil.rmtree(folder)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('folder', nargs='?', default=DATA_FOLDER)
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='worker processes, one per CPU by default')
+    parser.add_argument('--output', default=None,
+                        help='summary table, %s in the folder by default' %
+                             SUMMARY_NAME)
+    parser.add_argument('--no-cache', action='store_true',
+                        help='analyze every file again')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='time a synthetic corpus instead')
+    parser.add_argument('--sessions', type=int, default=2000,
+                        help='sessions in the benchmark corpus')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        _benchmark(args.sessions)
+        return
+    start = default_timer()
+    results, analyzed = run(args.folder, args.jobs, args.output,
+                            not args.no_cache)
+    errors = [r for r in results if r.get('error')]
+    print('%d sessions, %d analyzed, %d from the cache, %d errors in %.1f s' %
+          (len(results), analyzed, len(results) - analyzed, len(errors),
+           default_timer() - start))
+    for result in errors:
+        print('    %s: %s' % (result['file'], result['error']))
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,548 @@
+"""Neuromechanics Lab Capture Daemon
+
+Runs the Leap controller in a process of its own, so a slow redraw, a Tk
+dialog or CSV writing in a task program can no longer hold the interpreter
+lock while a frame is waiting to be captured. The daemon's listener copies
+each frame, including frames read back from the device history, into a ring
+of fixed-size records in shared memory. Task programs attach a
+CaptureClient to read the frames they haven't seen yet, or only the newest
+one for feedback.
+
+Each record is a row of float64: a sequence number, the frame id, the
+device timestamp, the host time the frame was captured and the host time
+the daemon received it, followed by the values nml.FrameExtractor fills in.
+There is one writer and any number of readers. The writer clears a slot's
+sequence number before changing it and sets it afterwards, so a reader that
+finds a different sequence number after copying a slot knows the writer
+lapped it and counts the frame as lost instead of returning a torn record.
+
+Needs Python 3.8 or later for multiprocessing.shared_memory; the task
+programs still run in-process without it. ClockGame always captures
+in-process: its cursor is where the finger points at the screen, which only
+a controller in the same process can work out from its located screens.
+
+Run this file directly to measure capture jitter with a CPU-heavy renderer
+in the same process as the listener and with the listener in the daemon.
+"""
+
+from __future__ import print_function
+import argparse, os, subprocess, sys, threading
+from collections import namedtuple
+from timeit import default_timer
+import numpy as np
+import nml
+from acquisition import CaptureStats, CatchUpReader, wait_for_device
+from timing import ClockSync, now_ns
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python 2 and 3.7 and older
+    shared_memory = None
+
+try:
+    from Leap import Listener
+except ImportError:
+    # The daemon is started before fakeleap is installed in its process
+    Listener = object
+
+# Frames the ring holds; 20 seconds at 200 fps. A reader that may stop for
+# longer, such as for a dialog, keeps a RingDrain reading meanwhile.
+RING_FRAMES = 4096
+# Seconds between reads of a RingDrain
+DRAIN_INTERVAL = 0.5
+
+# Printed by the daemon once frames are being written
+READY = 'capture ready'
+
+# Interaction box of the device, which doesn't change from frame to frame
+Box = namedtuple('Box', 'center width height depth')
+
+# Columns of a record, followed by the nml.FrameExtractor layout
+SEQUENCE = 0
+FRAME_ID = 1
+TIMESTAMP = 2 # device microseconds
+CAPTURED = 3 # host seconds, timing.now(), free of callback delay
+ARRIVED = 4 # host seconds the daemon received the frame
+VALUES = 5
+
+# Header fields, in int64 ahead of the records
+_HEAD = 0 # sequence number of the newest complete record, 0 if none
+_CAPACITY = 1
+_COLUMNS = 2
+_STOPPED = 3 # set once the daemon has removed its listener
+_BOX = 8 # float64 center xyz, width, height and depth of the device's box
+_HEADER = 16
+
+
+def _attach(name):
+    """Opens an existing shared memory block without making this process
+    responsible for removing it.
+    """
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Before Python 3.13 every process that opens a block registers it
+        # and removes it when it exits, even if another process created it
+        from multiprocessing import resource_tracker
+        block = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(block._name, 'shared_memory')
+        return block
+
+
+class FrameRing(object):
+    """Fixed-size frame records in a shared memory block."""
+
+    def __init__(self, name=None, capacity=RING_FRAMES,
+                 slots=nml.FINGER_SLOTS):
+        """Creates a ring, or attaches to an existing one when given its
+        name, in which case its capacity and layout are read from the block.
+
+        Keyword arguments:
+        name (optional) -- name of the block to attach to
+        capacity (optional) -- records held by a new ring
+        slots (optional) -- fingers per record of a new ring
+        """
+        if shared_memory is None:
+            raise RuntimeError("The capture daemon needs Python 3.8 or later")
+        self.owner = name is None
+        if self.owner:
+            columns = VALUES + nml.FINGER_START + slots * nml.FINGER_FIELDS
+            self._block = shared_memory.SharedMemory(
+                create=True, size=8 * (_HEADER + capacity * columns))
+        else:
+            self._block = _attach(name)
+        self.name = self._block.name
+        self.header = np.ndarray(_HEADER, np.int64, self._block.buf)
+        self._box = np.ndarray(6, np.float64, self._block.buf, 8 * _BOX)
+        if self.owner:
+            self.header[:] = 0
+            self._box[:] = 0.0
+            self.header[_CAPACITY] = capacity
+            self.header[_COLUMNS] = columns
+        self.capacity = int(self.header[_CAPACITY])
+        self.columns = int(self.header[_COLUMNS])
+        self.slots = (self.columns - VALUES - nml.FINGER_START) // \
+                     nml.FINGER_FIELDS
+        self.records = np.ndarray((self.capacity, self.columns), np.float64,
+                                  self._block.buf, 8 * _HEADER)
+        if self.owner:
+            self.records[:, SEQUENCE] = 0
+
+    @property
+    def head(self):
+        """Sequence number of the newest complete record, 0 if none."""
+        return int(self.header[_HEAD])
+
+    @property
+    def stopped(self):
+        return bool(self.header[_STOPPED])
+
+    @property
+    def box(self):
+        """Interaction box of the device, a Box with zero size until the
+        daemon has found the device ready.
+        """
+        values = self._box.tolist()
+        return Box(values[:3], *values[3:])
+
+    def set_box(self, box):
+        """Stores the device's interaction box for readers.
+
+        Keyword argument:
+        box -- Leap InteractionBox
+        """
+        self._box[:] = (box.center[0], box.center[1], box.center[2],
+                        box.width, box.height, box.depth)
+
+    def write(self, frame_id, timestamp, captured, arrived, values):
+        """Stores one frame as the next record. Only one thread of one
+        process may write to a ring.
+
+        Keyword arguments:
+        frame_id -- device frame id
+        timestamp -- device timestamp in microseconds
+        captured -- host time in seconds the frame was captured
+        arrived -- host time in seconds the frame was received
+        values -- frame values in the nml.FrameExtractor layout
+        """
+        sequence = int(self.header[_HEAD]) + 1
+        record = self.records[sequence % self.capacity]
+        record[SEQUENCE] = 0 # readers skip the slot while it changes
+        record[FRAME_ID:VALUES] = (frame_id, timestamp, captured, arrived)
+        record[VALUES:] = values
+        record[SEQUENCE] = sequence
+        self.header[_HEAD] = sequence
+
+    def close(self):
+        """Detaches from the ring, and removes it if this process created
+        it. Arrays taken from the ring must not be used afterwards.
+        """
+        self.header = self.records = self._box = None
+        self._block.close()
+        if self.owner:
+            self._block.unlink()
+
+
+class RingListener(Listener):
+    """Copies every frame, including those read back from the device
+    history, into a FrameRing.
+    """
+
+    def __init__(self, ring):
+        """Keyword argument:
+        ring -- FrameRing to write to
+        """
+        Listener.__init__(self)
+        self.ring = ring
+
+    def on_init(self, controller):
+        self.extractor = nml.FrameExtractor(self.ring.slots)
+        self.reader = CatchUpReader()
+        self.sync = ClockSync()
+
+    def on_frame(self, controller):
+        arrived = now_ns()
+        for frame in self.reader.frames(controller):
+            captured = self.sync.update(frame.timestamp, arrived)
+            self.ring.write(frame.id, frame.timestamp, captured / 1e9,
+                            arrived / 1e9, self.extractor.extract(frame))
+
+
+class CaptureClient(object):
+    """Reads the frames a RingListener writes, from any process."""
+
+    def __init__(self, ring):
+        """Starts reading from the next frame written.
+
+        Keyword argument:
+        ring -- FrameRing, or the name of one made by another process
+        """
+        self._attached = not isinstance(ring, FrameRing)
+        self.ring = FrameRing(ring) if self._attached else ring
+        self.reset()
+
+    def reset(self):
+        """Skips the frames written so far and clears the counts."""
+        self.last = self.ring.head
+        self.lost = 0 # Frames overwritten before they were read
+        self.capture = CaptureStats() # Gaps in the frame ids read
+
+    def rewind(self, frames):
+        """Makes read() also return up to the given number of frames
+        written before the last one read, as far as the ring still holds
+        them.
+
+        Keyword argument:
+        frames -- frames to go back
+        """
+        self.last = max(0, self.last - frames)
+
+    def read(self):
+        """Returns the records written since the last call, oldest first,
+        as a frames x columns array.
+        """
+        ring = self.ring
+        head = ring.head
+        first = max(self.last + 1, head - ring.capacity + 1)
+        self.lost += first - self.last - 1
+        self.last = head
+        sequences = np.arange(first, head + 1)
+        slots = sequences % ring.capacity
+        records = ring.records[slots]
+        # Keep only records that were complete before the copy and weren't
+        # overwritten while it was made
+        complete = (records[:, SEQUENCE] == sequences) & \
+                   (ring.records[slots, SEQUENCE] == sequences)
+        if not complete.all():
+            self.lost += len(records) - np.count_nonzero(complete)
+            records = records[complete]
+        update = self.capture.update
+        for frame_id, timestamp in records[:, FRAME_ID:CAPTURED].tolist():
+            update(int(frame_id), int(timestamp))
+        return records
+
+    def latest(self):
+        """Returns a copy of the newest record, or None before the first
+        frame. Doesn't change what read() returns next.
+        """
+        ring = self.ring
+        while True:
+            head = ring.head
+            if head == 0:
+                return None
+            slot = head % ring.capacity
+            record = ring.records[slot].copy()
+            if record[SEQUENCE] == head and \
+               ring.records[slot, SEQUENCE] == head:
+                return record
+
+    @property
+    def stopped(self):
+        """True once the daemon writing to the ring has stopped."""
+        return self.ring.stopped
+
+    @property
+    def box(self):
+        """Interaction box of the device the daemon captures from."""
+        return self.ring.box
+
+    def close(self):
+        """Detaches from the ring if the client attached to it by name."""
+        if self._attached:
+            self.ring.close()
+
+
+class RingDrain(object):
+    """Reads a CaptureClient from a background thread while the main
+    thread is blocked, such as in a dialog between trials, so the daemon
+    can't lap the client. The client must not be used anywhere else until
+    close() returns.
+    """
+
+    def __init__(self, client, interval=DRAIN_INTERVAL):
+        """Starts reading.
+
+        Keyword arguments:
+        client -- CaptureClient to read
+        interval (optional) -- seconds between reads
+        """
+        self.client = client
+        self.interval = interval
+        self.records = []
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        """Stops reading and returns the arrays read, oldest first,
+        including a last read of the frames written since.
+        """
+        self._done.set()
+        self._thread.join()
+        self.records.append(self.client.read())
+        return self.records
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            self.records.append(self.client.read())
+
+
+class CaptureDaemon(object):
+    """Starts a process that owns the Leap controller and writes every frame
+    into a FrameRing. The daemon exits when it is stopped or when this
+    process ends, since it waits on a pipe from this process.
+
+    Started with "python capture.py serve" rather than through
+    multiprocessing, which would run the top-level code of task programs
+    that have no main() again in the new process on Windows.
+    """
+
+    def __init__(self, capacity=RING_FRAMES, slots=nml.FINGER_SLOTS,
+                 simulate=None, rate=200.0):
+        """Keyword arguments:
+        capacity (optional) -- frames the ring holds
+        slots (optional) -- fingers recorded per frame
+        simulate (optional) -- 'tremor' or 'tapping' to capture from a
+                               fakeleap controller instead of the device
+        rate (optional) -- frames per second of a simulated controller
+        """
+        self.capacity = capacity
+        self.slots = slots
+        self.simulate = simulate
+        self.rate = rate
+        self.ring = None
+        self.process = None
+
+    def start(self):
+        """Creates the ring and starts the daemon. Returns once the device
+        is ready and frames are being written.
+        """
+        self.ring = FrameRing(capacity=self.capacity, slots=self.slots)
+        command = [sys.executable, os.path.abspath(__file__), 'serve',
+                   self.ring.name]
+        if self.simulate:
+            command += ['--simulate', self.simulate, '--rate', str(self.rate)]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        universal_newlines=True)
+        if self.process.stdout.readline().strip() != READY:
+            self.stop()
+            raise RuntimeError("The capture daemon didn't start")
+        return self
+
+    def client(self):
+        """Returns a CaptureClient that reads from the next frame written."""
+        return CaptureClient(self.ring)
+
+    def stop(self):
+        """Stops the daemon and removes the ring."""
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+def fingertips(records):
+    """Returns the fingertip positions of records as a frames x 15 array,
+    xyz for each finger slot in the order the fingers appeared, NaN for
+    empty slots. fingers.relabel sorts them thumb to pinky.
+
+    Keyword argument:
+    records -- array returned by CaptureClient.read()
+    """
+    slots = (records.shape[1] - VALUES - nml.FINGER_START) // \
+            nml.FINGER_FIELDS
+    fields = records[:, VALUES + nml.FINGER_START:].reshape(
+        len(records), slots, nml.FINGER_FIELDS)
+    tip = slice(nml.TIP_POSITION, nml.TIP_POSITION + 3)
+    return fields[:, :, tip].reshape(len(records), 3 * slots)
+
+
+def fingertip(record):
+    """Returns the xyz tip position of the finger in the lowest slot in use
+    in a record, or None if there were no fingers in the frame.
+
+    Keyword argument:
+    record -- one row of the array returned by CaptureClient.read()
+    """
+    if record is None:
+        return None
+    for slot in range((len(record) - VALUES - nml.FINGER_START) //
+                      nml.FINGER_FIELDS):
+        i = VALUES + nml.FINGER_START + slot * nml.FINGER_FIELDS + \
+            nml.TIP_POSITION
+        if not np.isnan(record[i]):
+            return record[i:i + 3]
+    return None
+
+
+def palm_position(record):
+    """Returns the xyz palm position of a record, or None if there was no
+    hand in the frame.
+
+    Keyword argument:
+    record -- one row of the array returned by CaptureClient.read()
+    """
+    if record is None:
+        return None
+    palm = record[VALUES + nml.PALM_POSITION:VALUES + nml.PALM_POSITION + 3]
+    if np.isnan(palm[0]):
+        return None
+    return palm
+
+
+def _serve(arguments):
+    """Runs the daemon until its standard input is closed.
+
+    Keyword argument:
+    arguments -- command line after "serve"
+    """
+    parser = argparse.ArgumentParser(prog='capture.py serve')
+    parser.add_argument('ring')
+    parser.add_argument('--simulate', choices=('tremor', 'tapping'))
+    parser.add_argument('--rate', type=float, default=200.0)
+    args = parser.parse_args(arguments)
+    if args.simulate:
+        import fakeleap
+        controller = fakeleap.Controller(
+            fakeleap.TremorMotion() if args.simulate == 'tremor'
+            else fakeleap.TappingMotion(), args.rate)
+    else:
+        import Leap
+        controller = Leap.Controller()
+    ring = FrameRing(args.ring)
+    listener = RingListener(ring)
+    ring.set_box(wait_for_device(controller).interaction_box)
+    controller.add_listener(listener)
+    print(READY)
+    sys.stdout.flush()
+    sys.stdin.read() # Returns once the task program stops or exits
+    controller.remove_listener(listener)
+    if args.simulate:
+        controller.stop()
+    ring.header[_STOPPED] = 1
+    ring.close()
+
+
+def _render(seconds):
+    """Stands in for a slow redraw: pure Python work that holds the
+    interpreter lock for the given time.
+    """
+    end = default_timer() + seconds
+    while default_timer() < end:
+        sum([i * i for i in range(500)])
+
+
+def _benchmark(seconds=5.0, rate=200, work=0.012, fps=60):
+    """Captures from a simulated 200 fps controller while the main thread
+    reads the new frames and renders at 60 fps, first idle and then doing
+    CPU-heavy work for most of each tick. The listener runs in this process
+    and then in the daemon. Prints how late frames reached the listener
+    after they were captured, and how many were recorded.
+
+    Keyword arguments:
+    seconds (optional) -- length of each run
+    rate (optional) -- frames per second from the controller
+    work (optional) -- seconds of rendering work per tick
+    fps (optional) -- render loop rate
+    """
+    import time
+    import fakeleap
+
+    def run(client, render):
+        records = []
+        next_tick = default_timer()
+        end = next_tick + seconds
+        while next_tick < end:
+            records.append(client.read())
+            if render:
+                _render(work)
+            next_tick += 1.0 / fps
+            time.sleep(max(0.0, next_tick - default_timer()))
+        records.append(client.read())
+        return np.concatenate(records)
+
+    print('Capture at %d Hz for %.0f s, reading at %d fps; heavy rendering '
+          'takes %.0f ms per tick' % (rate, seconds, fps, 1e3 * work))
+    print('%-15s %-7s %8s %8s %8s %14s' % ('listener', 'render', 'p50 ms',
+                                          'p99 ms', 'max ms', 'frames'))
+    for render in (False, True):
+        for where in ('in-process', 'daemon'):
+            if where == 'daemon':
+                daemon = CaptureDaemon(simulate='tremor', rate=rate).start()
+                client = daemon.client()
+                records = run(client, render)
+                daemon.stop()
+            else:
+                ring = FrameRing()
+                controller = fakeleap.Controller(fakeleap.TremorMotion(),
+                                                 rate)
+                listener = RingListener(ring)
+                wait_for_device(controller)
+                controller.add_listener(listener)
+                client = CaptureClient(ring)
+                records = run(client, render)
+                controller.remove_listener(listener)
+                controller.stop()
+                ring.close()
+            # Callback delay; the first frames are left out while the clock
+            # estimate settles
+            delay = 1e3 * (records[rate:, ARRIVED] - records[rate:, CAPTURED])
+            made = records[-1, FRAME_ID] - records[0, FRAME_ID] + 1
+            print('%-15s %-7s %8.2f %8.2f %8.2f %6d of %5d' %
+                  (where, 'heavy' if render else 'idle',
+                   np.percentile(delay, 50), np.percentile(delay, 99),
+                   delay.max(), len(records), made))
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['serve']:
+        _serve(sys.argv[2:])
+    else:
+        _benchmark()
@@ -0,0 +1,451 @@
+"""Neuromechanics Lab Leap Stand-in
+
+A drop-in replacement for the parts of the Leap module used by nml.py and the
+task listeners, so acquisition code can be run and benchmarked without a
+device or Leap.dll. Frames come from a motion: a parametric tremor or tapping
+motion, or a replay of a recorded CSV or session file.
+
+Like the Leap service, the controller builds frames on its own thread at the
+frame rate and keeps the last HISTORY_SIZE of them for controller.frame(n).
+A second thread calls each listener's on_frame; if a listener is still busy
+when newer frames arrive, it is only called again for the latest one.
+
+Use it in place of the real module with
+
+    import fakeleap as Leap
+
+or call fakeleap.install() before importing a task program so its own
+"import Leap" picks up the stand-in.
+"""
+
+import math, sys, threading, time
+from collections import deque
+from timeit import default_timer
+
+# Frames kept for controller.frame(history), the same as the Leap SDK
+HISTORY_SIZE = 60
+# Fastest rate the controller may be driven at
+MAX_RATE = 1000 # frames per second
+
+_NAN = float('nan')
+
+
+def install():
+    """Makes "import Leap" anywhere in the program return this module."""
+    sys.modules['Leap'] = sys.modules[__name__]
+
+
+class Vector(object):
+    """Three component vector supporting the Leap.Vector operations used in
+    the lab programs.
+    """
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def __getitem__(self, index):
+        return (self.x, self.y, self.z)[index]
+
+    def __len__(self):
+        return 3
+
+    def __repr__(self):
+        return '(%g, %g, %g)' % (self.x, self.y, self.z)
+
+    def __sub__(self, other):
+        return Vector(self.x - other[0], self.y - other[1], self.z - other[2])
+
+    def __add__(self, other):
+        return Vector(self.x + other[0], self.y + other[1], self.z + other[2])
+
+    @property
+    def magnitude(self):
+        return math.sqrt(self.x ** 2 + self.y ** 2 + self.z ** 2)
+
+    def to_float_array(self):
+        return [self.x, self.y, self.z]
+
+    def to_tuple(self):
+        return (self.x, self.y, self.z)
+
+
+class _ItemList(list):
+    """Leap's FingerList and HandList."""
+
+    @property
+    def is_empty(self):
+        return len(self) == 0
+
+    empty = is_empty
+
+
+class FingerList(_ItemList):
+    pass
+
+
+class HandList(_ItemList):
+    pass
+
+
+class Finger(object):
+    def __init__(self, id, tip_position, tip_velocity, direction):
+        self.id = id
+        self.tip_position = tip_position
+        self.tip_velocity = tip_velocity
+        self.direction = direction
+        self.is_valid = True
+
+
+class Hand(object):
+    def __init__(self, id, palm_position, palm_normal, palm_velocity, fingers):
+        self.id = id
+        self.palm_position = palm_position
+        self.palm_normal = palm_normal
+        self.palm_velocity = palm_velocity
+        self.fingers = fingers
+        self.is_valid = True
+
+
+class InteractionBox(object):
+    def __init__(self, center=(0.0, 200.0, 0.0), width=235.0, height=235.0,
+                 depth=147.0):
+        self.center = Vector(*center)
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.is_valid = width != 0
+
+
+class Frame(object):
+    def __init__(self, id=0, timestamp=0, hands=(), interaction_box=None):
+        """Keyword arguments:
+        id -- frame number, increasing by one for every frame the device makes
+        timestamp -- device time of the frame in microseconds
+        hands -- list of Hand objects
+        interaction_box -- InteractionBox, an empty box by default
+        """
+        self.id = id
+        self.timestamp = timestamp
+        self.hands = HandList(hands)
+        self.fingers = FingerList(f for hand in hands for f in hand.fingers)
+        self.interaction_box = interaction_box or InteractionBox(width=0.0,
+                                                                 height=0.0,
+                                                                 depth=0.0)
+        self.is_valid = interaction_box is not None
+
+
+class Screen(object):
+    """A monitor facing the user behind the device. intersect() maps the
+    fingertip's x-y position across the interaction box straight onto the
+    screen, rather than projecting along the finger direction.
+    """
+
+    def __init__(self, controller):
+        self._controller = controller
+
+    def intersect(self, pointable, normalize, clamp_ratio=1.0):
+        box = self._controller.frame().interaction_box
+        if not box.is_valid:
+            return Vector(_NAN, _NAN, _NAN)
+        tip = pointable.tip_position
+        x = (tip[0] - box.center[0]) / box.width + 0.5
+        y = (tip[1] - box.center[1]) / box.height + 0.5
+        return Vector(x, y, 0.0)
+
+
+class Listener(object):
+    """Base class with the Leap.Listener callbacks, all doing nothing."""
+
+    def on_init(self, controller):
+        pass
+
+    def on_connect(self, controller):
+        pass
+
+    def on_disconnect(self, controller):
+        pass
+
+    def on_exit(self, controller):
+        pass
+
+    def on_frame(self, controller):
+        pass
+
+
+class TremorMotion(object):
+    """A still hand with a sinusoidal tremor along every axis."""
+
+    def __init__(self, frequency=6.0, amplitude=1.0,
+                 center=(0.0, 200.0, 0.0), fingers=5):
+        """Keyword arguments:
+        frequency (optional) -- tremor frequency in Hz
+        amplitude (optional) -- tremor amplitude in millimeters
+        center (optional) -- resting palm position in millimeters
+        fingers (optional) -- number of extended fingers, 0 to 5
+        """
+        self.frequency = frequency
+        self.amplitude = amplitude
+        self.center = center
+        self.fingers = fingers
+
+    def __call__(self, n, t):
+        offset = self.amplitude * math.sin(2 * math.pi * self.frequency * t)
+        cx, cy, cz = self.center
+        palm = (cx + offset, cy + offset, cz + offset)
+        tips = [(palm[0] + 20.0 * (f - 2), palm[1] + 10.0, palm[2] - 60.0)
+                for f in range(self.fingers)]
+        return [(palm, (0.0, -1.0, 0.0), tips)]
+
+
+class TappingMotion(object):
+    """A single pointing finger tapping up and down."""
+
+    def __init__(self, rate=4.0, amplitude=30.0, center=(0.0, 200.0, 0.0)):
+        """Keyword arguments:
+        rate (optional) -- taps per second
+        amplitude (optional) -- half the height of each tap, in millimeters
+        center (optional) -- middle of the fingertip's path, in millimeters
+        """
+        self.rate = rate
+        self.amplitude = amplitude
+        self.center = center
+
+    def __call__(self, n, t):
+        cx, cy, cz = self.center
+        tip = (cx, cy + self.amplitude * math.cos(2 * math.pi * self.rate * t),
+               cz)
+        palm = (cx, tip[1] - 60.0, cz + 60.0)
+        return [(palm, (0.0, -1.0, 0.0), [tip])]
+
+
+class ReplayMotion(object):
+    """Replays the frames of a recorded CSV or session file, at the times
+    they were recorded.
+    """
+
+    def __init__(self, filename):
+        """Keyword argument:
+        filename -- CSV file written by one of the loggers, or session file
+        """
+        import numpy as np
+        import framebuffer, session
+        if filename.endswith(session.EXTENSION):
+            recording = session.Session(filename)
+            header, data = recording.header, np.asarray(recording.data)
+        else:
+            header, data = session.read_csv(filename)
+        columns = header['columns']
+        times = data[:, 0] / (1000.0 if columns[0] == 'time_ms' else 1.0)
+        self.times = (times - times[0]).tolist()
+        self._palms = None
+        if header['task'] == 'postural':
+            self._palms = data[:, 1:framebuffer.FINGER_COUNT].tolist()
+            fingers = data[:, framebuffer.FINGERTIPS]
+        else:
+            fingers = data[:, 1:]
+        self._tips = fingers.tolist()
+
+    def __len__(self):
+        return len(self.times)
+
+    def __call__(self, n, t):
+        values = self._tips[n]
+        tips = [tuple(values[i:i + 3]) for i in range(0, len(values), 3)
+                if not math.isnan(values[i])]
+        if self._palms:
+            palm = self._palms[n]
+            return [(tuple(palm[0:3]), tuple(palm[3:6]), tips)]
+        if not tips:
+            return []
+        palm = tips[0]
+        return [((palm[0], palm[1] - 60.0, palm[2] + 60.0),
+                 (0.0, -1.0, 0.0), tips)]
+
+
+class Controller(object):
+    """Stand-in for Leap.Controller that makes frames from a motion."""
+
+    def __init__(self, motion=None, rate=200.0, realtime=True, box=None):
+        """Keyword arguments:
+        motion (optional) -- callable taking the frame number and time in
+                             seconds and returning a list of hands, each a
+                             (palm position, palm normal, fingertip
+                             positions) tuple. A ReplayMotion supplies its
+                             own frame times. A TremorMotion by default.
+        rate (optional) -- frames per second, at most MAX_RATE
+        realtime (optional) -- False to make frames as fast as possible
+        box (optional) -- InteractionBox reported once frames start
+        """
+        if not 0 < rate <= MAX_RATE:
+            raise ValueError("rate must be between 0 and %d" % MAX_RATE)
+        self.motion = motion or TremorMotion()
+        self.rate = rate
+        self.realtime = realtime
+        self.box = box or InteractionBox()
+        self.located_screens = [Screen(self)]
+        self.finished = threading.Event() # Set when a replay runs out
+        self._history = deque(maxlen=HISTORY_SIZE)
+        self._listeners = []
+        self._new_frame = threading.Condition()
+        self._frame_count = 0
+        self._running = False
+        self._threads = []
+        self._previous = {}
+
+    @property
+    def is_connected(self):
+        return self._running
+
+    def frame(self, history=0):
+        """Returns the latest frame, or an older one from the history. An
+        invalid frame is returned past the end of the history.
+        """
+        try:
+            return self._history[history]
+        except IndexError:
+            return Frame()
+
+    def add_listener(self, listener):
+        self._notify(listener, 'on_init')
+        self._listeners.append(listener)
+        if self._running:
+            self._notify(listener, 'on_connect')
+        else:
+            self._start()
+        return True
+
+    def remove_listener(self, listener):
+        if listener not in self._listeners:
+            return False
+        self._listeners.remove(listener)
+        self._notify(listener, 'on_exit')
+        return True
+
+    def stop(self):
+        """Stops making frames, for use when a test is over."""
+        self._running = False
+        with self._new_frame:
+            self._new_frame.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _notify(self, listener, event):
+        # Listeners of modules that fall back to object when Leap isn't
+        # installed only define the methods they use
+        method = getattr(listener, event, None)
+        if method is not None:
+            method(self)
+
+    def _start(self):
+        self._running = True
+        self._threads = [threading.Thread(target=self._produce),
+                         threading.Thread(target=self._dispatch)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def _make_frame(self, n, t):
+        hands = []
+        dt = 1.0 / self.rate
+        for h, (palm, normal, tips) in enumerate(self.motion(n, t)):
+            fingers = []
+            for f, tip in enumerate(tips):
+                id = 10 * (h + 1) + f
+                last = self._previous.get(id, (tip, t - dt))
+                elapsed = (t - last[1]) or dt
+                velocity = Vector(*[(a - b) / elapsed
+                                    for a, b in zip(tip, last[0])])
+                self._previous[id] = (tip, t)
+                direction = Vector(tip[0] - palm[0], tip[1] - palm[1],
+                                   tip[2] - palm[2])
+                length = direction.magnitude or 1.0
+                fingers.append(Finger(id, Vector(*tip), velocity,
+                                      Vector(direction.x / length,
+                                             direction.y / length,
+                                             direction.z / length)))
+            last = self._previous.get(h, (palm, t - dt))
+            elapsed = (t - last[1]) or dt
+            velocity = Vector(*[(a - b) / elapsed
+                                for a, b in zip(palm, last[0])])
+            self._previous[h] = (palm, t)
+            hands.append(Hand(h + 1, Vector(*palm), Vector(*normal), velocity,
+                              FingerList(fingers)))
+        return Frame(n + 1, int(round(t * 1e6)), hands, self.box)
+
+    def _produce(self):
+        times = getattr(self.motion, 'times', None)
+        start = default_timer()
+        n = 0
+        while self._running:
+            if times is not None:
+                if n == len(times):
+                    break
+                t = times[n]
+            else:
+                t = n / float(self.rate)
+            if self.realtime:
+                wait = start + t - default_timer()
+                if wait > 0:
+                    time.sleep(wait)
+            frame = self._make_frame(n, t)
+            with self._new_frame:
+                self._history.appendleft(frame)
+                self._frame_count += 1
+                self._new_frame.notify()
+            n += 1
+        self.finished.set()
+
+    def _dispatch(self):
+        delivered = 0
+        first = True
+        while True:
+            with self._new_frame:
+                while self._running and self._frame_count == delivered:
+                    self._new_frame.wait()
+                if not self._running:
+                    return
+                # Frames made while a listener was busy are coalesced
+                delivered = self._frame_count
+            if first:
+                for listener in list(self._listeners):
+                    self._notify(listener, 'on_connect')
+                first = False
+            for listener in list(self._listeners):
+                listener.on_frame(self)
+
+
+def _benchmark(seconds=2.0):
+    """Drives a counting listener at several frame rates and prints how many
+    frames were made and delivered.
+
+    Keyword argument:
+    seconds (optional) -- length of each run
+    """
+
+    class CountingListener(Listener):
+        def on_init(self, controller):
+            self.frames = 0
+            self.last_id = 0
+            self.missed = 0
+
+        def on_frame(self, controller):
+            frame = controller.frame()
+            self.frames += 1
+            self.missed += frame.id - self.last_id - 1
+            self.last_id = frame.id
+
+    for rate in (200, 500, MAX_RATE):
+        controller = Controller(TremorMotion(), rate)
+        listener = CountingListener()
+        controller.add_listener(listener)
+        time.sleep(seconds)
+        controller.stop()
+        print('%4d Hz: %5d frames made, %5d delivered, %4d coalesced '
+              '(%.0f fps)' % (rate, controller.frame().id, listener.frames,
+                              listener.missed, listener.frames / seconds))
+
+
+if __name__ == "__main__":
+    _benchmark()
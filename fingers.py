@@ -0,0 +1,463 @@
+"""Neuromechanics Lab Finger Tracking
+
+Puts fingers into fixed anatomical slots, thumb to pinky, instead of the
+order the Leap happens to list them in. FingerTracker follows each finger by
+its Leap id, and only when an id it hasn't seen appears does it match the new
+fingers to the free slots, by the smallest total distance between their tips
+and where each slot's finger was last seen relative to the palm (or a
+template hand for slots not seen yet). With at most five fingers that is a
+five by five assignment, so every frame costs the same.
+
+relabel() sorts the fingertips of a whole recording at once for files
+written before the tracker existed, which have no finger ids. Every frame is
+matched against a template hand, then again against the median hand of the
+recording, trying all 120 orderings of five fingers as array operations.
+
+Both need to know which hand they see, since a left hand is the mirror image
+of a right one. FingerTracker follows the Leap's hand.is_left where the SDK
+reports it.
+
+Run this file with CSV paths as arguments to write relabelled session files,
+adding --hand left for recordings of a left hand, or with no arguments to
+check both against simulated recordings with shuffled fingers and time them.
+"""
+
+import argparse, itertools, os, sys
+import numpy as np
+
+FINGER_NAMES = ('thumb', 'index', 'middle', 'ring', 'pinky')
+SLOTS = len(FINGER_NAMES)
+
+# Fingertip positions of a relaxed right hand held flat, in millimeters from
+# the palm. A left hand is the mirror image in x.
+TEMPLATE = ((-60.0, 0.0, -30.0),
+            (-25.0, 10.0, -85.0),
+            (0.0, 10.0, -95.0),
+            (25.0, 10.0, -85.0),
+            (48.0, 0.0, -65.0))
+
+_NAN = float('nan')
+_INF = float('inf')
+
+# Every way of putting five fingers into five slots, for relabel()
+_ORDERINGS = np.array(list(itertools.permutations(range(SLOTS))))
+# Frames matched at once by relabel(), bounding its memory use
+_RELABEL_ROWS = 8192
+
+
+def template(hand='right'):
+    """Returns the template fingertip offsets for a hand, thumb first.
+
+    Keyword argument:
+    hand (optional) -- 'right' or 'left'
+    """
+    if hand == 'left':
+        return tuple((-x, y, z) for x, y, z in TEMPLATE)
+    return TEMPLATE
+
+
+def assign(cost):
+    """Solves the assignment problem with the Hungarian algorithm. Returns,
+    for each row, the column it is matched to so that the total cost is
+    smallest, or None for rows left over when there are more rows than
+    columns.
+
+    Keyword argument:
+    cost -- list of rows, each a list of costs, all rows the same length
+    """
+    rows = len(cost)
+    columns = len(cost[0]) if rows else 0
+    if rows > columns:
+        matched = assign([list(column) for column in zip(*cost)])
+        out = [None] * rows
+        for column, row in enumerate(matched):
+            out[row] = column
+        return out
+    # Potentials and augmenting paths over 1-based indices, where column 0
+    # stands for the row being added
+    u = [0.0] * (rows + 1)
+    v = [0.0] * (columns + 1)
+    match = [0] * (columns + 1) # row matched to each column
+    way = [0] * (columns + 1)
+    for row in range(1, rows + 1):
+        match[0] = row
+        column = 0
+        least = [_INF] * (columns + 1)
+        used = [False] * (columns + 1)
+        while True:
+            used[column] = True
+            r = match[column]
+            delta = _INF
+            nearest = 0
+            costs = cost[r - 1]
+            for c in range(1, columns + 1):
+                if not used[c]:
+                    reduced = costs[c - 1] - u[r] - v[c]
+                    if reduced < least[c]:
+                        least[c] = reduced
+                        way[c] = column
+                    if least[c] < delta:
+                        delta = least[c]
+                        nearest = c
+            for c in range(columns + 1):
+                if used[c]:
+                    u[match[c]] += delta
+                    v[c] -= delta
+                else:
+                    least[c] -= delta
+            column = nearest
+            if match[column] == 0:
+                break
+        while column:
+            previous = way[column]
+            match[column] = match[previous]
+            column = previous
+    out = [None] * rows
+    for c in range(1, columns + 1):
+        if match[c]:
+            out[match[c] - 1] = c - 1
+    return out
+
+
+def hand_side(hand, default='right'):
+    """Returns 'left' or 'right' for a Leap Hand, or the default when the
+    SDK doesn't say, as before version 2.
+
+    Keyword arguments:
+    hand -- Leap Hand
+    default (optional) -- side returned when the hand has no is_left
+    """
+    is_left = getattr(hand, 'is_left', None)
+    if is_left is None:
+        return default
+    return 'left' if is_left else 'right'
+
+
+class FingerTracker(object):
+    """Keeps each finger of one hand in the same anatomical slot from frame
+    to frame. The template is mirrored as soon as a hand reports it is on
+    the other side.
+    """
+
+    def __init__(self, hand='right'):
+        """Keyword argument:
+        hand (optional) -- 'right' or 'left', which way round the template
+                           hand is for fingers not seen yet, when the Leap
+                           doesn't report it
+        """
+        self.hand = hand
+        self.reset()
+
+    def reset(self):
+        """Forgets every finger, as at the start of a trial."""
+        self._slot_of = {}
+        # Where each slot's finger was last seen, relative to the palm
+        self._offsets = [list(offset) for offset in template(self.hand)]
+        self._palm = (0.0, 0.0, 0.0)
+        self.reassigned = 0 # Frames that needed an assignment
+
+    def track(self, hand, fingers):
+        """Returns the fingers of a frame in slot order, thumb to pinky, with
+        None for slots without a visible finger. Fingers beyond the five
+        slots are left out.
+
+        Keyword arguments:
+        hand -- Leap Hand the fingers belong to, or None if there isn't one,
+                in which case the last palm position seen is used
+        fingers -- Leap Finger objects visible in the frame
+        """
+        if hand is not None:
+            side = hand_side(hand, self.hand)
+            if side != self.hand:
+                # Slots learnt for the other hand are the wrong way round
+                self.hand = side
+                reassigned = self.reassigned
+                self.reset()
+                self.reassigned = reassigned
+            p = hand.palm_position
+            self._palm = (p[0], p[1], p[2])
+        px, py, pz = self._palm
+        slots = [None] * SLOTS
+        slot_of = {}
+        new = []
+        previous = self._slot_of
+        for finger in fingers:
+            slot = previous.get(finger.id)
+            if slot is None or slots[slot] is not None:
+                new.append(finger)
+            else:
+                slots[slot] = finger
+                slot_of[finger.id] = slot
+        if new:
+            self.reassigned += 1
+            free = [slot for slot in range(SLOTS) if slots[slot] is None]
+            if free:
+                cost = []
+                for finger in new:
+                    tip = finger.tip_position
+                    x, y, z = tip[0] - px, tip[1] - py, tip[2] - pz
+                    cost.append([((x - o[0]) ** 2 + (y - o[1]) ** 2 +
+                                  (z - o[2]) ** 2) ** 0.5
+                                 for o in [self._offsets[s] for s in free]])
+                for finger, column in zip(new, assign(cost)):
+                    if column is not None:
+                        slots[free[column]] = finger
+                        slot_of[finger.id] = free[column]
+        self._slot_of = slot_of
+        for slot, finger in enumerate(slots):
+            if finger is not None:
+                tip = finger.tip_position
+                offset = self._offsets[slot]
+                offset[0] = tip[0] - px
+                offset[1] = tip[1] - py
+                offset[2] = tip[2] - pz
+        return slots
+
+
+def slot_positions(slots, missing=_NAN):
+    """Returns the tip positions of tracked fingers as a flat list, xyz for
+    each slot in turn.
+
+    Keyword arguments:
+    slots -- list returned by FingerTracker.track
+    missing (optional) -- value written for each coordinate of an empty slot
+    """
+    row = []
+    for finger in slots:
+        if finger is None:
+            row.extend((missing, missing, missing))
+        else:
+            row.extend(finger.tip_position.to_float_array())
+    return row
+
+
+def _match(offsets, reference):
+    """Returns, for every frame, the slot of each of its fingers that puts
+    the fingers closest to the reference hand. Missing fingers cost nothing
+    wherever they go.
+    """
+    out = np.empty(offsets.shape[:2], int)
+    for first in range(0, len(offsets), _RELABEL_ROWS):
+        block = offsets[first:first + _RELABEL_ROWS]
+        # Distance from every finger to every slot: frames x fingers x slots
+        distance = np.sqrt(((block[:, :, np.newaxis, :] -
+                             reference[np.newaxis, np.newaxis]) ** 2).sum(-1))
+        distance[np.isnan(distance)] = 0.0
+        cost = distance[:, np.arange(SLOTS), _ORDERINGS].sum(-1)
+        out[first:first + _RELABEL_ROWS] = _ORDERINGS[cost.argmin(1)]
+    return out
+
+
+def relabel(tips, palm=None, hand='right'):
+    """Sorts unordered fingertip positions into slots, thumb to pinky.
+    Returns an array the shape of tips.
+
+    Keyword arguments:
+    tips -- frames x 15 array, xyz for up to five fingers in any order, NaN
+            for fingers that weren't visible
+    palm (optional) -- frames x 3 array of palm positions. Without it, as in
+                       Tapping and ClockGame files, fingers are placed
+                       relative to the median fingertip of the recording,
+                       which only works while the hand stays roughly in one
+                       place.
+    hand (optional) -- 'right' or 'left'
+    """
+    tips = np.asarray(tips, float).reshape(len(tips), SLOTS, 3)
+    reference = np.array(template(hand))
+    if palm is None:
+        origin = np.nanmedian(tips.reshape(-1, 3), axis=0)
+        reference = reference - reference.mean(0)
+        offsets = tips - origin
+    else:
+        offsets = tips - np.asarray(palm, float)[:, np.newaxis, :]
+    frames = np.arange(len(tips))[:, np.newaxis]
+    slots = _match(offsets, reference)
+    # Match again against this subject's own median hand
+    labelled = np.full(tips.shape, np.nan)
+    labelled[frames, slots] = offsets
+    seen = ~np.all(np.isnan(labelled[:, :, 0]), axis=0)
+    if np.any(seen):
+        reference[seen] = np.nanmedian(labelled[:, seen], axis=0)
+        slots = _match(offsets, reference)
+    out = np.empty(tips.shape)
+    out[frames, slots] = tips
+    return out.reshape(len(tips), 3 * SLOTS)
+
+
+def relabel_csv(filename, output=None, hand=None):
+    """Writes a session file of a logger CSV file with its fingers sorted
+    into slots, thumb to pinky. Returns the path of the new file.
+
+    Keyword arguments:
+    filename -- path of a Postural, Tapping or ClockGame CSV file
+    output (optional) -- path of the session file, defaults to the CSV path
+                         with the .nmls extension
+    hand (optional) -- 'right' or 'left', by default the hand the file
+                       records, or 'right' if it doesn't say
+    """
+    import session
+    header, data = session.read_csv(filename)
+    if hand is None:
+        recorded = header.get('hand', '').lower()
+        hand = 'left' if recorded.startswith('l') else 'right'
+    # Files written with a FingerTracker are already in order
+    if 'fingers' not in header:
+        columns = list(header['columns'])
+        first = columns.index(session.FINGER_COLUMNS[0])
+        tips = slice(first, first + 3 * SLOTS)
+        palm = None
+        if 'palm_x' in columns:
+            x = columns.index('palm_x')
+            palm = data[:, x:x + 3]
+        data[:, tips] = relabel(data[:, tips], palm, hand)
+        header['fingers'] = list(FINGER_NAMES)
+        header['hand'] = hand
+    header['source'] = os.path.basename(filename)
+    if output is None:
+        output = os.path.splitext(filename)[0] + session.EXTENSION
+    session.write_session(output, header, data)
+    return output
+
+
+def _simulate(frames, rng, rate=200.0):
+    """Returns palm positions, true fingertip positions in slot order and
+    Leap-style finger ids for a right hand with tremor, where fingers drop
+    out for a while and the Leap gives them new ids when they come back.
+    """
+    t = np.arange(frames) / rate
+    palm = np.zeros((frames, 3))
+    palm[:, 0] = 5.0 * np.sin(2 * np.pi * 0.2 * t)
+    palm[:, 1] = 200.0 + 2.0 * np.sin(2 * np.pi * 6.0 * t)
+    palm[:, 2] = 3.0 * np.sin(2 * np.pi * 0.3 * t)
+    tips = palm[:, np.newaxis, :] + np.array(TEMPLATE) + \
+           rng.normal(0.0, 3.0, (SLOTS, 3)) + \
+           rng.normal(0.0, 1.0, (frames, SLOTS, 3))
+    visible = np.ones((frames, SLOTS), bool)
+    ids = np.zeros((frames, SLOTS), int)
+    next_id = 1
+    for slot in range(SLOTS):
+        n = 0
+        while n < frames:
+            # Seen for a while, then lost for a while
+            seen = rng.randint(20, 400)
+            ids[n:n + seen, slot] = next_id
+            next_id += 1
+            n += seen
+            lost = rng.randint(1, 40) if rng.rand() < 0.5 else 0
+            visible[n:n + lost, slot] = False
+            n += lost
+    return palm, tips, visible, ids
+
+
+def _regression(frames=20000):
+    """Shuffles the fingers of a simulated recording every frame and checks
+    that FingerTracker and relabel() put each back in its own slot. Raises
+    AssertionError if fewer than 99% of fingers are placed correctly.
+
+    Keyword argument:
+    frames (optional) -- frames in the simulated recording
+    """
+    import fakeleap
+    rng = np.random.RandomState(0)
+    palm, tips, visible, ids = _simulate(frames, rng)
+
+    for side in ('right', 'left'):
+        if side == 'left':
+            # The mirror image of the right hand, which the tracker only
+            # learns from is_left
+            tips = palm[:, np.newaxis] + (tips - palm[:, np.newaxis]) * \
+                   np.array([-1.0, 1.0, 1.0])
+        tracker = FingerTracker()
+        placed = total = 0
+        shuffled = np.full((frames, SLOTS, 3), np.nan)
+        for n in range(frames):
+            order = [s for s in rng.permutation(SLOTS) if visible[n, s]]
+            fingers = [fakeleap.Finger(ids[n, s],
+                                       fakeleap.Vector(*tips[n, s]),
+                                       None, None) for s in order]
+            shuffled[n, :len(order)] = tips[n, order]
+            hand = fakeleap.Hand(1, fakeleap.Vector(*palm[n]), None, None,
+                                 fingers)
+            hand.is_left = side == 'left'
+            slots = tracker.track(hand, hand.fingers)
+            for slot, finger in enumerate(slots):
+                if finger is not None:
+                    total += 1
+                    placed += finger.id == ids[n, slot]
+        online = float(placed) / total
+        assert online > 0.99, (side, online)
+
+        expected = np.where(visible[:, :, np.newaxis], tips, np.nan)
+        for name, origin in (('with palm', palm), ('without palm', None)):
+            out = relabel(shuffled.reshape(frames, -1), origin, side)
+            out = out.reshape(frames, SLOTS, 3)
+            correct = np.sum(np.all(out == expected, axis=2) & visible)
+            offline = float(correct) / visible.sum()
+            assert offline > 0.99, (side, name, offline)
+            print('%-5s relabel %-13s %.2f%% of fingers in their own slot' %
+                  (side, name, 100 * offline))
+        print('%-5s FingerTracker         %.2f%% of fingers in their own '
+              'slot, %d of %d frames reassigned' %
+              (side, 100 * online, tracker.reassigned, frames))
+
+    assert assign([[4, 1, 3], [2, 0, 5], [3, 2, 2]]) == [1, 0, 2]
+    assert assign([[0, 9], [9, 0], [5, 5]]) == [0, 1, None]
+
+
+def _benchmark(frames=120000):
+    """Times FingerTracker per frame, with and without new finger ids, and
+    relabel() on a 10 minute recording.
+
+    Keyword argument:
+    frames (optional) -- frames in the recording given to relabel()
+    """
+    import fakeleap
+    from timeit import default_timer
+    rng = np.random.RandomState(1)
+    palm, tips, visible, ids = _simulate(frames, rng)
+
+    def make_hands(renumber):
+        hands = []
+        for n in range(2000):
+            first = 10 + SLOTS * n if renumber else 10
+            fingers = [fakeleap.Finger(first + s, fakeleap.Vector(*tips[n, s]),
+                                       None, None)
+                       for s in rng.permutation(SLOTS)]
+            hands.append(fakeleap.Hand(1, fakeleap.Vector(*palm[n]), None,
+                                       None, fingers))
+        return hands
+
+    tracker = FingerTracker()
+    for name, renumber in (('same ids', False), ('new ids every frame', True)):
+        hands = make_hands(renumber)
+        tracker.reset()
+        start = default_timer()
+        for hand in hands:
+            tracker.track(hand, hand.fingers)
+        print('FingerTracker, %-20s %6.1f us per frame' %
+              (name, 1e6 * (default_timer() - start) / len(hands)))
+
+    shuffled = tips.copy()
+    for n in range(frames):
+        shuffled[n] = shuffled[n, rng.permutation(SLOTS)]
+    start = default_timer()
+    relabel(shuffled.reshape(frames, -1), palm)
+    elapsed = default_timer() - start
+    print('relabel, %d frames          %6.2f s (%.1f us per frame)' %
+          (frames, elapsed, 1e6 * elapsed / frames))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        parser = argparse.ArgumentParser(
+            description="Sort the fingers of logger CSV files into slots.")
+        parser.add_argument('files', nargs='+', help="CSV files to relabel")
+        parser.add_argument('--hand', choices=('right', 'left'),
+                            help="hand recorded, by default the one the file "
+                                 "names, or right")
+        args = parser.parse_args()
+        for path in args.files:
+            print(relabel_csv(path, hand=args.hand))
+    else:
+        _regression()
+        _benchmark()
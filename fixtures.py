@@ -0,0 +1,105 @@
+"""Neuromechanics Lab Recorded Traces
+
+Recorded traces kept as compressed NumPy archives in the fixtures folder, one
+file per trace with one array per channel. Nothing is read from disk until a
+trace is first asked for, and each trace is read only once.
+
+    import fixtures
+    fixtures.names()                  # ['tapping']
+    trace = fixtures.load('tapping')  # {'t': array(...), 'y': array(...)}
+    fixtures.time_slice('tapping', 2.0, 4.0)
+
+Run this file with a Python module of list literals (like the old t_data.py)
+and a trace name to add it to the store.
+"""
+
+import os, sys
+import numpy as np
+
+FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+EXTENSION = '.npz'
+# Channel holding sample times, used for slicing by time
+TIME = 't'
+
+_loaded = {}
+
+
+def names():
+    """Returns the names of every stored trace, sorted."""
+    if not os.path.isdir(FOLDER):
+        return []
+    return sorted(f[:-len(EXTENSION)] for f in os.listdir(FOLDER)
+                  if f.endswith(EXTENSION))
+
+
+def load(name):
+    """Returns a stored trace as a dictionary of NumPy arrays, one per
+    channel. The file is read on the first call only.
+
+    Keyword argument:
+    name -- name of the trace, as listed by names()
+    """
+    if name not in _loaded:
+        path = os.path.join(FOLDER, name + EXTENSION)
+        if not os.path.exists(path):
+            raise KeyError("No recorded trace named " + name)
+        with np.load(path) as archive:
+            _loaded[name] = dict((key, archive[key]) for key in archive.files)
+    return _loaded[name]
+
+
+def time_slice(name, start=None, stop=None):
+    """Returns the part of a trace recorded between two times, as a
+    dictionary of views into the loaded arrays.
+
+    Keyword arguments:
+    name -- name of the trace
+    start (optional) -- first time to include, in seconds
+    stop (optional) -- time to stop before, in seconds
+    """
+    trace = load(name)
+    t = trace[TIME]
+    first = 0 if start is None else np.searchsorted(t, start, 'left')
+    last = len(t) if stop is None else np.searchsorted(t, stop, 'left')
+    return dict((key, values[first:last]) for key, values in trace.items())
+
+
+def save(name, **channels):
+    """Stores a trace, replacing any trace of the same name.
+
+    Keyword arguments:
+    name -- name of the trace
+    channels -- equal-length sequences of numbers, one per channel; a time
+                channel should be named 't'
+    """
+    if not os.path.isdir(FOLDER):
+        os.makedirs(FOLDER)
+    arrays = dict((key, np.asarray(values, float))
+                  for key, values in channels.items())
+    np.savez_compressed(os.path.join(FOLDER, name + EXTENSION), **arrays)
+    _loaded.pop(name, None)
+
+
+def convert_module(path, name):
+    """Stores every list of numbers defined in a Python source file as a
+    trace. Used once to move t_data.py into the store.
+
+    Keyword arguments:
+    path -- Python file defining the channels as list literals
+    name -- name to store the trace under
+    """
+    namespace = {}
+    with open(path) as f:
+        exec(compile(f.read(), path, 'exec'), namespace)
+    channels = dict((key, value) for key, value in namespace.items()
+                    if isinstance(value, list) and not key.startswith('_'))
+    save(name, **channels)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python fixtures.py <module.py> <trace name>")
+    else:
+        convert_module(sys.argv[1], sys.argv[2])
+        print(', '.join('%s (%d)' % (key, len(values)) for key, values
+                        in sorted(load(sys.argv[2]).items())))
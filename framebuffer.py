@@ -0,0 +1,404 @@
+"""Neuromechanics Lab Frame Buffer
+
+Array-backed storage for Leap frame data. Listeners write each frame into
+preallocated float64 chunks instead of building a new list per frame, so long
+recordings at 200 fps don't leave hundreds of thousands of small objects for
+the garbage collector to walk inside the Leap callback thread.
+
+A buffer can also run from the moment the device is ready and keep only
+the last few frames until the trial is triggered, so a trial starts with
+the frames from just before the trigger instead of waiting for a listener
+to be added. TriggeredRows does the same for rows of any kind.
+
+Run this file directly for a micro-benchmark against the old list-of-rows
+approach, and for the memory a pre-trigger buffer holds while it waits.
+"""
+
+from collections import deque
+import numpy as np
+
+# Column layout of a single frame record
+TIME = 0
+PALM_POSITION = slice(1, 4)
+PALM_NORMAL = slice(4, 7)
+PALM_VELOCITY = slice(7, 10)
+FINGER_COUNT = 10
+MAX_FINGERS = 5
+FINGERTIPS = slice(11, 11 + 3 * MAX_FINGERS)
+# Device frame id and timestamp (seconds), to find frames that were missed
+FRAME_ID = FINGERTIPS.stop
+DEVICE_TIME = FRAME_ID + 1
+COLUMNS = DEVICE_TIME + 1
+
+COLUMN_NAMES = ('time',
+                'palm_x', 'palm_y', 'palm_z',
+                'normal_i', 'normal_j', 'normal_k',
+                'velocity_x', 'velocity_y', 'velocity_z',
+                'finger_count') + \
+               tuple('finger%d_%s' % (n + 1, axis)
+                     for n in range(MAX_FINGERS) for axis in 'xyz') + \
+               ('frame_id', 'device_time')
+
+# Number of frames held by each chunk; about 20 seconds of data at 200 fps.
+CHUNK_ROWS = 4096
+
+_NAN = float('nan')
+
+
+class FrameBuffer(object):
+    """Growable columnar buffer of hand frames. Storage is allocated one chunk
+    at a time, so appending a frame never copies earlier data.
+
+    Frames are numbered from the first one appended, including frames a
+    pre-trigger buffer has since forgotten.
+    """
+
+    def __init__(self, chunk_rows=CHUNK_ROWS, pre_trigger=None):
+        """Sets up an empty buffer with a single chunk allocated.
+
+        Keyword arguments:
+        chunk_rows (optional) -- number of frames stored per chunk
+        pre_trigger (optional) -- frames from before trigger() that are
+                                  kept. Older frames are forgotten and their
+                                  chunks reused, so the memory held while
+                                  waiting for the trigger stays the same.
+                                  None keeps every frame.
+        """
+        self.chunk_rows = chunk_rows
+        self.pre_trigger = pre_trigger
+        self.trigger_index = None
+        # Chunks by number from the start of the recording, so forgetting
+        # one never moves the others while they are being read
+        self._chunks = {}
+        self._spare = []
+        self._count = 0
+        self._row = 0
+        self._current = None
+        self._flat = None
+        self._new_chunk()
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def oldest(self):
+        """Index of the oldest frame still held."""
+        return min(self._chunks) * self.chunk_rows
+
+    def trigger(self):
+        """Marks the next frame recorded as the start of the trial and stops
+        forgetting frames. Returns the index of the first frame of the
+        trial, including the pre-trigger frames.
+        """
+        self.trigger_index = self._count
+        return self.trial_start()
+
+    def trial_start(self):
+        """Returns the index of the first frame of the trial: pre_trigger
+        frames before the trigger, or the oldest frame held if fewer were
+        recorded.
+        """
+        return max(self.oldest, self.trigger_index - (self.pre_trigger or 0))
+
+    def _new_chunk(self):
+        number = self._count // self.chunk_rows
+        if self.pre_trigger is not None and self.trigger_index is None:
+            # Chunks holding only frames older than the pre-trigger window
+            # are reused instead of allocating new ones
+            keep = (self._count - self.pre_trigger) // self.chunk_rows
+            for old in [n for n in self._chunks if n < keep]:
+                self._spare.append(self._chunks.pop(old))
+        if self._spare:
+            self._current = self._spare.pop()
+        else:
+            self._current = np.empty((self.chunk_rows, COLUMNS))
+        self._chunks[number] = self._current
+        # Flat memoryview over the chunk; single float stores through it
+        # skip NumPy's per-item dispatch.
+        self._flat = memoryview(self._current.reshape(-1))
+        self._row = 0
+
+    def append_hand(self, time, hand, fingers, frame_id=_NAN,
+                    device_time=_NAN):
+        """Records one frame of hand data. Fingers past MAX_FINGERS are
+        ignored and empty finger slots are stored as NaN.
+
+        Keyword arguments:
+        time -- timestamp of the frame, in seconds
+        hand -- Leap Hand object to record
+        fingers -- list of Leap Finger objects visible in the frame, or the
+                   slots from FingerTracker.track, where None leaves a gap
+        frame_id (optional) -- frame.id of the frame
+        device_time (optional) -- frame.timestamp of the frame, in seconds
+        """
+        if self._row == self.chunk_rows:
+            self._new_chunk()
+        s = self._flat
+        base = self._row * COLUMNS
+
+        s[base] = time
+        pos = hand.palm_position
+        s[base + 1] = pos[0]
+        s[base + 2] = pos[1]
+        s[base + 3] = pos[2]
+        pn = hand.palm_normal
+        s[base + 4] = pn[0]
+        s[base + 5] = pn[1]
+        s[base + 6] = pn[2]
+        pv = hand.palm_velocity
+        s[base + 7] = pv[0]
+        s[base + 8] = pv[1]
+        s[base + 9] = pv[2]
+
+        s[base + FRAME_ID] = frame_id
+        s[base + DEVICE_TIME] = device_time
+
+        i = base + FINGERTIPS.start
+        end = base + FINGERTIPS.stop
+        count = 0
+        for finger in fingers:
+            if i == end:
+                break
+            if finger is None:
+                s[i] = s[i + 1] = s[i + 2] = _NAN
+            else:
+                tip = finger.tip_position
+                s[i] = tip[0]
+                s[i + 1] = tip[1]
+                s[i + 2] = tip[2]
+                count += 1
+            i += 3
+        s[base + FINGER_COUNT] = count
+        while i < end:
+            s[i] = _NAN
+            i += 1
+
+        self._row += 1
+        self._count += 1
+
+    def _blocks(self, start, stop):
+        """Yields the stored frames from start to stop as chunk slices."""
+        while start < stop:
+            chunk = self._chunks[start // self.chunk_rows]
+            first = start % self.chunk_rows
+            last = min(self.chunk_rows, first + stop - start)
+            yield chunk[first:last]
+            start += last - first
+
+    def to_array(self, start=None, stop=None, origin=0.0):
+        """Returns a copy of the recorded frames as a single (frames,
+        COLUMNS) NumPy array.
+
+        Keyword arguments:
+        start (optional) -- index of the first frame, defaults to the oldest
+                            frame held
+        stop (optional) -- index after the last frame, defaults to every
+                           frame recorded so far
+        origin (optional) -- subtracted from the time column
+        """
+        if start is None:
+            start = self.oldest
+        if stop is None:
+            stop = self._count
+        data = np.concatenate([np.empty((0, COLUMNS))] +
+                              list(self._blocks(start, stop)))
+        data[:, TIME] -= origin
+        return data
+
+    def column(self, name):
+        """Returns a single column of the recorded data as a NumPy array.
+
+        Keyword argument:
+        name -- column name from COLUMN_NAMES, or a column index
+        """
+        if not isinstance(name, int):
+            name = COLUMN_NAMES.index(name)
+        return self.to_array()[:, name]
+
+    def to_rows(self, start=None, stop=None, origin=0.0):
+        """Yields frames as lists in the layout of the original CSV files:
+        time, palm position, normal and velocity, then xyz for each finger
+        column up to the last one in use, left blank for empty slots. Safe
+        to call while a listener is still appending.
+
+        Keyword arguments:
+        start (optional) -- index of the first frame to yield, defaults to
+                            the oldest frame held
+        stop (optional) -- index after the last frame, defaults to every
+                           frame recorded so far
+        origin (optional) -- subtracted from the time of each frame
+        """
+        if start is None:
+            start = self.oldest
+        if stop is None:
+            stop = self._count
+        for block in self._blocks(start, stop):
+            for row in block.tolist():
+                tips = row[FINGERTIPS]
+                # Trailing empty slots are dropped, gaps are left blank
+                while tips and tips[-1] != tips[-1]:
+                    del tips[-3:]
+                row[TIME] -= origin
+                yield row[:FINGER_COUNT] + \
+                      [value if value == value else '' for value in tips]
+
+
+class TriggeredRows(object):
+    """Rows of any kind recorded from the moment the device is ready, of
+    which only the last pre_trigger are kept until trigger() is called.
+    One thread appends while another triggers.
+    """
+
+    def __init__(self, pre_trigger):
+        """Keyword argument:
+        pre_trigger -- rows from before trigger() that are kept
+        """
+        self._before = deque(maxlen=pre_trigger)
+        self._after = None
+
+    def __len__(self):
+        return len(self._before) + len(self._after or ())
+
+    def append(self, row):
+        if self._after is None:
+            self._before.append(row)
+        else:
+            self._after.append(row)
+
+    def trigger(self):
+        """Keeps every row from here on, after the pre-trigger rows. Later
+        calls change nothing, so a continuous recording keeps every trial.
+        """
+        if self._after is None:
+            self._after = []
+
+    def trial(self):
+        """Returns the pre-trigger rows followed by the rows since the
+        trigger, as a list.
+        """
+        return list(self._before) + (self._after or [])
+
+
+def _benchmark(rate=250, seconds=4.0, prefill=240000):
+    """Drives FrameBuffer and a plain list of rows with synthetic frames at
+    the given rate and prints per-callback latency percentiles for each.
+
+    Keyword arguments:
+    rate (optional) -- synthetic frames per second
+    seconds (optional) -- length of each timed run
+    prefill (optional) -- frames recorded before timing starts, standing in
+                          for a long hold (240000 is 20 minutes at 200 fps)
+    """
+    import gc, math, time
+    from timeit import default_timer
+
+    class Part(object):
+        pass
+
+    def make_frame(n):
+        hand = Part()
+        w = 2 * math.pi * 6.0 * n / rate
+        hand.palm_position = (math.sin(w), 200.0 + math.cos(w), 10.0)
+        hand.palm_normal = (0.0, -1.0, 0.0)
+        hand.palm_velocity = (math.cos(w), -math.sin(w), 0.0)
+        fingers = []
+        for f in range(5):
+            finger = Part()
+            finger.tip_position = (f * 20.0, 220.0, -30.0)
+            fingers.append(finger)
+        return hand, fingers
+
+    frames = [make_frame(n) for n in range(rate)]
+
+    def list_callback(data, t, hand, fingers):
+        pos = hand.palm_position
+        pn = hand.palm_normal
+        pv = hand.palm_velocity
+        row = [t, pos[0], pos[1], pos[2], pn[0], pn[1], pn[2],
+               pv[0], pv[1], pv[2]]
+        for finger in fingers:
+            tip = finger.tip_position
+            row.extend([tip[0], tip[1], tip[2]])
+        data.append(row)
+
+    def run(name, callback, data):
+        for n in range(prefill):
+            hand, fingers = frames[n % rate]
+            callback(data, 0.0, hand, fingers)
+        total = int(rate * seconds)
+        latencies = np.empty(total)
+        period = 1.0 / rate
+        collections = sum(s['collections'] for s in gc.get_stats()) \
+                      if hasattr(gc, 'get_stats') else 0
+        start = default_timer()
+        for n in range(total):
+            hand, fingers = frames[n % rate]
+            t0 = default_timer()
+            callback(data, t0 - start, hand, fingers)
+            latencies[n] = default_timer() - t0
+            # Pace the loop like the Leap service would
+            wait = start + (n + 1) * period - default_timer()
+            if wait > 0:
+                time.sleep(wait)
+        if hasattr(gc, 'get_stats'):
+            collections = sum(s['collections'] for s in gc.get_stats()) - \
+                          collections
+        us = latencies * 1e6
+        print('%-12s p50 %6.2f  p90 %6.2f  p99 %6.2f  p99.9 %7.2f  '
+              'max %8.2f us  (%d frames, %d gc runs)' %
+              ((name,) + tuple(np.percentile(us, [50, 90, 99, 99.9])) +
+               (us.max(), total, collections)))
+
+    print('Per-callback latency at %d Hz for %.1f s' % (rate, seconds))
+    run('list rows', list_callback, [])
+    run('FrameBuffer', lambda buf, t, h, f: buf.append_hand(t, h, f),
+        FrameBuffer())
+
+
+def _pre_trigger_benchmark(rate=200, minutes=(1, 10, 30), pre_trigger=100):
+    """Records frames as fast as possible for waits of several lengths
+    before a trigger, then a 10 second trial, and prints the memory the
+    buffer holds with and without a pre-trigger window.
+
+    Keyword arguments:
+    rate (optional) -- frames per second the wait is counted in
+    minutes (optional) -- lengths of the waits before the trigger
+    pre_trigger (optional) -- frames kept from before the trigger
+    """
+    class Part(object):
+        pass
+
+    hand = Part()
+    hand.palm_position = hand.palm_normal = hand.palm_velocity = \
+        (0.0, 200.0, 0.0)
+    finger = Part()
+    finger.tip_position = (0.0, 220.0, -30.0)
+    fingers = [finger] * MAX_FINGERS
+
+    def held(buffer):
+        chunks = len(buffer._chunks) + len(buffer._spare)
+        return chunks * buffer.chunk_rows * COLUMNS * 8 / 1e6
+
+    print('Memory held after waiting, then a 10 s trial, at %d fps' % rate)
+    for wait in minutes:
+        results = []
+        for window in (None, pre_trigger):
+            buffer = FrameBuffer(pre_trigger=window)
+            for n in range(wait * 60 * rate):
+                buffer.append_hand(n / float(rate), hand, fingers)
+            waiting = held(buffer)
+            first = buffer.trigger()
+            for n in range(10 * rate):
+                buffer.append_hand(wait * 60 + n / float(rate), hand, fingers)
+            trial = buffer.to_array(first)
+            results.append((waiting, held(buffer), len(trial)))
+        print('    %2d min wait: everything kept %6.1f MB, %6.1f MB after '
+              'the trial   pre-trigger %5.1f MB, %5.1f MB after the trial '
+              '(%d frames, %d before the trigger)' %
+              (wait, results[0][0], results[0][1], results[1][0],
+               results[1][1], results[1][2], results[1][2] - 10 * rate))
+
+
+if __name__ == "__main__":
+    _benchmark()
+    _pre_trigger_benchmark()
@@ -0,0 +1,465 @@
+"""Neuromechanics Lab Frame Bus
+
+Lets one process capture frames and hand each of them, once, to any number
+of feedback windows, loggers and live analyses, instead of every program
+making its own Leap.Controller and polling it for frames the others never
+see. The publisher owns the controller and sends every frame over a local
+socket as a fixed-size record, the same row of float64 a capture.FrameRing
+holds.
+
+Each subscriber picks how it is treated when it falls behind. A
+DROP_OLDEST subscriber, such as a display, has a short queue in the
+publisher that forgets the oldest frames first, so it always gets the
+newest frame quickly. A LOSSLESS subscriber, such as a logger, has a queue
+that grows until it catches up. Every subscriber has its own queue and its
+own sender thread, so a slow subscriber only delays itself and never the
+listener that publishes.
+
+The bus listens on a Unix domain socket, or on a localhost TCP port where
+Python has no AF_UNIX, as on Windows.
+
+Usage:
+    python framebus.py serve [--simulate tremor|tapping] [--rate HZ]
+
+Run this file without arguments for throughput and fan-out latency with 1,
+4 and 16 subscribers of a simulated producer.
+"""
+
+from __future__ import print_function
+import errno, json, os, select, socket, struct, sys, tempfile, threading
+from collections import deque
+from timeit import default_timer
+import numpy as np
+import nml
+from acquisition import CaptureStats, wait_for_device
+from capture import ARRIVED, CAPTURED, FRAME_ID, SEQUENCE, VALUES
+from capture import Box, RingListener
+from timing import now_ns
+
+# How a subscriber is treated when it falls behind
+DROP_OLDEST = 'drop-oldest'
+LOSSLESS = 'lossless'
+# Frames queued for a DROP_OLDEST subscriber
+DROP_OLDEST_FRAMES = 8
+# Seconds Subscriber.latest() waits for the frames it asked for; more than a
+# frame at 200 fps
+LATEST_WAIT = 0.01
+
+if hasattr(socket, 'AF_UNIX'):
+    DEFAULT_ADDRESS = os.path.join(tempfile.gettempdir(), 'nml_framebus')
+else:
+    DEFAULT_ADDRESS = ('127.0.0.1', 47810)
+
+
+def _family(address):
+    return socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+
+
+class _Queue(object):
+    """Records waiting for one subscriber, sent by a thread of their own."""
+
+    def __init__(self, connection, policy):
+        self.connection = connection
+        self.policy = policy
+        self.dropped = 0
+        self.closed = False
+        self._records = deque(maxlen=DROP_OLDEST_FRAMES
+                              if policy == DROP_OLDEST else None)
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._send)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, record):
+        records = self._records
+        if len(records) == records.maxlen:
+            self.dropped += 1
+        records.append(record)
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+        if self.policy == DROP_OLDEST:
+            # Wakes the sender if it is waiting for a request
+            try:
+                self.connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        # Gives a logger a moment to take the frames still queued for it
+        self._thread.join(1.0)
+        self.connection.close()
+
+    def _send(self):
+        pop = self._records.popleft
+        while not self.closed:
+            if self.policy == DROP_OLDEST:
+                # Frames are only sent when asked for, so they never wait in
+                # the socket while a display is busy and go stale there
+                try:
+                    if not self.connection.recv(64):
+                        break
+                except socket.error:
+                    break
+            chunk = []
+            while not chunk and not self.closed:
+                self._ready.wait()
+                self._ready.clear()
+                # popleft is atomic, so this is safe while the publisher
+                # appends
+                while True:
+                    try:
+                        chunk.append(pop())
+                    except IndexError:
+                        break
+            if chunk:
+                try:
+                    self.connection.sendall(b''.join(chunk))
+                except socket.error:
+                    break
+        self.closed = True # The subscriber went away, or the bus closed
+
+
+class FrameBus(object):
+    """Publishes frame records to every subscriber connected to an address.
+    Has the write() of a capture.FrameRing, so a capture.RingListener
+    publishes to it directly.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, slots=nml.FINGER_SLOTS,
+                 box=None):
+        """Starts accepting subscribers.
+
+        Keyword arguments:
+        address (optional) -- socket path, or (host, port) for TCP
+        slots (optional) -- fingers per record
+        box (optional) -- interaction box of the device, sent to
+                          subscribers as a Box
+        """
+        self.address = address
+        self.slots = slots
+        self.columns = VALUES + nml.FINGER_START + slots * nml.FINGER_FIELDS
+        self.box = box
+        self.sequence = 0
+        self._record = struct.Struct('<%dd' % self.columns)
+        # Replaced rather than changed, so publishing needs no lock
+        self._queues = []
+        self._lock = threading.Lock()
+        if _family(address) == socket.AF_UNIX and os.path.exists(address):
+            os.remove(address) # Left behind by a publisher that crashed
+        self._server = socket.socket(_family(address), socket.SOCK_STREAM)
+        if _family(address) == socket.AF_INET:
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(address)
+        self._server.listen(16)
+        self._thread = threading.Thread(target=self._accept)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def subscribers(self):
+        return len(self._queues)
+
+    def write(self, frame_id, timestamp, captured, arrived, values):
+        """Queues one frame for every subscriber. Only one thread may
+        publish.
+
+        Keyword arguments:
+        frame_id -- device frame id
+        timestamp -- device timestamp in microseconds
+        captured -- host time in seconds the frame was captured
+        arrived -- host time in seconds the frame was received
+        values -- frame values in the nml.FrameExtractor layout
+        """
+        self.sequence += 1
+        record = self._record.pack(self.sequence, frame_id, timestamp,
+                                   captured, arrived, *values)
+        for queue in self._queues:
+            if queue.closed:
+                self._remove(queue)
+            else:
+                queue.put(record)
+
+    def dropped(self):
+        """Returns the frames dropped for each connected subscriber."""
+        return [queue.dropped for queue in self._queues]
+
+    def close(self):
+        """Stops accepting subscribers and disconnects the ones connected."""
+        self._server.close()
+        with self._lock:
+            queues, self._queues = self._queues, []
+        for queue in queues:
+            queue.close()
+        if _family(self.address) == socket.AF_UNIX and \
+           os.path.exists(self.address):
+            os.remove(self.address)
+
+    def _remove(self, queue):
+        with self._lock:
+            self._queues = [q for q in self._queues if q is not queue]
+        queue.connection.close()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self._server.accept()
+            except socket.error:
+                return # Closed
+            try:
+                policy = _read_line(connection)
+                if policy not in (DROP_OLDEST, LOSSLESS):
+                    raise ValueError("Unknown policy %r" % policy)
+                box = self.box and [list(self.box.center), self.box.width,
+                                    self.box.height, self.box.depth]
+                header = json.dumps({'columns': self.columns, 'box': box})
+                connection.sendall((header + '\n').encode('ascii'))
+            except (socket.error, ValueError):
+                connection.close()
+                continue
+            with self._lock:
+                self._queues = self._queues + [_Queue(connection, policy)]
+
+
+def _read_line(connection):
+    """Reads one line of the handshake, a byte at a time so nothing after it
+    is consumed.
+    """
+    line = b''
+    while not line.endswith(b'\n'):
+        byte = connection.recv(1)
+        if not byte:
+            raise socket.error("Connection closed")
+        line += byte
+    return line.decode('ascii').strip()
+
+
+class Subscriber(object):
+    """Receives the frames a FrameBus publishes."""
+
+    def __init__(self, address=DEFAULT_ADDRESS, policy=DROP_OLDEST):
+        """Connects to a bus.
+
+        Keyword arguments:
+        address (optional) -- address the bus listens on
+        policy (optional) -- DROP_OLDEST to only keep up with the newest
+                             frames, LOSSLESS to receive every one
+        """
+        self.policy = policy
+        self._socket = socket.socket(_family(address), socket.SOCK_STREAM)
+        self._socket.connect(address)
+        self._socket.sendall((policy + '\n').encode('ascii'))
+        header = json.loads(_read_line(self._socket))
+        self.columns = header['columns']
+        self.box = header['box'] and Box(*header['box'])
+        self._socket.setblocking(False)
+        self._size = 8 * self.columns
+        self._pending = b'' # part of a record
+        self._requested = False
+        self._latest = None
+        self.sequence = 0 # of the last record received
+        self.lost = 0 # frames dropped for this subscriber
+        self.capture = CaptureStats() # Gaps in the frame ids received
+        self.closed = False # set when the bus goes away
+
+    def read(self, timeout=0):
+        """Returns the records received since the last call, oldest first,
+        as a frames x columns array. A DROP_OLDEST subscriber is sent the
+        frames queued for it when it asks, which this does, so the frames
+        asked for may only arrive by the next call.
+
+        Keyword argument:
+        timeout (optional) -- seconds to wait for something to arrive if
+                              nothing has, None for as long as it takes
+        """
+        if self.policy == DROP_OLDEST and not self._requested:
+            self._socket.sendall(b'\n')
+            self._requested = True
+        if timeout != 0 and len(self._pending) < self._size:
+            select.select([self._socket], [], [], timeout)
+        chunks = [self._pending]
+        while True:
+            try:
+                chunk = self._socket.recv(1 << 16)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if not chunk:
+                self.closed = True
+                break
+            chunks.append(chunk)
+        data = b''.join(chunks)
+        whole = len(data) - len(data) % self._size
+        self._pending = data[whole:]
+        records = np.frombuffer(data[:whole], '<f8').reshape(-1, self.columns)
+        if len(records):
+            self._requested = False
+            sequences = records[:, SEQUENCE]
+            if self.sequence == 0:
+                self.sequence = int(sequences[0]) - 1 # Joined midway
+            self.lost += int(sequences[-1]) - self.sequence - len(records)
+            self.sequence = int(sequences[-1])
+            self._latest = records[-1]
+            update = self.capture.update
+            for frame_id, timestamp in records[:, FRAME_ID:CAPTURED].tolist():
+                update(int(frame_id), int(timestamp))
+        return records
+
+    def latest(self, timeout=LATEST_WAIT):
+        """Reads what has arrived and returns the newest record, or None
+        before the first frame.
+
+        Keyword argument:
+        timeout (optional) -- seconds to wait for something to arrive if
+                              nothing has
+        """
+        self.read(timeout)
+        return self._latest
+
+    def close(self):
+        self._socket.close()
+        self.closed = True
+
+
+def _serve(arguments):
+    """Captures from the device, or a simulated one, and publishes every
+    frame until interrupted.
+
+    Keyword argument:
+    arguments -- command line after "serve"
+    """
+    import argparse, time
+    parser = argparse.ArgumentParser(prog='framebus.py serve')
+    parser.add_argument('--simulate', choices=('tremor', 'tapping'))
+    parser.add_argument('--rate', type=float, default=200.0)
+    args = parser.parse_args(arguments)
+    if args.simulate:
+        import fakeleap
+        controller = fakeleap.Controller(
+            fakeleap.TremorMotion() if args.simulate == 'tremor'
+            else fakeleap.TappingMotion(), args.rate)
+    else:
+        import Leap
+        controller = Leap.Controller()
+    box = wait_for_device(controller).interaction_box
+    bus = FrameBus(box=Box([box.center[i] for i in range(3)], box.width,
+                           box.height, box.depth))
+    listener = RingListener(bus)
+    controller.add_listener(listener)
+    print("Publishing frames on", DEFAULT_ADDRESS, "- press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    controller.remove_listener(listener)
+    bus.close()
+
+
+def _subscribe(address, policy, frames, stall, results):
+    """Subscriber process of the benchmark. Reads until the publisher's
+    last frame arrives and reports what it received and how late.
+    """
+    import time
+    subscriber = Subscriber(address, policy)
+    delays = []
+    received = 0
+    first = None
+    while subscriber.sequence < frames and not subscriber.closed:
+        # Waits as long as latest() would
+        records = subscriber.read(LATEST_WAIT if stall else 1.0)
+        if len(records):
+            arrived = now_ns() / 1e9
+            first = first or default_timer()
+            received += len(records)
+            # A display only draws the newest frame it has
+            if policy == DROP_OLDEST:
+                records = records[-1:]
+            delays.append(arrived - records[:, ARRIVED])
+        if stall:
+            time.sleep(stall) # A display redrawing slowly
+    delays = 1e3 * np.concatenate(delays)
+    results.put((policy, received, subscriber.lost, np.percentile(delays, 50),
+                 np.percentile(delays, 99), default_timer() - first))
+    subscriber.close()
+
+
+def _run(address, subscribers, frames, rate=None):
+    """Publishes simulated frames to subscriber processes and returns their
+    results and the seconds spent publishing.
+
+    Keyword arguments:
+    address -- address of the bus
+    subscribers -- (policy, seconds stalled per read) of each subscriber
+    frames -- frames published
+    rate (optional) -- frames per second, None for as fast as possible
+    """
+    import multiprocessing, time
+    bus = FrameBus(address)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_subscribe,
+                                         args=(address, policy, frames,
+                                               stall, results))
+                 for policy, stall in subscribers]
+    for process in processes:
+        process.start()
+    while bus.subscribers < len(processes):
+        time.sleep(0.01)
+    values = [0.0] * (bus.columns - VALUES)
+    start = default_timer()
+    for n in range(frames):
+        if rate:
+            time.sleep(max(0.0, start + n / float(rate) - default_timer()))
+        arrived = now_ns() / 1e9
+        bus.write(n + 1, int(n * 5000), arrived, arrived, values)
+    published = default_timer() - start
+    received = [results.get() for process in processes]
+    for process in processes:
+        process.join()
+    bus.close()
+    return received, published
+
+
+def _benchmark(frames=20000, rate=200, seconds=3.0):
+    """Prints throughput and fan-out latency of a simulated producer with
+    1, 4 and 16 subscriber processes, and what a stalled display does to a
+    logger on the same bus.
+
+    Keyword arguments:
+    frames (optional) -- frames published as fast as possible
+    rate (optional) -- frames per second for the latency runs
+    seconds (optional) -- length of each latency run
+    """
+    if hasattr(socket, 'AF_UNIX'):
+        address = os.path.join(tempfile.gettempdir(), 'nml_framebus_test')
+    else:
+        address = ('127.0.0.1', DEFAULT_ADDRESS[1] + 1)
+    print('%d frames as fast as possible, and %d Hz for %.0f s, to lossless '
+          'subscribers' % (frames, rate, seconds))
+    print('%11s %14s %13s %9s %9s' % ('subscribers', 'published/s',
+                                      'delivered/s', 'p50 ms', 'p99 ms'))
+    for count in (1, 4, 16):
+        received, published = _run(address, [(LOSSLESS, 0)] * count, frames)
+        assert all(r[1] == frames for r in received)
+        delivered = count * frames / max(r[5] for r in received)
+        latency, _ = _run(address, [(LOSSLESS, 0)] * count,
+                          int(rate * seconds), rate)
+        print('%11d %14.0f %13.0f %9.2f %9.2f' %
+              (count, frames / published, delivered,
+               np.median([r[3] for r in latency]),
+               max(r[4] for r in latency)))
+
+    received, _ = _run(address, [(DROP_OLDEST, 0.1), (LOSSLESS, 0)],
+                       int(rate * seconds), rate)
+    print('With a display reading every 100 ms on the same bus:')
+    for policy, count, lost, p50, p99, elapsed in received:
+        print('    %-11s received %4d, dropped %4d, p50 %6.2f ms, '
+              'p99 %6.2f ms' % (policy, count, lost, p50, p99))
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['serve']:
+        _serve(sys.argv[2:])
+    else:
+        _benchmark()
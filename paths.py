@@ -0,0 +1,279 @@
+"""Neuromechanics Lab Path Coverage
+
+Keeps track of which moves between targets a subject has made, for games
+that run until every path between every pair of targets has been covered a
+set number of times. Paths are numbered once through a lookup table, counts
+live in an integer array and the number of paths still short of their quota
+is kept up to date with each move, so checking whether the game is over
+never scans the paths.
+
+balanced_sequence() builds a target order that covers every path exactly the
+required number of times, which is the fewest moves possible: an Eulerian
+circuit of the complete directed graph on the targets, like the hand-written
+PATTERN in CornersGame.
+
+Run this file to check coverage and generated sequences for 4 to 32 targets
+and time them against scanning a dictionary of paths.
+"""
+
+import random
+import numpy as np
+
+# Names of the four ClockGame and CornersGame targets, in location order
+CORNER_NAMES = ('NW', 'NE', 'SW', 'SE')
+
+
+def path_count(targets):
+    """Returns the number of directed paths between distinct targets."""
+    return targets * (targets - 1)
+
+
+def path_table(targets):
+    """Returns a targets x targets array giving the index of the path from
+    the row target to the column target, -1 on the diagonal.
+
+    Keyword argument:
+    targets -- number of targets
+    """
+    table = np.arange(targets * targets).reshape(targets, targets)
+    # Skip the diagonal: each row loses one index for every row above it,
+    # and one more to the right of its own diagonal entry
+    table -= np.arange(targets)[:, np.newaxis]
+    table[np.triu_indices(targets, 1)] -= 1
+    np.fill_diagonal(table, -1)
+    return table
+
+
+class PathCoverage(object):
+    """Counts moves along every path between a set of targets."""
+
+    def __init__(self, targets, hits=1, names=None):
+        """Keyword arguments:
+        targets -- number of targets
+        hits (optional) -- times each path must be covered
+        names (optional) -- name of each target, used to name paths
+        """
+        if targets < 2:
+            raise ValueError("At least two targets are needed")
+        self.targets = targets
+        self.hits = hits
+        self.names = names
+        self.table = path_table(targets)
+        # Plain nested lists index faster than NumPy for single lookups
+        self._index = self.table.tolist()
+        self.counts = np.zeros(path_count(targets), int)
+        self.remaining = len(self.counts) if hits > 0 else 0
+
+    @property
+    def complete(self):
+        """True once every path has been covered hits times."""
+        return self.remaining == 0
+
+    def path_index(self, current, new):
+        """Returns the index of the path between two targets.
+
+        Keyword arguments:
+        current -- index of the target moved from
+        new -- index of the target moved to
+        """
+        index = self._index[current][new]
+        if index < 0:
+            raise ValueError("A path needs two different targets")
+        return index
+
+    def path_name(self, current, new):
+        """Returns the name of a path, such as 'NW-NE'.
+
+        Keyword arguments:
+        current -- index of the target moved from
+        new -- index of the target moved to
+        """
+        self.path_index(current, new)
+        if self.names:
+            return self.names[current] + '-' + self.names[new]
+        return '%d-%d' % (current, new)
+
+    def log(self, current, new):
+        """Counts a move. Returns True if it was the last path needed.
+
+        Keyword arguments:
+        current -- index of the target moved from
+        new -- index of the target moved to
+        """
+        index = self.path_index(current, new)
+        count = self.counts[index] + 1
+        self.counts[index] = count
+        if count == self.hits:
+            self.remaining -= 1
+            return self.remaining == 0
+        return False
+
+    def log_sequence(self, sequence):
+        """Counts every move in a sequence of targets at once.
+
+        Keyword argument:
+        sequence -- target indices in the order they were visited
+        """
+        sequence = np.asarray(sequence)
+        if np.any(sequence[1:] == sequence[:-1]):
+            raise ValueError("A path needs two different targets")
+        before = self.counts < self.hits
+        np.add.at(self.counts, self.table[sequence[:-1], sequence[1:]], 1)
+        self.remaining -= int(np.sum(before & (self.counts >= self.hits)))
+
+    def under_quota(self, current):
+        """Returns the targets whose path from the current one still needs
+        covering.
+
+        Keyword argument:
+        current -- index of the target the subject is on
+        """
+        paths = self.table[current]
+        return [new for new in range(self.targets)
+                if new != current and self.counts[paths[new]] < self.hits]
+
+    def counts_by_name(self):
+        """Returns a dictionary of counts keyed by path name, in the form of
+        the old ClockGame paths dictionary.
+        """
+        return dict((self.path_name(a, b), int(self.counts[self.table[a, b]]))
+                    for a in range(self.targets)
+                    for b in range(self.targets) if a != b)
+
+    def reset(self):
+        """Sets every count back to zero."""
+        self.counts[:] = 0
+        self.remaining = len(self.counts) if self.hits > 0 else 0
+
+
+def balanced_sequence(targets, hits=1, start=0, rng=None):
+    """Returns a list of targets, beginning and ending at start, that covers
+    every path exactly hits times in hits * targets * (targets - 1) moves.
+
+    Keyword arguments:
+    targets -- number of targets
+    hits (optional) -- times each path is covered
+    start (optional) -- target the sequence begins on
+    rng (optional) -- random.Random used to shuffle the order, the random
+                      module by default
+    """
+    rng = rng or random
+    # Moves left to make from each target, shuffled so the order varies.
+    # Every target has as many paths in as out, so Hierholzer's algorithm
+    # always finds a circuit using every one of them.
+    unused = []
+    for current in range(targets):
+        moves = [new for new in range(targets) if new != current] * hits
+        rng.shuffle(moves)
+        unused.append(moves)
+    stack = [start]
+    sequence = []
+    while stack:
+        current = stack[-1]
+        if unused[current]:
+            stack.append(unused[current].pop())
+        else:
+            sequence.append(stack.pop())
+    sequence.reverse()
+    return sequence
+
+
+def _regression():
+    """Checks PathCoverage and balanced_sequence for 4 to 32 targets against
+    a dictionary of paths scanned after every move, the way ClockGame did.
+    Raises AssertionError on any mismatch.
+    """
+    rng = random.Random(0)
+    for targets in (4, 8, 16, 32):
+        for hits in (1, 2, 3):
+            sequence = balanced_sequence(targets, hits, rng=rng)
+            assert len(sequence) == hits * path_count(targets) + 1
+            assert sequence[0] == sequence[-1] == 0
+            coverage = PathCoverage(targets, hits)
+            done = [coverage.log(a, b)
+                    for a, b in zip(sequence, sequence[1:])]
+            assert done.count(True) == 1 and done[-1]
+            assert np.all(coverage.counts == hits)
+
+            batch = PathCoverage(targets, hits)
+            batch.log_sequence(sequence)
+            assert batch.complete and np.all(batch.counts == hits)
+
+            # Random walk, checked against a full scan after each move
+            coverage = PathCoverage(targets, hits)
+            paths = dict(((a, b), 0) for a in range(targets)
+                         for b in range(targets) if a != b)
+            current = 0
+            while True:
+                new = rng.choice([n for n in range(targets) if n != current])
+                coverage.log(current, new)
+                paths[(current, new)] += 1
+                current = new
+                scanned = all(count >= hits for count in paths.values())
+                assert coverage.complete == scanned
+                if scanned:
+                    break
+    print('Coverage and balanced sequences agree for 4, 8, 16 and 32 targets')
+
+
+def _benchmark(games=20):
+    """Plays random games to completion, one target after another as in
+    ClockGame, and times checking for the end of the game with PathCoverage
+    and with the dictionary scan ClockGame used, for 8, 16 and 32 targets.
+
+    Keyword argument:
+    games (optional) -- number of games timed for each target count
+    """
+    from timeit import default_timer
+    rng = random.Random(0)
+    for targets in (8, 16, 32):
+        walks = []
+        for game in range(games):
+            coverage = PathCoverage(targets)
+            walk = [0]
+            while not coverage.complete:
+                new = (walk[-1] + rng.randrange(1, targets)) % targets
+                coverage.log(walk[-1], new)
+                walk.append(new)
+            walks.append(list(zip(walk, walk[1:])))
+        moves = sum(len(pairs) for pairs in walks)
+
+        # Both count the games their check saw end, as ClockGame would
+        scanned = 0
+        start = default_timer()
+        for pairs in walks:
+            paths = dict(((a, b), 0) for a in range(targets)
+                         for b in range(targets) if a != b)
+            for pair in pairs:
+                paths[pair] += 1
+                last_one = True
+                for path in paths:
+                    if paths[path] < 1:
+                        last_one = False
+                        break
+            scanned += last_one
+        scan = default_timer() - start
+
+        tracked = 0
+        start = default_timer()
+        for pairs in walks:
+            coverage = PathCoverage(targets)
+            for current, new in pairs:
+                last_one = coverage.log(current, new)
+            tracked += last_one
+        track = default_timer() - start
+        assert scanned == tracked == games
+
+        start = default_timer()
+        sequence = balanced_sequence(targets, rng=rng)
+        generate = default_timer() - start
+        print('%2d targets  random games average %5d moves; per move dict '
+              'scan %6.2f us, PathCoverage %4.2f us; balanced sequence %d '
+              'moves (%.1f ms)' %
+              (targets, moves // games, 1e6 * scan / moves,
+               1e6 * track / moves, len(sequence) - 1, 1e3 * generate))
+
+
+if __name__ == "__main__":
+    _regression()
+    _benchmark()
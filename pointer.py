@@ -0,0 +1,193 @@
+"""Neuromechanics Lab Latest Sample Slot
+
+Hands the newest pointer position from the Leap listener thread to a render
+loop without going through the pygame event queue. The listener publishes an
+immutable snapshot by replacing a single reference, which is atomic under the
+interpreter lock, so neither side ever waits on the other. The render loop
+reads the slot once per tick and uses the sequence number to tell whether
+anything changed since the last one. Samples the render loop skipped can
+still be kept, in order, for logging.
+
+Run this file directly to compare sample-to-display latency against posting a
+pygame event per sample.
+"""
+
+from collections import deque, namedtuple
+from timeit import default_timer
+
+# One published value: sequence counts up from 1, time is default_timer()
+# when it was published and value is whatever the listener stored.
+Snapshot = namedtuple('Snapshot', 'sequence time value')
+
+EMPTY = Snapshot(0, None, None)
+
+
+class LatestSlot(object):
+    """Holds the most recent snapshot written by a single listener thread.
+    Any number of threads may read it.
+    """
+
+    def __init__(self, keep_history=False, history_size=None):
+        """Keyword arguments:
+        keep_history (optional) -- True to also queue every snapshot for
+                                   drain(), such as for logging
+        history_size (optional) -- most snapshots queued, oldest dropped
+                                   first; None for no limit
+        """
+        self._latest = EMPTY
+        self._history = deque(maxlen=history_size) if keep_history else None
+
+    def publish(self, value, time=None):
+        """Stores a new value. Returns its sequence number. Only one thread
+        should publish to a slot.
+
+        Keyword arguments:
+        value -- value to store; it must not be changed afterwards
+        time (optional) -- time of the sample, default_timer() by default
+        """
+        snapshot = Snapshot(self._latest.sequence + 1,
+                            default_timer() if time is None else time, value)
+        if self._history is not None:
+            self._history.append(snapshot)
+        self._latest = snapshot
+        return snapshot.sequence
+
+    def latest(self):
+        """Returns the newest snapshot, EMPTY if nothing was published."""
+        return self._latest
+
+    def changed_since(self, sequence):
+        """Returns the newest snapshot if it is newer than the given sequence
+        number, otherwise None.
+
+        Keyword argument:
+        sequence -- sequence number of the last snapshot the caller used
+        """
+        snapshot = self._latest
+        if snapshot.sequence != sequence:
+            return snapshot
+        return None
+
+    def drain(self):
+        """Returns every queued snapshot in the order published and empties
+        the queue. Returns an empty list unless keep_history was set.
+        """
+        if self._history is None:
+            return []
+        drained = []
+        pop = self._history.popleft
+        # popleft is atomic, so this is safe while the listener publishes
+        while True:
+            try:
+                drained.append(pop())
+            except IndexError:
+                return drained
+
+
+def _benchmark(seconds=5.0, rate=200, framerate=60, size=(1920, 1080)):
+    """Drives a ClockGame-style listener with the simulated controller and
+    a fill and flip render loop, once posting a pygame event per cursor
+    change and once publishing to a LatestSlot. Prints the time from the
+    listener receiving a sample to the end of the flip that showed it.
+
+    Keyword arguments:
+    seconds (optional) -- length of each run
+    rate (optional) -- frames per second from the controller
+    framerate (optional) -- render loop ticks per second
+    size (optional) -- window size in pixels
+    """
+    import os
+    import numpy as np
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    import fakeleap
+
+    class EventListener(fakeleap.Listener):
+        """Posts a USEREVENT per sample, like ClockLeapListener did."""
+
+        def on_init(self, controller):
+            self.cursor = None
+            self.cost = []
+
+        def on_frame(self, controller):
+            start = default_timer()
+            tip = controller.frame().fingers[0].tip_position
+            self.cursor = (start, (int(tip[0] * 4), int(tip[1] * 4)))
+            pygame.event.post(pygame.event.Event(pygame.USEREVENT,
+                                                 {'pos': self.cursor[1],
+                                                  'time': start}))
+            self.cost.append(default_timer() - start)
+
+    class SlotListener(fakeleap.Listener):
+        def on_init(self, controller):
+            self.pointer = LatestSlot()
+            self.cost = []
+
+        def on_frame(self, controller):
+            start = default_timer()
+            tip = controller.frame().fingers[0].tip_position
+            self.pointer.publish((int(tip[0] * 4), int(tip[1] * 4)), start)
+            self.cost.append(default_timer() - start)
+
+    def run(listener, read):
+        screen = pygame.display.set_mode(size)
+        controller = fakeleap.Controller(
+            fakeleap.TappingMotion(rate=2.0, amplitude=60.0), rate)
+        controller.add_listener(listener)
+        clock = pygame.time.Clock()
+        latencies = []
+        handled = []
+        end = default_timer() + seconds
+        while default_timer() < end:
+            shown = read(listener, handled)
+            if shown:
+                sample_time, pos = shown
+                screen.fill((255, 255, 255))
+                pygame.draw.circle(screen, (255, 0, 0),
+                                   (pos[0] % size[0], pos[1] % size[1]), 15)
+                pygame.display.flip()
+                latencies.append(default_timer() - sample_time)
+            clock.tick(framerate)
+        controller.remove_listener(listener)
+        controller.stop()
+        pygame.event.clear()
+        return (np.array(latencies) * 1e3, np.array(handled),
+                np.array(listener.cost) * 1e6)
+
+    def read_events(listener, handled):
+        events = 0
+        shown = None
+        for event in pygame.event.get():
+            if event.type == pygame.USEREVENT:
+                events += 1
+                # As in ClockGame, each event is handled, but the cursor
+                # drawn is the newest one the listener stored
+                shown = listener.cursor
+        handled.append(events)
+        return shown
+
+    def read_slot(listener, handled):
+        snapshot = listener.pointer.changed_since(read_slot.seen)
+        if snapshot is None:
+            handled.append(0)
+            return None
+        handled.append(snapshot.sequence - read_slot.seen)
+        read_slot.seen = snapshot.sequence
+        return snapshot.time, snapshot.value
+    read_slot.seen = 0
+
+    pygame.display.init()
+    print('Sample to display latency, %d Hz samples, %d fps render, %dx%d' %
+          (rate, framerate, size[0], size[1]))
+    for name, listener, read in (('USEREVENT', EventListener(), read_events),
+                                 ('LatestSlot', SlotListener(), read_slot)):
+        latency, handled, cost = run(listener, read)
+        print('%-10s latency p50 %5.1f  p99 %5.1f ms  samples per tick %.1f  '
+              'on_frame p50 %5.1f us' %
+              (name, np.percentile(latency, 50), np.percentile(latency, 99),
+               handled.mean(), np.percentile(cost, 50)))
+    pygame.display.quit()
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,430 @@
+"""Neuromechanics Lab Rendering
+
+Helpers that keep the feedback windows from redoing work every frame.
+
+DirtyRenderer redraws only the parts of the screen that changed between two
+frames. Each frame is described as a list of circles in drawing order; the
+renderer compares it with the previous frame, restores the damaged areas
+(where a circle was and where it now is) from a cached background, redraws
+every circle overlapping them clipped to those areas, and hands just those
+rects to pygame.display.update.
+
+Redrawing every overlapping circle, not only the ones that moved, is what
+keeps this free of the trails left by the dirty rect version of CornersGame:
+a cursor leaving a target uncovers part of the target, which has to be
+painted again even though the target itself didn't change.
+
+Fonts are loaded once per face and size, rendered text is kept in a small
+least-recently-used cache, and StaticLayer draws the parts of a window that
+only change with the interaction box (outlines, guide lines, labels) once,
+to be blitted in a single call each frame.
+
+Run this file directly to compare frame times against fill and flip at
+1920x1080 and 3840x2160, and the feedback windows with and without caching.
+"""
+
+from collections import OrderedDict
+import pygame
+
+# Circles closer than this are merged into a single update rect
+MERGE_DISTANCE = 8 # pixels
+# Rendered strings kept by a TextCache; a window only shows a few at a time
+TEXT_CACHE_SIZE = 64
+
+_fonts = {}
+
+
+def circle_rect(position, radius):
+    """Returns the rect covering every pixel pygame.draw.circle can touch.
+
+    Keyword arguments:
+    position -- (x, y) center of the circle in pixels
+    radius -- radius of the circle in pixels
+    """
+    return pygame.Rect(position[0] - radius - 1, position[1] - radius - 1,
+                       2 * radius + 3, 2 * radius + 3)
+
+
+def merge_rects(rects, distance=MERGE_DISTANCE):
+    """Combines rects that overlap or lie within a few pixels of each other.
+    Returns a new list with no two rects overlapping.
+
+    Keyword arguments:
+    rects -- list of pygame.Rect
+    distance (optional) -- gap in pixels under which rects are combined
+    """
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        # Merging can make a rect reach others, so keep going until it doesn't
+        touching = True
+        while touching:
+            touching = False
+            grown = rect.inflate(2 * distance, 2 * distance)
+            for n in range(len(merged) - 1, -1, -1):
+                if grown.colliderect(merged[n]):
+                    rect.union_ip(merged.pop(n))
+                    touching = True
+        merged.append(rect)
+    return merged
+
+
+class DirtyRenderer(object):
+    """Draws frames made of filled circles onto a fixed background, updating
+    only the damaged parts of the display.
+    """
+
+    def __init__(self, screen, background=(255, 255, 255)):
+        """Keyword arguments:
+        screen -- display surface from pygame.display.set_mode
+        background (optional) -- RGB color or a surface the size of the
+                                 screen to draw the circles over
+        """
+        self.screen = screen
+        if isinstance(background, pygame.Surface):
+            self.background = background.convert()
+        else:
+            self.background = pygame.Surface(screen.get_size()).convert()
+            self.background.fill(background)
+        self._bounds = screen.get_rect()
+        self._previous = []
+        self._full = True
+
+    def invalidate(self):
+        """Makes the next draw repaint and update the whole screen."""
+        self._full = True
+
+    def draw(self, circles):
+        """Draws a frame. Returns the list of rects that were updated.
+
+        Keyword argument:
+        circles -- list of (color, (x, y), radius) tuples, drawn in order so
+                   later circles cover earlier ones
+        """
+        current = [(tuple(color), (int(position[0]), int(position[1])),
+                    int(radius)) for color, position, radius in circles]
+        if self._full:
+            self._full = False
+            self.screen.blit(self.background, (0, 0))
+            for color, position, radius in current:
+                pygame.draw.circle(self.screen, color, position, radius)
+            self._previous = current
+            pygame.display.update()
+            return [self._bounds]
+
+        # Circles that disappeared or appeared, including any that moved,
+        # grew or changed color
+        changed = set(self._previous).symmetric_difference(current)
+        if not changed:
+            return []
+        damaged = [rect for rect in merge_rects(
+                       [circle_rect(position, radius)
+                        for color, position, radius in changed])
+                   if rect.colliderect(self._bounds)]
+        damaged = [rect.clip(self._bounds) for rect in damaged]
+        boxes = [circle_rect(position, radius)
+                 for color, position, radius in current]
+        for rect in damaged:
+            self.screen.set_clip(rect)
+            self.screen.blit(self.background, rect, rect)
+            for circle, box in zip(current, boxes):
+                if box.colliderect(rect):
+                    pygame.draw.circle(self.screen, *circle)
+        self.screen.set_clip(None)
+        self._previous = current
+        pygame.display.update(damaged)
+        return damaged
+
+
+def get_font(size, face=None):
+    """Returns a pygame Font, loading it only the first time it is asked
+    for.
+
+    Keyword arguments:
+    size -- height of the font in pixels
+    face (optional) -- path of a font file, None for pygame's default font
+    """
+    key = (face, size)
+    font = _fonts.get(key)
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        font = _fonts[key] = pygame.font.Font(face, size)
+    return font
+
+
+class TextCache(object):
+    """Rendered text surfaces, keyed by string, color and font. The least
+    recently used surface is dropped once the cache is full.
+    """
+
+    def __init__(self, capacity=TEXT_CACHE_SIZE):
+        """Keyword argument:
+        capacity (optional) -- most surfaces kept at once
+        """
+        self.capacity = capacity
+        self._surfaces = OrderedDict()
+
+    def render(self, text, color, size, face=None):
+        """Returns a surface with the text drawn on it, antialiased.
+
+        Keyword arguments:
+        text -- string to draw
+        color -- RGB color of the text
+        size -- font size in pixels
+        face (optional) -- path of a font file, None for the default font
+        """
+        key = (text, tuple(color), size, face)
+        surface = self._surfaces.pop(key, None)
+        if surface is None:
+            surface = get_font(size, face).render(text, 1, color)
+            if len(self._surfaces) >= self.capacity:
+                self._surfaces.popitem(last=False)
+        self._surfaces[key] = surface
+        return surface
+
+    def blit(self, screen, text, center, color, size, face=None):
+        """Draws text centered on a point. Returns the rect drawn to.
+
+        Keyword arguments:
+        screen -- surface to draw on
+        text -- string to draw
+        center -- (x, y) point the text is centered on
+        color, size, face -- as for render()
+        """
+        surface = self.render(text, color, size, face)
+        rect = surface.get_rect()
+        rect.center = (int(center[0]), int(center[1]))
+        return screen.blit(surface, rect)
+
+
+class StaticLayer(object):
+    """Part of a window that is drawn once and blitted every frame. It is
+    drawn again only when its key, such as the interaction box size, changes.
+    """
+
+    def __init__(self, size, draw, background=(255, 255, 255)):
+        """Keyword arguments:
+        size -- (width, height) of the layer in pixels
+        draw -- function called as draw(surface, *key) to paint the layer
+        background (optional) -- RGB color the layer is cleared to first
+        """
+        self.surface = pygame.Surface(size)
+        if pygame.display.get_surface():
+            # Match the display format so blitting needs no conversion
+            self.surface = self.surface.convert()
+        self.draw = draw
+        self.background = background
+        self._key = None
+
+    def blit(self, screen, *key):
+        """Copies the layer onto the screen, redrawing it first if the key
+        differs from the last call.
+
+        Keyword arguments:
+        screen -- surface to draw on, usually the whole window
+        key -- values the layer depends on, passed on to draw
+        """
+        if key != self._key:
+            self.surface.fill(self.background)
+            self.draw(self.surface, *key)
+            self._key = key
+        screen.blit(self.surface, (0, 0))
+
+
+def _benchmark(frames=600):
+    """Plays back a scripted Clock Game at each resolution, drawing it with
+    fill and flip and with DirtyRenderer, and prints frame times and pixels
+    sent to the display. Every 25th frame drawn by DirtyRenderer is checked
+    against a full redraw to make sure nothing is left behind.
+
+    Keyword argument:
+    frames (optional) -- number of frames drawn per run
+    """
+    import math, os
+    import numpy as np
+    from timeit import default_timer
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+    WHITE = (255, 255, 255)
+    BLACK = (0, 0, 0)
+    GREEN = (0, 255, 0)
+    RED = (255, 0, 0)
+    TARGET_SIZE = 50
+
+    def script(size):
+        """Yields the circles of each frame: the cursor sweeps between four
+        targets and the loading circle grows while it is inside one.
+        """
+        w, h = size
+        locations = [(200, 200), (w - 200, 200), (200, h - 200),
+                     (w - 200, h - 200)]
+        for n in range(frames):
+            target = locations[(n // 120) % 4]
+            angle = 2 * math.pi * n / 240.0
+            cursor = (int(w / 2 + (w / 2 - 150) * math.cos(angle)),
+                      int(h / 2 + (h / 2 - 150) * math.sin(3 * angle)))
+            circles = [(BLACK, target, TARGET_SIZE)]
+            if (n // 30) % 2:
+                circles.append((GREEN, target, (n % 30) * TARGET_SIZE // 30))
+            circles.append((RED, cursor, 15 + n % 5))
+            yield circles
+
+    def full(screen, circles):
+        screen.fill(WHITE)
+        for circle in circles:
+            pygame.draw.circle(screen, *circle)
+        pygame.display.flip()
+
+    pygame.display.init()
+    for size in ((1920, 1080), (3840, 2160)):
+        screen = pygame.display.set_mode(size)
+        reference = pygame.Surface(size)
+
+        times = []
+        for circles in script(size):
+            start = default_timer()
+            full(screen, circles)
+            times.append(default_timer() - start)
+        flip_ms = np.array(times) * 1e3
+
+        renderer = DirtyRenderer(screen, WHITE)
+        times = []
+        pixels = 0
+        mismatches = 0
+        for n, circles in enumerate(script(size)):
+            start = default_timer()
+            rects = renderer.draw(circles)
+            times.append(default_timer() - start)
+            pixels += sum(rect.w * rect.h for rect in rects)
+            if n % 25 == 0:
+                reference.fill(WHITE)
+                for circle in circles:
+                    pygame.draw.circle(reference, *circle)
+                if pygame.image.tostring(reference, 'RGB') != \
+                   pygame.image.tostring(screen, 'RGB'):
+                    mismatches += 1
+        dirty_ms = np.array(times) * 1e3
+
+        print('%dx%d, %d frames' % (size + (frames,)))
+        print('    fill+flip      p50 %6.3f  p99 %6.3f ms  %6.2f Mpx/frame' %
+              (np.percentile(flip_ms, 50), np.percentile(flip_ms, 99),
+               size[0] * size[1] / 1e6))
+        print('    DirtyRenderer  p50 %6.3f  p99 %6.3f ms  %6.2f Mpx/frame  '
+              '%d of %d checked frames differ' %
+              (np.percentile(dirty_ms, 50), np.percentile(dirty_ms, 99),
+               pixels / 1e6 / frames, mismatches, (frames + 24) // 25))
+    pygame.display.quit()
+
+
+def _text_benchmark(frames=600):
+    """Draws the visual.py and Tapping feedback windows the way they were
+    drawn before, creating the font and rendering every label each frame,
+    and with a StaticLayer and TextCache, then prints the time per frame.
+
+    Keyword argument:
+    frames (optional) -- number of frames drawn per run
+    """
+    import os
+    import numpy as np
+    from timeit import default_timer
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+    WHITE = (255, 255, 255)
+    BLACK = (0, 0, 0)
+    RED = (255, 0, 0)
+    BLUE = (0, 0, 255)
+    BUFF, STROKE, FONT_SIZE = 40, 5, 20
+    # Interaction box of the Leap, in millimeters drawn as pixels
+    w, h, d = 235, 235, 147
+
+    def views(surface, w, h, d, text=None):
+        pygame.draw.rect(surface, RED, (BUFF, BUFF, w, d), STROKE)
+        pygame.draw.rect(surface, RED, (BUFF, 2*BUFF+d, w, h), STROKE)
+        pygame.draw.rect(surface, RED, (2*BUFF+w, 2*BUFF+d, d, h), STROKE)
+        labels = (("Top View", (BUFF+w/2, BUFF/2)),
+                  ("Front View", (BUFF+w/2, 3*BUFF/2+d)),
+                  ("Right View", (2*BUFF+w+d/2, 3*BUFF/2+d)))
+        if text is None:
+            font = pygame.font.Font(None, FONT_SIZE)
+        for label, center in labels:
+            if text is None:
+                surface_text = font.render(label, 1, BLACK)
+                rect = surface_text.get_rect()
+                rect.center = (int(center[0]), int(center[1]))
+                surface.blit(surface_text, rect)
+            else:
+                text.blit(surface, label, center, BLACK, FONT_SIZE)
+
+    def guides(surface, w, h):
+        pygame.draw.rect(surface, RED, (BUFF, BUFF, w, h), STROKE)
+        pygame.draw.line(surface, BLACK, (BUFF+w/2-10, BUFF+h/2),
+                         (BUFF+w/2+10, BUFF+h/2))
+        pygame.draw.line(surface, BLACK, (BUFF+w/2, BUFF+h/2-10),
+                         (BUFF+w/2, BUFF+h/2+10))
+        pygame.draw.line(surface, BLUE, (BUFF, 140), (BUFF+w, 140))
+        pygame.draw.line(surface, BLUE, (BUFF, 190), (BUFF+w, 190))
+
+    def visual_before(screen, n):
+        screen.fill(WHITE)
+        views(screen, w, h, d)
+        pygame.draw.circle(screen, BLACK, (100 + n % 100, 100), 15)
+
+    def tapping_before(screen, n):
+        screen.fill(WHITE)
+        guides(screen, w, h)
+        font = pygame.font.Font(None, FONT_SIZE)
+        label = font.render("Trial #1, taps: " + str(n // 15), 1, BLACK)
+        rect = label.get_rect()
+        rect.center = (int(BUFF + w/2), int(BUFF/2))
+        screen.blit(label, rect)
+        pygame.draw.circle(screen, BLACK, (100, 100 + n % 100), 5)
+
+    def time_frames(size, draw):
+        screen = pygame.display.set_mode(size)
+        draw = draw(screen)
+        times = np.empty(frames)
+        for n in range(frames):
+            start = default_timer()
+            draw(n)
+            times[n] = default_timer() - start
+        return times * 1e6
+
+    def visual_after(screen):
+        text = TextCache()
+        layer = StaticLayer(screen.get_size(),
+                            lambda s, w, h, d: views(s, w, h, d, text))
+        def draw(n):
+            layer.blit(screen, w, h, d)
+            pygame.draw.circle(screen, BLACK, (100 + n % 100, 100), 15)
+        return draw
+
+    def tapping_after(screen):
+        text = TextCache()
+        layer = StaticLayer(screen.get_size(), guides)
+        def draw(n):
+            layer.blit(screen, w, h)
+            text.blit(screen, "Trial #1, taps: " + str(n // 15),
+                      (BUFF + w/2, BUFF/2), BLACK, FONT_SIZE)
+            pygame.draw.circle(screen, BLACK, (100, 100 + n % 100), 5)
+        return draw
+
+    pygame.display.init()
+    pygame.font.init()
+    visual_size = (525, 500)
+    tapping_size = (w + 2 * BUFF, h + 2 * BUFF)
+    print('Feedback window render time per frame, %d frames' % frames)
+    for name, size, before, after in (
+            ('visual.py', visual_size, visual_before, visual_after),
+            ('Tapping', tapping_size, tapping_before, tapping_after)):
+        old = time_frames(size, lambda screen: lambda n: before(screen, n))
+        new = time_frames(size, after)
+        print('%-10s before p50 %7.1f us  after p50 %7.1f us  (%.1fx)' %
+              (name, np.percentile(old, 50), np.percentile(new, 50),
+               np.percentile(old, 50) / np.percentile(new, 50)))
+    pygame.display.quit()
+
+
+if __name__ == "__main__":
+    _benchmark()
+    _text_benchmark()
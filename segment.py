@@ -0,0 +1,378 @@
+"""Neuromechanics Lab Trial Segmentation
+
+Tapping_0.4.py can record the whole protocol as one continuous stream
+instead of starting over for every trial. The trials are then cut out of the
+stream afterwards, from events logged while it ran:
+
+    start    -- the finger crossed the lower line and a trial began
+    end      -- the trial's time ran out; carries the taps counted live
+    restart  -- the trials before this time didn't agree with each other
+                and were thrown away
+
+Each event is a dictionary with at least 'time', host time in seconds as
+returned by timing.now(), and 'kind'. The stream is saved as a session file
+with the events in its header, so an old recording can be cut again later
+with different rules: a longer or shorter pre-trigger window, a different
+trial length, or trial starts found again from the finger's path.
+
+Usage:
+    python segment.py recording.nmls [--pre ROWS] [--duration S]
+                      [--retrigger] [--output FOLDER]
+    python segment.py --benchmark
+"""
+
+from __future__ import print_function
+import argparse, os, re, sys
+import numpy as np
+
+import session
+from fingers import FINGER_NAMES
+from timing import now
+from writer import StreamWriter
+
+START = 'start'
+END = 'end'
+RESTART = 'restart'
+# Appended to the Tapping file name in place of the trial number
+SUFFIX = '_continuous'
+
+
+class EventLog(object):
+    """Trial boundaries logged while a continuous recording runs."""
+
+    def __init__(self):
+        self.events = []
+
+    def log(self, kind, time=None, **values):
+        """Adds an event and returns it.
+
+        Keyword arguments:
+        kind -- START, END or RESTART
+        time (optional) -- host time of the event, now by default
+        values (optional) -- anything else to keep with the event
+        """
+        event = dict(values, kind=kind, time=now() if time is None else time)
+        self.events.append(event)
+        return event
+
+
+def trials(events):
+    """Returns the start time, end time and taps counted of every finished
+    trial since the last restart, in order.
+
+    Keyword argument:
+    events -- list of event dictionaries
+    """
+    events = sorted(events, key=lambda event: event['time'])
+    restarts = [event['time'] for event in events if event['kind'] == RESTART]
+    kept = []
+    start = None
+    for event in events:
+        if event['kind'] == START:
+            start = event['time']
+        elif event['kind'] == END and start is not None:
+            if not restarts or start >= restarts[-1]:
+                kept.append((start, event['time'], event.get('taps')))
+            start = None
+    return kept
+
+
+def segment(times, starts, ends=None, duration=None, pre=0):
+    """Finds the rows of every trial in a continuous recording at once.
+    Returns two index arrays, the first row of each trial and one past its
+    last row.
+
+    Keyword arguments:
+    times -- sorted time of every row
+    starts -- start time of each trial
+    ends (optional) -- end time of each trial, rows at this time included
+    duration (optional) -- trial length in seconds, used when ends is None
+    pre (optional) -- rows kept from before each start
+    """
+    times = np.asarray(times, float)
+    starts = np.asarray(starts, float)
+    if ends is None:
+        if duration is None:
+            raise ValueError("either ends or duration must be given")
+        ends = starts + duration
+    first = np.searchsorted(times, starts, 'left') - pre
+    stop = np.searchsorted(times, np.asarray(ends, float), 'right')
+    return np.maximum(first, 0), stop
+
+
+def finger_height(data, columns):
+    """Returns the height of the first visible finger in every row, NaN
+    where no finger was seen; the finger the Tapping display follows.
+
+    Keyword arguments:
+    data -- 2D array of a Tapping recording
+    columns -- column names of data
+    """
+    first = list(columns).index(session.FINGER_COLUMNS[1])
+    heights = data[:, first:first + len(session.FINGER_COLUMNS):3]
+    seen = ~np.isnan(heights)
+    slot = np.argmax(seen, axis=1)
+    return np.where(seen.any(axis=1),
+                    heights[np.arange(len(data)), slot], np.nan)
+
+
+def crossings(times, y, upper, lower, after):
+    """Finds trial starts again from the finger's path, with the rule the
+    Tapping display uses: the first drop below the lower line once the
+    finger has been above the upper one. Returns the start time found after
+    each of the given times, NaN where the finger never crossed.
+
+    Keyword arguments:
+    times -- sorted time of every row
+    y -- finger height at each row
+    upper, lower -- heights of the two lines, in millimeters
+    after -- times from which to look for each start
+    """
+    times = np.asarray(times, float)
+    above = np.nonzero(y > upper)[0]
+    below = np.nonzero(y < lower)[0]
+    found = np.full(len(after), np.nan)
+    if not len(above) or not len(below):
+        return found
+    # First row above the upper line after each time, then the first row
+    # below the lower line after that
+    armed = np.searchsorted(above, np.searchsorted(times, after))
+    valid = armed < len(above)
+    crossed = np.searchsorted(below, above[np.minimum(armed,
+                                                      len(above) - 1)])
+    valid &= crossed < len(below)
+    found[valid] = times[below[crossed[valid]]]
+    return found
+
+
+def to_array(rows, columns=session.TAPPING_COLUMNS):
+    """Returns Tapping rows, with blanks for missing fingers, as a 2D array
+    with NaN in their place.
+
+    Keyword arguments:
+    rows -- list of rows as recorded by TapListener
+    columns (optional) -- column names of the rows
+    """
+    data = np.full((len(rows), len(columns)), np.nan)
+    for n, row in enumerate(rows):
+        data[n, :len(row)] = [np.nan if x == '' else x for x in row]
+    return data
+
+
+def to_rows(data, origin=0.0):
+    """Returns a 2D array as rows for write_trial(), with blanks for NaN and
+    times counted from the origin.
+
+    Keyword arguments:
+    data -- 2D array with the time in its first column
+    origin (optional) -- host time that becomes zero
+    """
+    rows = []
+    for row in data.tolist():
+        row[0] -= origin
+        rows.append(['' if x != x else x for x in row])
+    return rows
+
+
+def write_trial(filename, rows, taps):
+    """Writes one trial in the Tapping CSV layout.
+
+    Keyword arguments:
+    filename -- path of the CSV file
+    rows -- time and fingertip positions of every frame, blanks for missing
+    taps -- taps counted during the trial
+    """
+    writer = StreamWriter(filename, header=(
+        'Position Data for Tapping Exercise, Total Taps:,%s\n'
+        'Time (s),Thumb,,,Index,,,Middle,,,Ring,,,Pinky\n'
+        ',x,y,z,x,y,z,x,y,z,x,y,z,x,y,z\n' % taps))
+    writer.write_rows(rows)
+    writer.close()
+
+
+def save_recording(filename, data, events, **extra):
+    """Writes a continuous Tapping recording and its events to a session
+    file.
+
+    Keyword arguments:
+    filename -- path of the session file
+    data -- 2D array in session.TAPPING_COLUMNS
+    events -- list of event dictionaries
+    extra (optional) -- other values for the header, such as the line
+                        heights and the pre-trigger rows
+    """
+    header = session.make_header('tapping', session.TAPPING_COLUMNS,
+                                 fingers=list(FINGER_NAMES), events=events,
+                                 **extra)
+    session.write_session(filename, header, data)
+
+
+def split(filename, pre=None, duration=None, retrigger=False, output=None):
+    """Cuts a continuous recording into one Tapping CSV per trial, named
+    like the ones written live. Returns the paths written.
+
+    Keyword arguments:
+    filename -- path of the session file
+    pre (optional) -- rows kept from before each start, the recording's
+                      pre-trigger rows by default
+    duration (optional) -- trial length in seconds, by default each trial
+                           ends where it ended live
+    retrigger (optional) -- True to find the starts again from the finger's
+                            path instead of using the logged ones
+    output (optional) -- folder for the CSV files, that of the recording by
+                         default
+    """
+    recording = session.Session(filename)
+    header = recording.header
+    kept = trials(header.get('events', []))
+    times = recording['time']
+    starts = np.array([trial[0] for trial in kept])
+    ends = None if duration else np.array([trial[1] for trial in kept])
+    if retrigger:
+        # Look from the end of the trial before, or the recording's start
+        after = np.concatenate([[times[0] if len(times) else 0.0],
+                                [trial[1] for trial in kept[:-1]]])
+        y = finger_height(recording.data, recording.columns)
+        starts = crossings(times, y, header['upper'], header['lower'], after)
+        if ends is not None:
+            ends = starts + np.array([trial[1] - trial[0]
+                                      for trial in kept])
+    if pre is None:
+        pre = header.get('pre_trigger', 0)
+    first, stop = segment(times, starts, ends, duration, pre)
+
+    folder = output or os.path.dirname(filename)
+    name = re.sub(re.escape(SUFFIX) + '$', '',
+                  os.path.splitext(os.path.basename(filename))[0])
+    written = []
+    for n, (start, a, b, trial) in enumerate(zip(starts, first, stop, kept)):
+        if start != start:
+            print("Trial", n + 1, "has no start in", filename)
+            continue
+        path = os.path.join(folder, name + '_' + str(n + 1) + '.csv')
+        write_trial(path, to_rows(recording.data[a:b], start), trial[2])
+        written.append(path)
+    return written
+
+
+def _benchmark(hours=1.0, rate=200, count=100, setups=10):
+    """Times cutting trials out of a synthetic recording with segment()
+    against a loop over its rows, then the dead time between two trials
+    when the device and display are set up again for every trial against a
+    continuous recording. The fake Leap and a dummy display stand in for
+    the device and screen.
+
+    Keyword arguments:
+    hours (optional) -- length of the synthetic recording
+    rate (optional) -- frames per second of the recording
+    count (optional) -- trials of 10 s spread over the recording
+    setups (optional) -- trial changes timed for each mode
+    """
+    import time
+    from timeit import default_timer
+
+    rows = int(hours * 3600 * rate)
+    times = np.arange(rows) / float(rate)
+    starts = np.linspace(5.0, times[-1] - 15.0, count)
+    ends = starts + 10.0
+
+    def loop():
+        first, stop = [], []
+        n = 0
+        for start, end in zip(starts, ends):
+            while times[n] < start:
+                n += 1
+            first.append(n)
+            while n < rows and times[n] <= end:
+                n += 1
+            stop.append(n)
+        return first, stop
+
+    print('Cutting %d trials out of %d rows (%.1f h at %d fps)' %
+          (len(starts), rows, hours, rate))
+    expected = None
+    for name, cut in (('loop over rows', loop),
+                      ('segment()', lambda: segment(times, starts, ends))):
+        begin = default_timer()
+        first, stop = cut()
+        elapsed = default_timer() - begin
+        first, stop = list(first), list(stop)
+        if expected is None:
+            expected = (first, stop)
+        print('  %-16s %9.3f ms  %s' % (name, elapsed * 1e3,
+              'same rows' if (first, stop) == expected else 'DIFFERENT'))
+
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    import pygame
+    import fakeleap
+    from acquisition import wait_for_device
+    from render import StaticLayer
+    from taps import TapCounter
+
+    class Recorder(fakeleap.Listener):
+        def __init__(self):
+            self.times = []
+
+        def on_frame(self, controller):
+            self.times.append(default_timer())
+
+    pygame.init()
+    size = (315, 315)
+    print('Dead time between trials, %d trial changes each' % setups)
+    for continuous in (False, True):
+        setup_times, gaps = [], []
+        controller = recorder = None
+        previous = [] # Frame times recorded up to the trial before
+        for n in range(setups + 1):
+            begin = default_timer()
+            if controller is None:
+                controller = fakeleap.Controller(fakeleap.TappingMotion())
+                recorder = Recorder()
+                wait_for_device(controller)
+                controller.add_listener(recorder)
+                pygame.display.set_mode(size)
+                StaticLayer(size, lambda surface, w, h: None, (255, 255, 255))
+            TapCounter(240.0, 190.0)
+            ready = default_timer()
+            while len(recorder.times) < 2 or recorder.times[-1] < ready:
+                time.sleep(0.001)
+            if n:
+                setup_times.append(ready - begin)
+                # Time from the last frame of the trial before to the first
+                # frame recorded for this one
+                gaps.append(min(t for t in recorder.times if t >= begin) -
+                            max(t for t in previous if t < begin))
+            previous = recorder.times
+            time.sleep(0.05) # The trial
+            if not continuous:
+                controller.remove_listener(recorder)
+                controller.stop()
+                controller = None
+        if controller is not None:
+            controller.stop()
+        print('  %-24s setup %7.2f ms, frames missing for %7.2f ms' %
+              ('continuous recording' if continuous else 'new device per trial',
+               np.median(setup_times) * 1e3, np.median(gaps) * 1e3))
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['--benchmark']:
+        _benchmark()
+        sys.exit()
+    parser = argparse.ArgumentParser(
+        description="Cut a continuous Tapping recording into trials.")
+    parser.add_argument('recording', help="session file of the recording")
+    parser.add_argument('--pre', type=int, default=None,
+                        help="rows kept from before each start")
+    parser.add_argument('--duration', type=float, default=None,
+                        help="trial length in seconds")
+    parser.add_argument('--retrigger', action='store_true',
+                        help="find trial starts again from the finger's path")
+    parser.add_argument('--output', default=None,
+                        help="folder for the CSV files")
+    args = parser.parse_args()
+    for path in split(args.recording, args.pre, args.duration,
+                      args.retrigger, args.output):
+        print(path)
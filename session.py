@@ -0,0 +1,327 @@
+"""Neuromechanics Lab Binary Session Format
+
+A compact replacement for the CSV files written by the loggers. Values are
+stored as fixed-size binary records, so loading a session is a memory map
+rather than parsing every number back out of text.
+
+File layout (all integers little-endian):
+
+    offset  size  contents
+    0       8     magic bytes b'NMLSESS1'
+    8       4     uint32 header length in bytes, including padding
+    12      n     header: UTF-8 JSON object, padded with spaces so the
+                  records start on an 8-byte boundary
+    12+n    ...   frame records, back to back until the end of the file
+
+The header holds at least:
+
+    task     -- 'postural', 'tapping', 'clock', 'corners', or another task
+                name
+    subject  -- subject name, '' when unknown
+    hand     -- 'left', 'right' or ''
+    date     -- recording date as MM/DD/YYYY, '' when unknown
+    dtype    -- NumPy type of every value, '<f8' or '<f4'
+    columns  -- list of column names, one per value in a record
+
+Any other keys (tap counts, capture statistics, notes) are carried along
+untouched. The number of frames is not stored; it is the size of the record
+area divided by the record size, so a file cut short by a crash still loads
+up to its last whole record. Missing values, such as fingers that weren't
+visible, are NaN.
+
+Run this file with CSV paths as arguments to convert them, or with no
+arguments to benchmark loading against CSV parsing.
+"""
+
+import json, os, re, struct, sys
+import numpy as np
+
+import framebuffer
+from paths import CORNER_NAMES
+from fingers import FINGER_NAMES
+from writer import BinaryEncoder, StreamWriter
+
+MAGIC = b'NMLSESS1'
+ALIGNMENT = 8
+EXTENSION = '.nmls'
+
+# Column names of the CSV layouts written by each task
+POSTURAL_COLUMNS = framebuffer.COLUMN_NAMES
+FINGER_COLUMNS = tuple('finger%d_%s' % (n + 1, axis)
+                       for n in range(framebuffer.MAX_FINGERS)
+                       for axis in 'xyz')
+TAPPING_COLUMNS = ('time',) + FINGER_COLUMNS
+CLOCK_COLUMNS = ('time_ms',) + FINGER_COLUMNS
+# CornersGame also records the target shown, as its index in CORNER_NAMES,
+# and the speed of the first finger
+CORNERS_COLUMNS = ('time_ms', 'target', 'speed') + FINGER_COLUMNS
+
+_TYPE_CODES = {'<f8': 'd', '<f4': 'f'}
+
+
+def encode_header(header):
+    """Returns the magic bytes, header length and padded JSON header as a
+    single byte string ready to be written at the start of a session file.
+
+    Keyword argument:
+    header -- dictionary of session information, including columns and dtype
+    """
+    text = json.dumps(header, sort_keys=True).encode('utf-8')
+    end = len(MAGIC) + 4 + len(text)
+    text += b' ' * (-end % ALIGNMENT)
+    return MAGIC + struct.pack('<I', len(text)) + text
+
+
+def make_header(task, columns, dtype='<f8', subject='', hand='', date='',
+                **extra):
+    """Builds a session header dictionary.
+
+    Keyword arguments:
+    task -- name of the task that produced the data
+    columns -- sequence of column names
+    dtype (optional) -- '<f8' for float64 records or '<f4' for float32
+    subject, hand, date (optional) -- as recorded by CornersGame
+    extra (optional) -- any other values to keep in the header
+    """
+    if dtype not in _TYPE_CODES:
+        raise ValueError("dtype must be one of " + ", ".join(_TYPE_CODES))
+    header = dict(extra)
+    header.update(task=task, columns=list(columns), dtype=dtype,
+                  subject=subject, hand=hand, date=date)
+    return header
+
+
+class SessionWriter(StreamWriter):
+    """StreamWriter that writes a binary session file. Rows shorter than the
+    column list are padded with NaN.
+    """
+
+    def __init__(self, filename, header, **kwargs):
+        """Keyword arguments:
+        filename -- path of the session file to create
+        header -- dictionary from make_header()
+        kwargs (optional) -- passed on to StreamWriter
+        """
+        encoder = BinaryEncoder(len(header['columns']),
+                                _TYPE_CODES[header['dtype']])
+        StreamWriter.__init__(self, filename, encoder,
+                              encode_header(header), **kwargs)
+
+
+def write_session(filename, header, data):
+    """Writes a whole session at once.
+
+    Keyword arguments:
+    filename -- path of the session file to create
+    header -- dictionary from make_header()
+    data -- 2D array with one row per frame and one column per header column
+    """
+    data = np.asarray(data, dtype=header['dtype'])
+    if data.ndim != 2 or data.shape[1] != len(header['columns']):
+        raise ValueError("data must have one column per header column")
+    with open(filename, 'wb') as f:
+        f.write(encode_header(header))
+        f.write(np.ascontiguousarray(data).tobytes())
+
+
+class Session(object):
+    """A session file opened as a read-only memory map. Columns are NumPy
+    views into the mapped file, so nothing is read from disk until it is
+    used. Arrays taken from a Session keep the file mapped while they exist.
+    """
+
+    def __init__(self, filename):
+        """Reads the header and maps the records of a session file.
+
+        Keyword argument:
+        filename -- path of the session file
+        """
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(filename + " is not a session file")
+            length = struct.unpack('<I', f.read(4))[0]
+            self.header = json.loads(f.read(length).decode('utf-8'))
+        self.columns = tuple(self.header['columns'])
+        dtype = np.dtype(self.header['dtype'])
+        offset = len(MAGIC) + 4 + length
+        frames = (os.path.getsize(filename) - offset) // \
+                 (dtype.itemsize * len(self.columns))
+        if frames > 0:
+            self.data = np.memmap(filename, dtype, 'r', offset,
+                                  (frames, len(self.columns)))
+        else:
+            self.data = np.empty((0, len(self.columns)), dtype)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def column(self, name):
+        """Returns one column as a view into the mapped file.
+
+        Keyword argument:
+        name -- column name from the header, or a column index
+        """
+        if not isinstance(name, int):
+            name = self.columns.index(name)
+        return self.data[:, name]
+
+
+def _read_csv_rows(lines):
+    """Parses CSV data rows, dropping the trailing comma the loggers write.
+    Returns a 2D float64 array padded with NaN to the widest row.
+    """
+    rows = []
+    for line in lines:
+        values = line.rstrip('\r\n').split(',')
+        if values and values[-1] == '':
+            values.pop()
+        if values:
+            rows.append([float(v) if v else np.nan for v in values])
+    width = max(len(row) for row in rows) if rows else 0
+    data = np.full((len(rows), width), np.nan)
+    for n, row in enumerate(rows):
+        data[n, :len(row)] = row
+    return data
+
+
+def _fit(data, columns):
+    """Pads or trims data to the given number of columns."""
+    out = np.full((len(data), columns), np.nan)
+    width = min(columns, data.shape[1])
+    out[:, :width] = data[:, :width]
+    return out
+
+
+def read_csv(filename):
+    """Reads a CSV file written by Postural_1.1.py, Tapping_0.4.py,
+    ClockGame_1.1.py or CornersGame. Returns a header dictionary and a 2D
+    array of data in the matching fixed column layout.
+
+    Keyword argument:
+    filename -- path of the CSV file
+    """
+    with open(filename) as f:
+        lines = f.readlines()
+    first = lines[0] if lines else ''
+    # Recording date, if the file name carries a logger timestamp
+    date = ''
+    found = re.search(r'_(\d{4})(\d{2})(\d{2})\d{4,6}', filename)
+    if found:
+        date = found.group(2) + '/' + found.group(3) + '/' + found.group(1)
+    # Files written with a FingerTracker name their finger columns
+    extra = {}
+    if any('Thumb,' in line for line in lines[1:3]):
+        extra['fingers'] = list(FINGER_NAMES)
+
+    if first.startswith('Postural Tremor Data'):
+        raw = _read_csv_rows(lines[3:])
+        data = np.full((len(raw), len(POSTURAL_COLUMNS)), np.nan)
+        palm = framebuffer.FINGER_COUNT
+        data[:, :palm] = _fit(raw, palm)
+        fingers = _fit(raw[:, palm:], 3 * framebuffer.MAX_FINGERS)
+        data[:, framebuffer.FINGERTIPS] = fingers
+        data[:, palm] = np.sum(~np.isnan(fingers[:, ::3]), axis=1)
+        return make_header('postural', POSTURAL_COLUMNS, date=date,
+                           **extra), data
+    elif first.startswith('Position Data for Tapping'):
+        taps = first.rstrip().split(',')[-1]
+        data = _fit(_read_csv_rows(lines[3:]), len(TAPPING_COLUMNS))
+        header = make_header('tapping', TAPPING_COLUMNS, date=date,
+                             taps=int(taps) if taps.isdigit() else None,
+                             **extra)
+        return header, data
+    elif first.startswith('Time (ms),Position Data for Clock Game'):
+        data = _fit(_read_csv_rows(lines[2:]), len(CLOCK_COLUMNS))
+        return make_header('clock', CLOCK_COLUMNS, date=date), data
+    elif first.startswith('Subject:,'):
+        # Subject:,name,Hand:,hand,Date:,MM/DD/YYYY
+        fields = first.rstrip().split(',') + [''] * 6
+        targets = dict((name, str(n)) for n, name in enumerate(CORNER_NAMES))
+        rows = []
+        for line in lines[3:]:
+            values = line.split(',', 2)
+            if len(values) == 3:
+                values[1] = targets.get(values[1], '')
+                rows.append(','.join(values))
+        data = _fit(_read_csv_rows(rows), len(CORNERS_COLUMNS))
+        return make_header('corners', CORNERS_COLUMNS, subject=fields[1],
+                           hand=fields[3], date=fields[5], **extra), data
+    raise ValueError("Unrecognized CSV layout in " + filename)
+
+
+def convert_csv(filename, output=None, dtype='<f8'):
+    """Converts a logger CSV file into a session file. Returns the path of
+    the new file.
+
+    Keyword arguments:
+    filename -- path of the CSV file
+    output (optional) -- path of the session file, defaults to the CSV path
+                         with the .nmls extension
+    dtype (optional) -- '<f8' to keep full precision or '<f4' for half size
+    """
+    header, data = read_csv(filename)
+    header['dtype'] = dtype
+    header['source'] = os.path.basename(filename)
+    if output is None:
+        output = os.path.splitext(filename)[0] + EXTENSION
+    write_session(output, header, data)
+    return output
+
+
+def _benchmark(frames=120000):
+    """Times loading a synthetic 10 minute Postural session from CSV and
+    from the session format.
+
+    Keyword argument:
+    frames (optional) -- frames in the synthetic session
+    """
+    import csv, shutil, tempfile
+    from timeit import default_timer
+
+    folder = tempfile.mkdtemp()
+    filename = os.path.join(folder, 'postural_data.csv')
+    rng = np.random.RandomState(0)
+    data = rng.uniform(-200, 200, (frames, 25))
+    data[:, 0] = np.arange(frames) / 200.0
+    with open(filename, 'w') as f:
+        f.write('Postural Tremor Data for One Hand\n\n\n')
+        for row in data.tolist():
+            f.write(','.join(map(str, row)) + ',\n')
+
+    def timed(name, load):
+        start = default_timer()
+        total = load()
+        print('%-26s %8.3f s  (palm x sum %.6g)' %
+              (name, default_timer() - start, total))
+
+    def csv_module():
+        with open(filename) as f:
+            rows = list(csv.reader(f))[3:]
+        return sum(float(row[1]) for row in rows)
+
+    def loadtxt():
+        return np.loadtxt(filename, delimiter=',', skiprows=3,
+                          usecols=range(25))[:, 1].sum()
+
+    print('Loading %d frames (%.1f MB of CSV)' %
+          (frames, os.path.getsize(filename) / 1e6))
+    timed('csv module', csv_module)
+    timed('numpy.loadtxt', loadtxt)
+    for dtype in ('<f8', '<f4'):
+        output = convert_csv(filename, os.path.join(folder, dtype[1:] +
+                                                    EXTENSION), dtype)
+        timed('session %s (%.1f MB)' % (dtype, os.path.getsize(output) / 1e6),
+              lambda: Session(output)['palm_x'].sum())
+    shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            print(convert_csv(path))
+    else:
+        _benchmark()
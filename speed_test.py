@@ -0,0 +1,307 @@
+"""Neuromechanics Lab Listener Speed Test
+
+Python counterpart of speedTest.cpp. Runs the Leap listener of each task
+program against the fakeleap controller and reports how many frames it kept
+up with, the gaps in frame ids and timestamps it saw, how long on_frame took
+and how much memory it gained. Results are printed and can be written as JSON
+to compare versions, including those in Old Versions.
+
+Task programs run their whole experiment at import, so only their top-level
+imports, constants, functions and classes are executed here. A listener that
+needs a module that isn't installed is reported with its error instead of
+results.
+
+Usage:
+    python speed_test.py [program.py ...] [--rate HZ] [--seconds S]
+                         [--output results.json]
+"""
+
+import argparse, ast, gc, io, json, os, platform, sys, tempfile, time
+import tokenize
+import tracemalloc
+from timeit import default_timer
+
+import numpy as np
+
+import fakeleap
+fakeleap.install()
+
+DEFAULT_PROGRAMS = ('Postural_1.1.py', 'Tapping_0.4.py', 'ClockGame_1.1.py',
+                    os.path.join('Old Versions', 'CornersGame_1_7.py'))
+DEFAULT_RATE = 200 # frames per second
+DEFAULT_SECONDS = 5 # length of each run, as in speedTest.cpp
+# Rate the main thread drains the pygame event queue, like the render loops
+RENDER_RATE = 60
+
+# Motion each listener is driven with, by class name
+MOTIONS = {'PostureListener': lambda: fakeleap.TremorMotion(),
+           'TapListener': lambda: fakeleap.TappingMotion(),
+           'ClockLeapListener': lambda: fakeleap.TremorMotion(fingers=1)}
+
+
+class Calibration(object):
+    """Stand-in for the screen_calibration.CalibrationData CornersGame
+    loads before adding its listener, mapping the interaction box straight
+    onto the window.
+    """
+    ppmm = 1.0
+
+    def finger_to_graphics(self, position, size):
+        return (int(size[0] / 2 + position[0]),
+                int(size[1] / 2 - (position[1] - 200.0)))
+
+
+# Values of the globals the task programs set up in their main code before
+# adding a listener
+PROGRAM_GLOBALS = {'start': 0.0, 'keyboard_activated': True,
+                   'positioning': False, 'screen_x': 1920, 'screen_y': 1080,
+                   'win_size_px': 600, 'target_index': 0, 'cursor': None,
+                   'cal_data': Calibration()}
+
+
+def _top_level_blocks(source):
+    """Splits Python 2 or 3 source into the text of each top-level
+    statement, with any comments and blank lines after it.
+    """
+    lines = source.splitlines(True)
+    starts = []
+    depth = 0
+    line_start = True
+    tokens = tokenize.generate_tokens(io.StringIO(source).readline)
+    for kind, text, (row, col), end, line in tokens:
+        if kind == tokenize.INDENT:
+            depth += 1
+        elif kind == tokenize.DEDENT:
+            depth -= 1
+        elif kind in (tokenize.NEWLINE, tokenize.NL):
+            line_start = line_start or kind == tokenize.NEWLINE
+        elif kind not in (tokenize.COMMENT, tokenize.ENDMARKER):
+            if line_start and depth == 0:
+                starts.append(row - 1)
+            line_start = False
+    starts.append(len(lines))
+    return [''.join(lines[a:b]) for a, b in zip(starts, starts[1:])]
+
+
+def _is_definition(code):
+    """True for imports, functions, classes and assignments without calls,
+    which are safe to run outside the program.
+    """
+    for node in ast.parse(code).body:
+        if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef,
+                             ast.ClassDef)):
+            continue
+        if isinstance(node, ast.Assign) and \
+           not any(isinstance(n, ast.Call) for n in ast.walk(node.value)):
+            continue
+        return False
+    return True
+
+
+def load_definitions(filename):
+    """Runs the definitions of a task program without running the program.
+    Returns the resulting namespace. Imports of missing modules and
+    statements that aren't valid in this version of Python are skipped.
+
+    Keyword argument:
+    filename -- path of the task program
+    """
+    with io.open(filename, encoding='latin-1') as f:
+        source = f.read()
+    namespace = {'__name__': 'speed_test_program', '__file__': filename}
+    folder = os.path.dirname(os.path.abspath(filename))
+    if folder not in sys.path:
+        sys.path.append(folder)
+    for block in _top_level_blocks(source):
+        try:
+            if not _is_definition(block):
+                continue
+            code = compile(block, filename, 'exec')
+        except SyntaxError:
+            continue
+        try:
+            exec(code, namespace)
+        except ImportError:
+            # Retry "import a, b, c" one module at a time
+            for name in block.split('import', 1)[-1].split('#')[0].split(','):
+                try:
+                    exec('import ' + name.strip(), namespace)
+                except ImportError:
+                    pass
+        except Exception:
+            pass
+    if 'clock' not in namespace:
+        # time.clock was removed in Python 3.8
+        namespace['clock'] = default_timer
+    return namespace
+
+
+class TimedListener(fakeleap.Listener):
+    """Wraps a listener, timing every on_frame call and noting the id and
+    timestamp of the frame it was called for.
+    """
+
+    def __init__(self, listener):
+        self.listener = listener
+        self.durations = []
+        self.ids = []
+        self.timestamps = []
+        self.errors = 0
+        self.error = None
+
+    def on_init(self, controller):
+        self.listener.on_init(controller)
+
+    def on_connect(self, controller):
+        self.listener.on_connect(controller)
+
+    def on_exit(self, controller):
+        self.listener.on_exit(controller)
+
+    def on_frame(self, controller):
+        frame = controller.frame()
+        start = default_timer()
+        try:
+            self.listener.on_frame(controller)
+        except Exception as e:
+            self.errors += 1
+            self.error = '%s: %s' % (type(e).__name__, e)
+        self.durations.append(default_timer() - start)
+        self.ids.append(frame.id)
+        self.timestamps.append(frame.timestamp)
+
+
+def _drive(namespace, listener_class, rate, seconds, trace_memory):
+    """Runs one listener against a fresh controller. Returns the controller
+    and the TimedListener, plus the memory gained if trace_memory is set.
+    """
+    # Programs that import from pygame with * post events to its queue too
+    pygame = namespace.get('pygame') or sys.modules.get('pygame')
+    if pygame:
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        pygame.display.init()
+    if 'Acquisition' in namespace:
+        # Fresh events and capture statistics, as each trial gets
+        namespace['acquisition'] = namespace['Acquisition']()
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    controller = fakeleap.Controller(MOTIONS.get(listener_class.__name__,
+                                                 fakeleap.TremorMotion)(),
+                                     rate)
+    timed = TimedListener(listener_class())
+    controller.add_listener(timed)
+    end = default_timer() + seconds
+    while default_timer() < end:
+        if pygame:
+            pygame.event.get()
+        time.sleep(1.0 / RENDER_RATE)
+    controller.remove_listener(timed)
+    controller.stop()
+    memory = 0
+    if trace_memory:
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    return controller, timed, memory
+
+
+def run_listener(filename, namespace, name, rate, seconds):
+    """Benchmarks one listener class. Returns a dictionary of results."""
+    import writer
+    result = {'program': filename, 'listener': name}
+    namespace.update((key, value) for key, value in PROGRAM_GLOBALS.items()
+                     if key not in namespace)
+    namespace['data'] = []
+    handle, output = tempfile.mkstemp('.csv')
+    os.close(handle)
+    namespace['writer'] = writer.StreamWriter(output)
+
+    controller, timed, memory = _drive(namespace, namespace[name], rate,
+                                       seconds, True)
+    namespace['data'] = []
+    controller, timed, _ = _drive(namespace, namespace[name], rate, seconds,
+                                  False)
+    namespace['writer'].close()
+    os.remove(output)
+
+    delivered = len(timed.ids)
+    made = controller.frame().id
+    result['frames_made'] = made
+    result['frames_delivered'] = delivered
+    result['delivered_fps'] = delivered / float(seconds)
+    ids = np.array(timed.ids)
+    stamps = np.array(timed.timestamps) / 1e3
+    result['dropped_frames'] = int(made - delivered)
+    result['largest_id_gap'] = int(np.diff(ids).max() - 1) if delivered > 1 \
+                               else 0
+    result['largest_timestamp_gap_ms'] = float(np.diff(stamps).max()) \
+                                         if delivered > 1 else 0.0
+    us = np.array(timed.durations) * 1e6
+    result['on_frame_us'] = dict(zip(('p50', 'p90', 'p99', 'max'),
+                                     np.percentile(us, [50, 90, 99, 100])
+                                     .tolist())) if delivered else {}
+    result['memory_growth_bytes'] = memory
+    result['bytes_per_frame'] = memory / float(delivered) if delivered else 0
+    result['errors'] = timed.errors
+    if timed.error:
+        result['first_error'] = timed.error
+    return result
+
+
+def run_program(filename, rate, seconds):
+    """Benchmarks every listener class in a task program. Returns a list of
+    result dictionaries.
+    """
+    try:
+        namespace = load_definitions(filename)
+    except (IOError, tokenize.TokenError) as e:
+        return [{'program': filename, 'first_error': str(e)}]
+    names = sorted(name for name, value in namespace.items()
+                   if isinstance(value, type) and value is not fakeleap.Listener
+                   and issubclass(value, fakeleap.Listener))
+    if not names:
+        return [{'program': filename,
+                 'first_error': 'No listener could be loaded'}]
+    return [run_listener(filename, namespace, name, rate, seconds)
+            for name in names]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('programs', nargs='*', default=DEFAULT_PROGRAMS)
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE)
+    parser.add_argument('--seconds', type=float, default=DEFAULT_SECONDS)
+    parser.add_argument('--output', help='file to write JSON results to')
+    args = parser.parse_args()
+
+    results = []
+    for filename in args.programs:
+        for result in run_program(filename, args.rate, args.seconds):
+            results.append(result)
+            if result.get('errors') and \
+               result['errors'] == result['frames_delivered']:
+                # Every call failed, so the timings mean nothing
+                print('%-45s every one of %d frames raised an error' %
+                      (result['program'] + ':' + result['listener'],
+                       result['errors']))
+            elif 'frames_delivered' in result:
+                print('%-45s %7.1f fps %5d dropped  on_frame p50 %6.1f '
+                      'p99 %7.1f us  %8.0f B/frame%s' %
+                      (result['program'] + ':' + result['listener'],
+                       result['delivered_fps'], result['dropped_frames'],
+                       result['on_frame_us'].get('p50', 0),
+                       result['on_frame_us'].get('p99', 0),
+                       result['bytes_per_frame'],
+                       '  %d errors' % result['errors']
+                       if result['errors'] else ''))
+            if 'first_error' in result:
+                print('    ' + result['first_error'])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'rate': args.rate, 'seconds': args.seconds,
+                       'results': results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Neuromechanics Lab Startup Check
+
+Times each task program from a cold interpreter start to "device ready",
+against the fakeleap controller. Only the program's top-level imports are
+run, followed by wait_for_device(), which is everything that stands between
+launching a program and capturing its first frame apart from questions to the
+user. The slowest imports are listed from python -X importtime.
+
+Exits with status 1 if a program takes longer than STARTUP_BUDGET or has
+imported one of the modules in DEFERRED, which only dialogs and plots need
+and which must be imported when they are first used.
+
+Usage:
+    python startup_check.py [program.py ...] [--runs N] [--top N]
+"""
+
+import argparse, os, subprocess, sys
+from timeit import default_timer
+
+PROGRAMS = ('Postural_1.1.py', 'Tapping_0.4.py', 'ClockGame_1.1.py',
+            'visual.py')
+# Seconds from launch to device ready; several times the 130-280 ms the
+# programs take against fakeleap, so only a real regression trips it
+STARTUP_BUDGET = 1.5
+# Modules that may only be imported when a dialog or plot is shown
+DEFERRED = ('matplotlib', 'pylab', 'easygui', 'tkinter', 'Tkinter')
+# Printed by the child process once the device is ready, followed by the
+# deferred modules it had imported
+READY = 'device ready'
+
+# Run in a fresh interpreter: import what the program imports at the top
+# level, then wait for the device, then report which deferred modules loaded.
+_CHILD = '''
+import ast, sys
+folder, filename = sys.argv[1], sys.argv[2]
+sys.path.insert(0, folder)
+import fakeleap
+fakeleap.install()
+with open(filename) as f:
+    tree = ast.parse(f.read(), filename)
+imports = [node for node in tree.body
+           if isinstance(node, (ast.Import, ast.ImportFrom))]
+module = ast.Module(body=imports, type_ignores=[])
+exec(compile(module, filename, 'exec'), {'__name__': 'startup_check'})
+from acquisition import wait_for_device
+controller = fakeleap.Controller()
+wait_for_device(controller, 5)
+print(%r + ' ' + ','.join(name for name in %r if name in sys.modules))
+sys.stdout.flush()
+controller.stop()
+''' % (READY, DEFERRED)
+
+
+def _parse_importtime(text, top):
+    """Returns the top-level imports with the largest cumulative time from
+    -X importtime output, as (microseconds, module) pairs.
+
+    Keyword arguments:
+    text -- standard error of the child process
+    top -- number of imports to return
+    """
+    imports = []
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        # Nested imports are indented under the module that imported them
+        if name.startswith('  ') or name.strip() in ('fakeleap', 'ast'):
+            continue
+        imports.append((int(fields[1]), name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def check(filename, runs=3, top=5):
+    """Starts a program's imports in fresh interpreters. Returns a dictionary
+    with the fastest time to device ready, the deferred modules that were
+    imported and the slowest imports.
+
+    Keyword arguments:
+    filename -- path of the task program
+    runs (optional) -- interpreters started; the fastest is kept
+    top (optional) -- number of slow imports to list
+    """
+    folder = os.path.dirname(os.path.abspath(filename))
+    command = [sys.executable, '-X', 'importtime', '-c', _CHILD, folder,
+               filename]
+    env = dict(os.environ, SDL_VIDEODRIVER='dummy',
+               PYGAME_HIDE_SUPPORT_PROMPT='1')
+    best = None
+    for run in range(runs):
+        start = default_timer()
+        child = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, env=env,
+                                 universal_newlines=True)
+        line = child.stdout.readline()
+        elapsed = default_timer() - start
+        out, err = child.communicate()
+        if not line.startswith(READY):
+            return {'program': filename,
+                    'error': (line + out + err).strip().splitlines()[-1]}
+        if best is None or elapsed < best['seconds']:
+            deferred = line[len(READY):].strip()
+            best = {'program': filename, 'seconds': elapsed,
+                    'deferred': deferred.split(',') if deferred else [],
+                    'imports': _parse_importtime(err, top)}
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('programs', nargs='*', default=PROGRAMS)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for filename in args.programs:
+        result = check(filename, args.runs, args.top)
+        if 'error' in result:
+            print('%-20s FAILED  %s' % (filename, result['error']))
+            failed = True
+            continue
+        problems = []
+        if result['seconds'] > STARTUP_BUDGET:
+            problems.append('over the %.1f s budget' % STARTUP_BUDGET)
+        if result['deferred']:
+            problems.append('imported ' + ', '.join(result['deferred']))
+        failed = failed or bool(problems)
+        print('%-20s %6.0f ms to device ready  %s' %
+              (filename, 1e3 * result['seconds'],
+               'FAILED  ' + '; '.join(problems) if problems else 'ok'))
+        for us, name in result['imports']:
+            print('    %6.1f ms  %s' % (us / 1e3, name))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
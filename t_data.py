@@ -1,1017 +0,0 @@
-t = [0.00974437051166,\
-0.0286221876618,\
-0.0477340575623,\
-0.06556787626,\
-0.084918033418,\
-0.105666732751,\
-0.122954300046,\
-0.143471641314,\
-0.16064410701,\
-0.180892364606,\
-0.198578360514,\
-0.217677141939,\
-0.236124194241,\
-0.255098635141,\
-0.274597769955,\
-0.292320336605,\
-0.311996935757,\
-0.330080975322,\
-0.349527371276,\
-0.368829024081,\
-0.387077824464,\
-0.405964880539,\
-0.42488658258,\
-0.444274465345,\
-0.46256869044,\
-0.50072621795,\
-0.519333026652,\
-0.538528431827,\
-0.556874240917,\
-0.595246188463,\
-0.612919865805,\
-0.632408221873,\
-0.652204542086,\
-0.670374041702,\
-0.68888615143,\
-0.708027662879,\
-0.726629852119,\
-0.746079327714,\
-0.764569110041,\
-0.782886047492,\
-0.802558027182,\
-0.820659389731,\
-0.859033262052,\
-0.877622747772,\
-0.896720759286,\
-0.914552653207,\
-0.934537216505,\
-0.972979225894,\
-0.990781863222,\
-1.01043882966,\
-1.02813983882,\
-1.04843352113,\
-1.06589778285,\
-1.10426742067,\
-1.12245154858,\
-1.14107837495,\
-1.16016021835,\
-1.17906883191,\
-1.1986068472,\
-1.21904296292,\
-1.23633399481,\
-1.25498199372,\
-1.27436564198,\
-1.29245661074,\
-1.31241807673,\
-1.33064878422,\
-1.34977374259,\
-1.36781004772,\
-1.40597989379,\
-1.42519339186,\
-1.44332016145,\
-1.46298675177,\
-1.48127019812,\
-1.50058609426,\
-1.51927412851,\
-1.53799411404,\
-1.55765531498,\
-1.57532514277,\
-1.61422255414,\
-1.63190701023,\
-1.67093107185,\
-1.68855278024,\
-1.70750720347,\
-1.72641543208,\
-1.74631799993,\
-1.76521160024,\
-1.78414870049,\
-1.80169688244,\
-1.84078715636,\
-1.85909293011,\
-1.8969740598,\
-1.91597390774,\
-1.95358441393,\
-1.97172196227,\
-1.99046889466,\
-2.01009160009,\
-2.02875769189,\
-2.04781990257,\
-2.0662469372,\
-2.10445681861,\
-2.12293428238,\
-2.16189290162,\
-2.17918816802,\
-2.19891981576,\
-2.21682331135,\
-2.25539582054,\
-2.29328310951,\
-2.31119314934,\
-2.33129319919,\
-2.35020797204,\
-2.36867504201,\
-2.38753938573,\
-2.40686567566,\
-2.42424024283,\
-2.44340754628,\
-2.4628997519,\
-2.48088216329,\
-2.50020344881,\
-2.51933495143,\
-2.53814116691,\
-2.55628718426,\
-2.57567853163,\
-2.59503561798,\
-2.61383875382,\
-2.63296871662,\
-2.65093996431,\
-2.67018887826,\
-2.68886305412,\
-2.70783518529,\
-2.72699863918,\
-2.74733736125,\
-2.76479546369,\
-2.78277749013,\
-2.82125183576,\
-2.83924194626,\
-2.85882307652,\
-2.87863825954,\
-2.89640817568,\
-2.91621719941,\
-2.93403869954,\
-2.95345198935,\
-2.97198681144,\
-2.99099050893,\
-3.00929281808,\
-3.02865644867,\
-3.04757853567,\
-3.06626079559,\
-3.08532762573,\
-3.10419196945,\
-3.12252699979,\
-3.14129856931,\
-3.16020179351,\
-3.18038691845,\
-3.1980313392,\
-3.21799819456,\
-3.23566840731,\
-3.2554185329,\
-3.27381939058,\
-3.2934644234,\
-3.31159465759,\
-3.33137865924,\
-3.34913125239,\
-3.38749357606,\
-3.40539553183,\
-3.44396380651,\
-3.46249246931,\
-3.48216598882,\
-3.50383203636,\
-3.51984270731,\
-3.53836059137,\
-3.57568469091,\
-3.59495670217,\
-3.61370363455,\
-3.6326588277,\
-3.65125947712,\
-3.69022079104,\
-3.70763962806,\
-3.74563239475,\
-3.76474003014,\
-3.7834958165,\
-3.80249912904,\
-3.82077834088,\
-3.83933279568,\
-3.85835959048,\
-3.87746068164,\
-3.90882682984,\
-3.91752874172,\
-3.936680262,\
-3.9527198046,\
-3.99147285777,\
-4.00901565035,\
-4.04767823906,\
-4.06861441157,\
-4.08480177695,\
-4.10355871818,\
-4.12249273878,\
-4.14214508576,\
-4.16020217846,\
-4.17927555284,\
-4.19879855488,\
-4.21719710283,\
-4.23618155256,\
-4.25484725941,\
-4.27467707072,\
-4.29272030504,\
-4.31194496681,\
-4.33004401963,\
-4.34931795566,\
-4.36805025975,\
-4.38686994867,\
-4.40531392133,\
-4.42437651696,\
-4.44354459032,\
-4.461919656,\
-4.48191807769,\
-4.50014763031,\
-4.5194700707,\
-4.53751138024,\
-4.55750133291,\
-4.57595146485,\
-4.59424415012,\
-4.61353117463,\
-4.63334135323,\
-4.65227768357,\
-4.66965225074,\
-4.68825136034,\
-4.70723734989,\
-4.72646971076,\
-4.74555732849,\
-4.76399706664,\
-4.78367251093,\
-4.80200022712,\
-4.82197170194,\
-4.87793918093,\
-4.88824751078,\
-4.89044445,\
-4.90046675816,\
-4.9155662402,\
-4.95780929705,\
-4.96049936386,\
-4.97153833865,\
-4.9905389565,\
-5.00987718005,\
-5.02841123222,\
-5.06459855911,\
-5.06739910806,\
-5.08551394404,\
-5.10431323033,\
-5.12270369422,\
-5.14207733365,\
-5.16094206232,\
-5.17974558312,\
-5.19939831505,\
-5.21696266512,\
-5.23599330948,\
-5.25453660058,\
-5.27297633873,\
-5.29288583577,\
-5.31084053039,\
-5.33064993908,\
-5.34903385873,\
-5.36759023831,\
-5.38729840378,\
-5.40550639892,\
-5.42499167534,\
-5.44328513053,\
-5.46212021765,\
-5.48131562283,\
-5.50110655367,\
-5.51934650008,\
-5.53770963216,\
-5.55756215583,\
-5.57680529544,\
-5.59406476101,\
-5.61367899742,\
-5.63275468154,\
-5.65126756117,\
-5.66982740534,\
-5.68964605296,\
-5.70773740667,\
-5.72639002504,\
-5.74650431823,\
-5.76393431895,\
-5.78326753808,\
-5.80240827962,\
-5.82160830425,\
-5.83961804747,\
-5.85979085385,\
-5.87740101359,\
-5.89715113918,\
-5.91520014782,\
-5.93507191925,\
-5.9529061229,\
-5.97207920068,\
-5.99141857909,\
-6.00964235739,\
-6.02996799098,\
-6.0476924824,\
-6.06784527111,\
-6.0855778466,\
-6.10500653461,\
-6.12359986989,\
-6.1430990047,\
-6.16170388862,\
-6.18184050922,\
-6.19998498675,\
-6.21854945038,\
-6.23927659222,\
-6.25959298689,\
-6.27925033828,\
-6.29838530549,\
-6.3174979453,\
-6.3352089633,\
-6.35475275291,\
-6.37337880937,\
-6.39195867121,\
-6.41015742742,\
-6.42804975931,\
-6.44644907717,\
-6.46389255131,\
-6.48288316033,\
-6.5013132746,\
-6.51873018684,\
-6.5377573666,\
-6.5566983164,\
-6.57517000583,\
-6.59533203347,\
-6.61437191675,\
-6.633059951,\
-6.65045607565,\
-6.67026124983,\
-6.68792376348,\
-6.70791333119,\
-6.72559663241,\
-6.74556271786,\
-6.76379227048,\
-6.78317322406,\
-6.80141086074,\
-6.82121334024,\
-6.8392192339,\
-6.85839539132,\
-6.87728206244,\
-6.89648978618,\
-6.91465428138,\
-6.93451527406,\
-6.95251616331,\
-6.97192406374,\
-6.99037034613,\
-7.00943987096,\
-7.02831807307,\
-7.04761549137,\
-7.06565641595,\
-7.08465202939,\
-7.10336046626,\
-7.12289232226,\
-7.14133167546,\
-7.16150294202,\
-7.17917777423,\
-7.19935404521,\
-7.21711780206,\
-7.23627432676,\
-7.25423210103,\
-7.27461124339,\
-7.29156120499,\
-7.31167511322,\
-7.3300424798,\
-7.35024723747,\
-7.36759023831,\
-7.3873034082,\
-7.40528851428,\
-7.42496588335,\
-7.44361388225,\
-7.46254212853,\
-7.48074242456,\
-7.50047137762,\
-7.51931069925,\
-7.53804723785,\
-7.55623483036,\
-7.57732729467,\
-7.5938079959,\
-7.6133502457,\
-7.63208100997,\
-7.65154626873,\
-7.6698535823,\
-7.68933346935,\
-7.70699752281,\
-7.72766538156,\
-7.74501800628,\
-7.76503182617,\
-7.78259232669,\
-7.80146821906,\
-7.82122219421,\
-7.84043415245,\
-7.85849701948,\
-7.87919759942,\
-7.89668572836,\
-7.9154880943,\
-7.93408604903,\
-7.95402942212,\
-7.97135317521,\
-7.99103593364,\
-8.00964928658,\
-8.02875884675,\
-8.04684096154,\
-8.06629775128,\
-8.08483680787,\
-8.10382010274,\
-8.12225252675,\
-8.14157689191,\
-8.16022450586,\
-8.18051010411,\
-8.19816299387,\
-8.21819875621,\
-8.23600793778,\
-8.25525261721,\
-8.27356878475,\
-8.29453344394,\
-8.31123818909,\
-8.33058988607,\
-8.34888449612,\
-8.36844791845,\
-8.38633832556,\
-8.40616929174,\
-8.42443503015,\
-8.44307879455,\
-8.4635353129,\
-8.48121437962,\
-8.49961716207,\
-8.51938923011,\
-8.53780895059,\
-8.55697702395,\
-8.57538635064,\
-8.59482504749,\
-8.61317701587,\
-8.63228080171,\
-8.65047070395,\
-8.66988091411,\
-8.68859935982,\
-8.70769044214,\
-8.72622141467,\
-8.74741512219,\
-8.76408637624,\
-8.78325906906,\
-8.80182969198,\
-8.82142968505,\
-8.83955491482,\
-8.85857054592,\
-8.87786603945,\
-8.89593391089,\
-8.91502499322,\
-8.93430932304,\
-8.95302237937,\
-8.97155758641,\
-8.99078725259,\
-9.00927934465,\
-9.02962345609,\
-9.04692372691,\
-9.06635395474,\
-9.08465125948,\
-9.10455305741,\
-9.12234722572,\
-9.14153377693,\
-9.15984070555,\
-9.17960468952,\
-9.19802864452,\
-9.21722597447,\
-9.23545591205,\
-9.25490654251,\
-9.27326544007,\
-9.29305021163,\
-9.31135714024,\
-9.33055254542,\
-9.35096902843,\
-9.36845369278,\
-9.38674522319,\
-9.40714322835,\
-9.42452972913,\
-9.44332439596,\
-9.47476330068,\
-9.51655288033,\
-9.51829056802,\
-9.54791825862,\
-9.55678647114,\
-9.56558924127,\
-9.57476734271,\
-9.59545560408,\
-9.61320357777,\
-9.63329169401,\
-9.65122444619,\
-9.67779482274,\
-9.68861360316,\
-9.70828250321,\
-9.72637154719,\
-9.74560891248,\
-9.76417645576,\
-9.78350005101,\
-9.80177849294,\
-9.82210297166,\
-9.83941902564,\
-9.85873453683,\
-9.88074396438,\
-9.89711495339,\
-9.9153472007,\
-9.93467272073,\
-9.95270902585,\
-9.9727532572,\
-9.99058861572,\
-]
-
-y = [244.641220093,\
-244.223510742,\
-242.271026611,\
-237.277420044,\
-228.978210449,\
-218.887298584,\
-209.606445312,\
-201.764099121,\
-196.246429443,\
-193.597930908,\
-193.497802734,\
-197.51461792,\
-206.059463501,\
-216.122055054,\
-225.610061646,\
-232.487060547,\
-234.88394165,\
-232.103179932,\
-223.818557739,\
-211.616897583,\
-201.308883667,\
-194.792922974,\
-192.361480713,\
-193.378982544,\
-197.099838257,\
-215.233551025,\
-228.008926392,\
-237.40171814,\
-243.287338257,\
-243.102523804,\
-236.727584839,\
-225.984359741,\
-213.043579102,\
-201.588394165,\
-193.740783691,\
-189.540664673,\
-189.105941772,\
-192.485580444,\
-200.885040283,\
-212.595184326,\
-224.876617432,\
-234.910827637,\
-242.394470215,\
-238.953323364,\
-230.552627563,\
-218.471374512,\
-206.176940918,\
-193.779495239,\
-192.118972778,\
-195.897338867,\
-205.45123291,\
-218.065139771,\
-230.171722412,\
-243.839172363,\
-245.366592407,\
-241.794326782,\
-232.065719604,\
-217.393768311,\
-203.399185181,\
-194.448226929,\
-190.691238403,\
-191.535736084,\
-196.098342896,\
-205.321594238,\
-217.090682983,\
-229.233779907,\
-238.779083252,\
-243.270492554,\
-236.868301392,\
-225.952835083,\
-210.687713623,\
-197.130706787,\
-188.871047974,\
-185.296142578,\
-186.522689819,\
-191.810455322,\
-201.900131226,\
-215.084091187,\
-234.943267822,\
-243.74760437,\
-249.749252319,\
-247.569793701,\
-240.822525024,\
-228.69770813,\
-213.864364624,\
-201.385284424,\
-193.641769409,\
-191.424484253,\
-205.740539551,\
-219.646560669,\
-239.712371826,\
-247.911102295,\
-253.607421875,\
-251.392318726,\
-245.967941284,\
-236.47946167,\
-222.865829468,\
-208.256011963,\
-197.986831665,\
-195.078308105,\
-200.978591919,\
-223.226623535,\
-237.338790894,\
-247.804962158,\
-253.612701416,\
-253.654144287,\
-247.9974823,\
-230.880172729,\
-214.491210938,\
-203.349853516,\
-198.461288452,\
-197.58392334,\
-201.198730469,\
-209.969985962,\
-222.480407715,\
-235.46105957,\
-245.659667969,\
-252.147460938,\
-254.934463501,\
-255.352401733,\
-251.86000061,\
-243.738418579,\
-229.40234375,\
-211.75201416,\
-197.902114868,\
-189.821075439,\
-187.177429199,\
-189.941574097,\
-198.439331055,\
-212.059341431,\
-227.743911743,\
-240.9972229,\
-249.702850342,\
-255.767349243,\
-253.68598938,\
-248.506256104,\
-237.576858521,\
-222.123321533,\
-206.837371826,\
-196.140274048,\
-190.954071045,\
-190.615783691,\
-194.480377197,\
-202.940231323,\
-215.121444702,\
-228.547897339,\
-239.707244873,\
-247.817047119,\
-251.645202637,\
-251.080932617,\
-246.440582275,\
-237.300201416,\
-222.544631958,\
-206.099853516,\
-193.756988525,\
-186.376541138,\
-184.061096191,\
-185.872055054,\
-191.933792114,\
-202.963119507,\
-216.571914673,\
-229.690231323,\
-244.185287476,\
-247.763412476,\
-240.508758545,\
-228.816116333,\
-213.620529175,\
-199.563110352,\
-190.270751953,\
-186.125793457,\
-193.42414856,\
-203.102127075,\
-216.013442993,\
-229.353942871,\
-240.193832397,\
-250.964996338,\
-251.94960022,\
-240.552215576,\
-227.069229126,\
-210.772140503,\
-196.805664062,\
-188.857666016,\
-185.866546631,\
-188.378356934,\
-196.453796387,\
-208.461853027,\
-222.610717773,\
-235.702453613,\
-245.657653809,\
-251.555862427,\
-248.510482788,\
-229.632965088,\
-213.066818237,\
-199.943786621,\
-193.523391724,\
-192.383255005,\
-196.475753784,\
-205.893707275,\
-219.07484436,\
-230.307327271,\
-240.000747681,\
-246.899597168,\
-250.959594727,\
-249.646514893,\
-244.099502563,\
-234.757049561,\
-221.335281372,\
-207.999145508,\
-198.034896851,\
-192.191802979,\
-189.609237671,\
-190.890518188,\
-196.735321045,\
-206.943893433,\
-220.00541687,\
-231.750534058,\
-240.737304688,\
-246.502609253,\
-247.91078186,\
-246.128005981,\
-239.840652466,\
-228.30267334,\
-214.415908813,\
-201.426269531,\
-191.918334961,\
-186.822677612,\
-186.164535522,\
-190.197463989,\
-198.150680542,\
-208.303085327,\
-219.891906738,\
-230.281600952,\
-238.173873901,\
-242.659118652,\
-243.314880371,\
-238.897537231,\
-229.479278564,\
-216.708816528,\
-203.958450317,\
-195.446716309,\
-191.542037964,\
-191.571578979,\
-195.397842407,\
-203.629272461,\
-215.46824646,\
-228.439956665,\
-238.978713989,\
-245.87689209,\
-248.790206909,\
-247.775360107,\
-242.668792725,\
-232.33416748,\
-217.121780396,\
-202.046463013,\
-190.918395996,\
-184.851211548,\
-184.489898682,\
-188.655151367,\
-197.302841187,\
-208.207702637,\
-220.385955811,\
-231.780609131,\
-238.510971069,\
-240.271484375,\
-236.880187988,\
-229.268295288,\
-218.622116089,\
-206.091506958,\
-195.097229004,\
-187.735748291,\
-183.892654419,\
-182.628509521,\
-184.434875488,\
-190.387832642,\
-200.582138062,\
-213.220108032,\
-224.421722412,\
-233.580734253,\
-239.73866272,\
-242.611083984,\
-241.190307617,\
-235.633346558,\
-223.475296021,\
-208.04498291,\
-195.262710571,\
-186.446029663,\
-181.205215454,\
-179.694046021,\
-181.360519409,\
-187.498382568,\
-197.076034546,\
-208.308074951,\
-219.107910156,\
-228.502792358,\
-235.398483276,\
-238.487686157,\
-236.478286743,\
-228.822982788,\
-216.374282837,\
-202.600662231,\
-191.963195801,\
-185.080673218,\
-182.541854858,\
-183.484695435,\
-187.874084473,\
-196.539215088,\
-208.949127197,\
-222.727706909,\
-234.507202148,\
-242.593399048,\
-246.069519043,\
-242.783569336,\
-234.301696777,\
-220.731460571,\
-206.338989258,\
-195.964706421,\
-189.877334595,\
-188.334091187,\
-189.825500488,\
-196.378234863,\
-208.41583252,\
-222.29296875,\
-235.953521729,\
-247.508499146,\
-254.536026001,\
-256.526092529,\
-251.620986938,\
-240.07119751,\
-226.025146484,\
-213.132705688,\
-203.365081787,\
-196.682128906,\
-193.248077393,\
-193.278594971,\
-195.784606934,\
-199.367889404,\
-206.618881226,\
-216.057388306,\
-226.764190674,\
-236.196670532,\
-243.859451294,\
-249.688873291,\
-253.570983887,\
-254.449615479,\
-252.868179321,\
-249.541564941,\
-242.438049316,\
-230.101379395,\
-215.430984497,\
-203.761749268,\
-197.417800903,\
-195.672409058,\
-197.205184937,\
-200.960617065,\
-208.41116333,\
-218.227340698,\
-229.14541626,\
-238.209396362,\
-243.886474609,\
-244.098587036,\
-237.736053467,\
-226.260284424,\
-215.275512695,\
-207.667831421,\
-203.45954895,\
-203.163925171,\
-205.965286255,\
-212.88218689,\
-222.759811401,\
-234.9868927,\
-246.875,\
-255.678085327,\
-260.716918945,\
-260.866668701,\
-255.590057373,\
-243.702484131,\
-228.088592529,\
-213.783370972,\
-204.063186646,\
-201.124343872,\
-204.752670288,\
-213.513061523,\
-225.213470459,\
-237.115127563,\
-246.889129639,\
-254.336975098,\
-256.725646973,\
-252.560974121,\
-242.06817627,\
-227.529403687,\
-214.27015686,\
-205.284164429,\
-201.07901001,\
-201.894683838,\
-207.18598938,\
-216.579467773,\
-228.941452026,\
-241.78704834,\
-252.177856445,\
-258.855255127,\
-259.888549805,\
-255.140441895,\
-243.682617188,\
-225.741836548,\
-207.294784546,\
-196.168106079,\
-193.008651733,\
-196.047988892,\
-203.225906372,\
-214.435684204,\
-226.361831665,\
-237.30380249,\
-244.909622192,\
-248.375610352,\
-246.417144775,\
-238.435089111,\
-225.895462036,\
-212.183502197,\
-201.795135498,\
-194.850204468,\
-191.897018433,\
-193.296173096,\
-199.186447144,\
-210.449859619,\
-224.288116455,\
-237.358444214,\
-246.93737793,\
-251.99319458,\
-251.651596069,\
-245.228530884,\
-232.920211792,\
-217.444961548,\
-204.089172363,\
-195.575942993,\
-191.485824585,\
-191.345062256,\
-193.978164673,\
-200.688751221,\
-211.379821777,\
-223.741195679,\
-236.104476929,\
-245.875793457,\
-251.85987854,\
-253.918930054,\
-249.984237671,\
-240.727096558,\
-227.32875061,\
-212.82333374,\
-201.51373291,\
-194.942733765,\
-193.433258057,\
-196.174835205,\
-203.764953613,\
-215.463775635,\
-228.288253784,\
-239.129547119,\
-247.086776733,\
-251.612182617,\
-251.599822998,\
-247.214981079,\
-237.548690796,\
-223.08265686,\
-207.802078247,\
-197.227767944,\
-191.834854126,\
-191.206634521,\
-194.834243774,\
-202.858779907,\
-214.319763184,\
-227.758270264,\
-239.025680542,\
-246.295959473,\
-249.163894653,\
-246.812225342,\
-238.799667358,\
-224.50668335,\
-207.377487183,\
-194.200302124,\
-186.10635376,\
-182.808547974,\
-184.171859741,\
-190.342971802,\
-201.31137085,\
-215.054977417,\
-228.703048706,\
-238.464111328,\
-243.580368042,\
-244.185546875,\
-240.178009033,\
-230.749038696,\
-214.595870972,\
-197.482315063,\
-185.617904663,\
-179.675033569,\
-180.037490845,\
-185.078536987,\
-195.302856445,\
-208.387619019,\
-221.168579102,\
-231.598297119,\
-239.803451538,\
-243.086227417,\
-242.22479248,\
-237.466278076,\
-227.396057129,\
-212.671646118,\
-198.36730957,\
-]
@@ -0,0 +1,151 @@
+"""Neuromechanics Lab Tap Detection
+
+Counts finger taps in a vertical position trace. A tap is the finger dropping
+below a lower line after having been above an upper line, the same two-line
+rule the Tapping feedback window has always used; the gap between the lines
+keeps sensor noise from counting as extra taps. A tap that follows the
+previous one sooner than a minimum interval is ignored.
+
+detect_taps() processes a whole trial array at once and replaces the offline
+recount in peak_counting.m, while TapCounter does the same job one sample at
+a time for the live display. Both give identical counts for the same trace.
+
+Run this file to check the two against each other on the recorded trace and
+measure their throughput.
+"""
+
+import numpy as np
+
+# Minimum time between taps; faster than any human can tap.
+MIN_INTERVAL = 0.05 # seconds
+
+
+def detect_taps(t, y, upper, lower, min_interval=MIN_INTERVAL):
+    """Finds every tap in a trace. Returns the indices of the samples at
+    which taps were counted.
+
+    Keyword arguments:
+    t -- sample times in seconds
+    y -- vertical finger position at each sample time, NaN if not visible
+    upper -- the finger must rise above this position to arm a tap
+    lower -- an armed finger dropping below this position counts a tap
+    min_interval (optional) -- seconds that must pass between counted taps
+    """
+    t = np.asarray(t, float)
+    y = np.asarray(y, float)
+    # +1 above the upper line, -1 below the lower line, 0 in between
+    side = np.zeros(len(y), np.int8)
+    side[y > upper] = 1
+    side[y < lower] = -1
+    # Carry the last line crossed forward through the samples in between
+    crossed = np.nonzero(side)[0]
+    if len(crossed) < 2:
+        return np.zeros(0, int)
+    state = side[crossed]
+    candidates = crossed[1:][(state[:-1] == 1) & (state[1:] == -1)]
+    if min_interval <= 0 or len(candidates) < 2:
+        return candidates
+    # Only taps that survive the interval rule reset it, so keep them in turn
+    taps = [candidates[0]]
+    last = t[candidates[0]]
+    for index, time in zip(candidates[1:], t[candidates[1:]]):
+        if time - last >= min_interval:
+            taps.append(index)
+            last = time
+    return np.array(taps)
+
+
+def count_taps(t, y, upper, lower, min_interval=MIN_INTERVAL):
+    """Returns the number of taps in a trace. Arguments are as for
+    detect_taps().
+    """
+    return len(detect_taps(t, y, upper, lower, min_interval))
+
+
+class TapCounter(object):
+    """Counts taps one sample at a time with constant work per sample."""
+
+    def __init__(self, upper, lower, min_interval=MIN_INTERVAL):
+        """Keyword arguments:
+        upper -- the finger must rise above this position to arm a tap
+        lower -- an armed finger dropping below this position counts a tap
+        min_interval (optional) -- seconds that must pass between counted taps
+        """
+        self.upper = upper
+        self.lower = lower
+        self.min_interval = min_interval
+        self.count = 0
+        self.armed = False
+        self.last_tap = None
+
+    def update(self, t, y):
+        """Feeds in one sample. Returns True if it completed a tap.
+
+        Keyword arguments:
+        t -- sample time in seconds
+        y -- vertical finger position
+        """
+        if y > self.upper:
+            self.armed = True
+        elif y < self.lower and self.armed:
+            self.armed = False
+            if self.last_tap is None or t - self.last_tap >= self.min_interval:
+                self.last_tap = t
+                self.count += 1
+                return True
+        return False
+
+
+def _regression():
+    """Checks detect_taps against TapCounter on the recorded trace over a
+    sweep of lines and intervals. Raises AssertionError on any mismatch.
+    """
+    import fixtures
+    trace = fixtures.load('tapping')
+    t = trace['t']
+    y = trace['y']
+    checked = 0
+    for lower in range(185, 230, 5):
+        for gap in (5, 10, 20, 30):
+            for min_interval in (0.0, MIN_INTERVAL, 0.2, 0.4):
+                upper = lower + gap
+                counter = TapCounter(upper, lower, min_interval)
+                streamed = [n for n in range(len(t))
+                            if counter.update(t[n], y[n])]
+                batch = detect_taps(t, y, upper, lower, min_interval)
+                assert list(batch) == streamed, (upper, lower, min_interval)
+                checked += 1
+    print('%d line/interval settings agree; %d taps between 200 and 235 mm' %
+          (checked, count_taps(t, y, 235, 200)))
+
+
+def _benchmark(seconds=600.0, rate=200.0):
+    """Prints the throughput of both modes on a synthetic tapping trace.
+
+    Keyword arguments:
+    seconds (optional) -- length of the trace
+    rate (optional) -- samples per second
+    """
+    from timeit import default_timer
+    rng = np.random.RandomState(0)
+    t = np.arange(int(seconds * rate)) / rate
+    y = 220 + 30 * np.sin(2 * np.pi * 4.0 * t) + rng.normal(0, 2, len(t))
+
+    start = default_timer()
+    taps = count_taps(t, y, 235, 205)
+    batch = default_timer() - start
+    counter = TapCounter(235, 205)
+    update = counter.update
+    start = default_timer()
+    for time, value in zip(t.tolist(), y.tolist()):
+        update(time, value)
+    streamed = default_timer() - start
+    assert counter.count == taps
+    print('%d samples, %d taps' % (len(t), taps))
+    print('detect_taps  %12.0f samples/s' % (len(t) / batch))
+    print('TapCounter   %12.0f samples/s' % (len(t) / streamed))
+
+
+if __name__ == "__main__":
+    _regression()
+    _benchmark()
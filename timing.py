@@ -0,0 +1,184 @@
+"""Neuromechanics Lab Timing
+
+One clock for every logger. now_ns() is a monotonic host clock in integer
+nanoseconds, the same on every platform, unlike time.clock, which counts CPU
+time on Linux and was removed in Python 3.8.
+
+ClockSync maps Leap device timestamps onto that clock while frames arrive.
+An exponentially weighted least-squares line through (device, host) pairs
+follows the drift between the two clocks, and the line is lowered to the
+smallest residual of recent frames, because a frame can arrive late but
+never early. The result is the host time each frame was captured, free of
+the callback delay.
+
+Run this file directly to measure the cost per timestamp and how well drift
+is recovered from a simulated device clock.
+"""
+
+import time
+from collections import deque
+from timeit import default_timer
+
+# Frames a ClockSync effectively averages over; 10 seconds at 200 fps
+FORGET_FRAMES = 2000
+# Frames searched for the smallest callback delay
+WINDOW_FRAMES = 400
+
+# now_ns() returns the host clock in integer nanoseconds
+if hasattr(time, 'perf_counter_ns'):
+    now_ns = time.perf_counter_ns
+else:
+    # Python 2: the highest resolution clock available on the platform
+    def now_ns():
+        return int(default_timer() * 1e9)
+
+
+def now():
+    """Returns the host clock in seconds."""
+    return now_ns() / 1e9
+
+
+class ClockSync(object):
+    """Online estimate of host time from device timestamps."""
+
+    def __init__(self, forget=FORGET_FRAMES, window=WINDOW_FRAMES):
+        """Keyword arguments:
+        forget (optional) -- frames over which old pairs lose their weight
+        window (optional) -- frames searched for the smallest delay
+        """
+        self.decay = 1.0 - 1.0 / forget
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        """Forgets every pair seen so far."""
+        self.frames = 0
+        self._weight = 0.0
+        self._device = 0.0 # weighted means, relative to the first pair
+        self._host = 0.0
+        self._cdd = 0.0 # weighted covariances
+        self._cdh = 0.0
+        self._origin = None
+        # (frame number, residual) with increasing residuals, so the first
+        # entry is the smallest residual within the window
+        self._lowest = deque()
+
+    @property
+    def slope(self):
+        """Host nanoseconds per device microsecond, 1000 if the clocks run
+        at the same rate.
+        """
+        if self._cdd > 0:
+            return self._cdh / self._cdd
+        return 1000.0
+
+    @property
+    def drift_ppm(self):
+        """How much faster the host clock runs than the device clock, in
+        parts per million.
+        """
+        return (self.slope / 1000.0 - 1.0) * 1e6
+
+    def update(self, device_time, host_time=None):
+        """Adds a frame and returns the host time it was captured at.
+
+        Keyword arguments:
+        device_time -- frame.timestamp, in microseconds
+        host_time (optional) -- now_ns() when the frame arrived, by default
+                                the time of the call
+        """
+        if host_time is None:
+            host_time = now_ns()
+        if self._origin is None:
+            self._origin = (device_time, host_time)
+        d = float(device_time - self._origin[0])
+        h = float(host_time - self._origin[1])
+
+        self._weight = self.decay * self._weight + 1.0
+        dd = d - self._device
+        self._device += dd / self._weight
+        self._host += (h - self._host) / self._weight
+        self._cdd = self.decay * self._cdd + dd * (d - self._device)
+        self._cdh = self.decay * self._cdh + dd * (h - self._host)
+
+        residual = h - self._line(d)
+        lowest = self._lowest
+        while lowest and lowest[-1][1] >= residual:
+            lowest.pop()
+        lowest.append((self.frames, residual))
+        if lowest[0][0] <= self.frames - self.window:
+            lowest.popleft()
+        self.frames += 1
+        return self._origin[1] + int(round(self._line(d) + lowest[0][1]))
+
+    def _line(self, d):
+        return self._host + self.slope * (d - self._device)
+
+    def to_host(self, device_time):
+        """Returns the host time of a device timestamp using the current
+        estimate, without adding it to the estimate.
+
+        Keyword argument:
+        device_time -- device timestamp in microseconds
+        """
+        if self._origin is None:
+            raise ValueError("No frames have been seen yet")
+        d = float(device_time - self._origin[0])
+        return self._origin[1] + int(round(self._line(d) +
+                                           self._lowest[0][1]))
+
+
+def _benchmark(calls=1000000, seconds=600.0, rate=200.0, drift=50.0,
+               delay=1e-3):
+    """Prints the cost of a timestamp from each clock, then feeds ClockSync
+    a simulated device clock running drift ppm slow with exponentially
+    distributed callback delays, and prints the drift it recovers and how
+    far its host times are from the true capture times.
+
+    Keyword arguments:
+    calls (optional) -- timestamps taken per clock
+    seconds (optional) -- length of the simulated recording
+    rate (optional) -- frames per second
+    drift (optional) -- host clock speed relative to the device, in ppm
+    delay (optional) -- mean callback delay in seconds
+    """
+    import numpy as np
+
+    clocks = [('timing.now_ns', now_ns), ('timing.now', now),
+              ('default_timer', default_timer), ('time.time', time.time)]
+    if hasattr(time, 'clock'):
+        clocks.append(('time.clock', time.clock))
+    print('Cost per timestamp')
+    for name, clock in clocks:
+        start = default_timer()
+        for n in range(calls):
+            clock()
+        print('    %-14s %6.1f ns' %
+              (name, 1e9 * (default_timer() - start) / calls))
+
+    rng = np.random.RandomState(0)
+    frames = int(seconds * rate)
+    # True capture times on the host, 3 s after the device started
+    captured = 3e9 + np.arange(frames) * 1e9 / rate
+    device = np.round((captured - 3e9) / 1e3 / (1 + drift * 1e-6)).astype(int)
+    arrived = captured + rng.exponential(delay * 1e9, frames)
+    sync = ClockSync()
+    update = sync.update
+    start = default_timer()
+    estimates = np.array([update(d, h) for d, h in
+                          zip(device.tolist(), arrived.astype(int).tolist())])
+    elapsed = default_timer() - start
+    error = np.abs(estimates - captured)[int(10 * rate):] / 1e3
+    raw = (arrived - captured) / 1e3
+    print('Simulated %d s at %d Hz, host %+.0f ppm, mean delay %.1f ms' %
+          (seconds, rate, drift, delay * 1e3))
+    print('    estimated drift %+.2f ppm, %.2f us per update' %
+          (sync.drift_ppm, 1e6 * elapsed / frames))
+    print('    capture time error after 10 s: p50 %.1f  p99 %.1f us '
+          '(arrival times: p50 %.1f  p99 %.1f us)' %
+          (np.percentile(error, 50), np.percentile(error, 99),
+           np.percentile(raw, 50), np.percentile(raw, 99)))
+
+
+if __name__ == "__main__":
+    _benchmark()
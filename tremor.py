@@ -0,0 +1,502 @@
+"""Neuromechanics Lab Tremor Analysis
+
+Spectral analysis of Postural sessions, replacing HandAnalysis.m. Every palm
+and fingertip channel is resampled onto a uniform time grid in one pass, then
+Welch power spectral densities give the peak tremor frequency and the power
+in the tremor band for each channel.
+
+SlidingSpectrum follows the same band while a trial is being recorded,
+updating a handful of DFT bins as each frame arrives, and TremorWindow shows
+the result so a bad trial can be spotted before it is over.
+
+Run this file with a folder as the argument to analyze every session in it,
+or with no arguments to benchmark a batch of synthetic sessions and the live
+estimate.
+"""
+
+import glob, os, sys
+from collections import deque
+import numpy as np
+
+import session
+
+# Channels analyzed, from the Postural column layout
+CHANNELS = ('palm_x', 'palm_y', 'palm_z') + session.FINGER_COLUMNS
+# Frequency band of physiological and pathological tremor
+TREMOR_BAND = (3.0, 12.0) # Hz
+# Length of each Welch segment
+SEGMENT_SECONDS = 2.0
+# Length of the window followed during a trial
+LIVE_SECONDS = 2.0
+
+
+def load_session(filename):
+    """Loads the time and channel data of a Postural session. Returns a
+    time vector in seconds and a 2D array with one column per CHANNELS entry.
+
+    Keyword argument:
+    filename -- path of a Postural CSV file or session file
+    """
+    if filename.endswith(session.EXTENSION):
+        data = session.Session(filename)
+        header = data.header
+        data = data.data
+    else:
+        header, data = session.read_csv(filename)
+    if header['task'] != 'postural':
+        raise ValueError(filename + " is not a Postural session")
+    columns = tuple(header['columns'])
+    channels = [columns.index(name) for name in CHANNELS]
+    return np.asarray(data[:, columns.index('time')], float), \
+           np.asarray(data[:, channels], float)
+
+
+def resample(t, data, fs=None):
+    """Linearly interpolates every channel onto a uniform time grid at once.
+    Returns the grid, the resampled data and the sample rate. Missing (NaN)
+    samples are interpolated over from the channel's own samples either
+    side; channels with fewer than two samples stay NaN.
+
+    Keyword arguments:
+    t -- sample times in seconds, in increasing order
+    data -- 2D array with one row per sample time
+    fs (optional) -- sample rate of the grid, defaults to the mean rate of t
+                     as HandAnalysis.m used
+    """
+    if len(t) < 2 or t[-1] <= t[0]:
+        raise ValueError("at least two samples are needed to resample")
+    t = t - t[0]
+    if fs is None:
+        fs = (len(t) - 1) / t[-1]
+    grid = np.arange(int(t[-1] * fs) + 1) / fs
+    hi = np.clip(np.searchsorted(t, grid, side='right'), 1, len(t) - 1)
+    lo = hi - 1
+    span = t[hi] - t[lo]
+    weight = np.where(span > 0, (grid - t[lo]) / np.where(span > 0, span, 1),
+                      0.0)[:, np.newaxis]
+    resampled = data[lo] * (1 - weight) + data[hi] * weight
+    # Fingers drop out of view, so only channels with gaps are redone on
+    # their own
+    missing = np.isnan(data)
+    for channel in np.nonzero(missing.any(axis=0))[0]:
+        seen = ~missing[:, channel]
+        if np.count_nonzero(seen) < 2:
+            resampled[:, channel] = np.nan
+        else:
+            resampled[:, channel] = np.interp(grid, t[seen],
+                                              data[seen, channel])
+    return grid, resampled, fs
+
+
+def welch(data, fs, segment=None):
+    """Estimates the one-sided power spectral density of every channel with
+    Welch's method: Hann-windowed segments with 50% overlap, mean removed.
+    Returns the frequencies and a 2D array with one column per channel.
+
+    Keyword arguments:
+    data -- 2D array of uniformly sampled channels, one row per sample
+    fs -- sample rate in Hz
+    segment (optional) -- samples per segment, SEGMENT_SECONDS by default
+    """
+    if segment is None:
+        segment = int(SEGMENT_SECONDS * fs)
+    segment = min(segment, len(data))
+    step = max(segment // 2, 1)
+    starts = np.arange(0, len(data) - segment + 1, step)
+    # segments has shape (segment count, samples, channels)
+    segments = data[starts[:, np.newaxis] + np.arange(segment)]
+    segments = segments - segments.mean(axis=1)[:, np.newaxis]
+    window = np.hanning(segment)[:, np.newaxis]
+    spectra = np.fft.rfft(segments * window, axis=1)
+    psd = (spectra.real ** 2 + spectra.imag ** 2).mean(axis=0) / \
+          (fs * np.sum(window ** 2))
+    # Fold negative frequencies into the one-sided spectrum
+    psd[1:segment - segment // 2] *= 2
+    return np.fft.rfftfreq(segment, 1.0 / fs), psd
+
+
+def band_metrics(freqs, psd, band=TREMOR_BAND):
+    """Returns the peak frequency and the total power within a frequency
+    band for each channel, as two arrays. Channels with missing data are NaN.
+
+    Keyword arguments:
+    freqs -- frequencies of the PSD rows
+    psd -- 2D array of power spectral densities, one column per channel
+    band (optional) -- (low, high) limits of the band in Hz
+    """
+    inside = (freqs >= band[0]) & (freqs <= band[1])
+    power = psd[inside]
+    df = freqs[1] - freqs[0] if len(freqs) > 1 else 0.0
+    valid = ~np.isnan(power).any(axis=0)
+    peak = np.full(psd.shape[1], np.nan)
+    if power.size:
+        peaks = np.argmax(np.where(np.isnan(power), -np.inf, power), axis=0)
+        peak[valid] = freqs[inside][peaks[valid]]
+    return peak, power.sum(axis=0) * df
+
+
+def analyze(filename, band=TREMOR_BAND):
+    """Analyzes a single Postural session. Returns a dictionary with the
+    sample rate, the channel names and, per channel, the peak frequency and
+    band power.
+
+    Keyword arguments:
+    filename -- path of a Postural CSV file or session file
+    band (optional) -- (low, high) tremor band in Hz
+    """
+    t, data = load_session(filename)
+    grid, data, fs = resample(t, data)
+    freqs, psd = welch(data, fs)
+    peak, power = band_metrics(freqs, psd, band)
+    return {'fs': fs, 'channels': CHANNELS,
+            'peak_frequency': peak, 'band_power': power}
+
+
+def analyze_directory(folder, pattern='*', band=TREMOR_BAND):
+    """Analyzes every Postural session in a folder. Returns a dictionary
+    mapping file names to the results of analyze(). Files that aren't
+    Postural sessions are skipped.
+
+    Keyword arguments:
+    folder -- folder holding the session files
+    pattern (optional) -- glob pattern the file names must match
+    band (optional) -- (low, high) tremor band in Hz
+    """
+    results = {}
+    for filename in sorted(glob.glob(os.path.join(folder, pattern))):
+        if not filename.endswith(('.csv', session.EXTENSION)):
+            continue
+        try:
+            results[os.path.basename(filename)] = analyze(filename, band)
+        except ValueError:
+            pass
+    return results
+
+
+class SlidingSpectrum(object):
+    """Tremor band spectrum of a few channels over the most recent window
+    of frames, kept up to date with a sliding DFT. Only the bins in the band
+    are kept, and they are recomputed exactly with an FFT once per window so
+    rounding errors can't build up.
+
+    update() is meant for the listener thread and only queues the frame.
+    The frames queued since the last call are folded into the bins in one
+    array operation by estimate() or spectrum(), which should be called from
+    a single other thread, such as the one drawing a TremorWindow.
+    """
+
+    def __init__(self, window=None, rate=200.0, band=TREMOR_BAND,
+                 channels=3):
+        """Keyword arguments:
+        window (optional) -- frames in the window, LIVE_SECONDS at the
+                             nominal rate by default
+        rate (optional) -- nominal frame rate, used to choose the bins
+        band (optional) -- (low, high) frequency band in Hz
+        channels (optional) -- values given to each update
+        """
+        if window is None:
+            window = int(LIVE_SECONDS * rate)
+        self.window = window
+        # One bin either side of the band for the Hann window
+        low = max(int(np.ceil(band[0] * window / rate)), 2)
+        high = min(int(band[1] * window / rate), window // 2 - 1)
+        self.bins = np.arange(low - 1, high + 2)
+        # Twiddle factors raised to every power up to the window length
+        self._powers = np.exp(2j * np.pi / window *
+                              np.outer(self.bins, np.arange(window + 1)))
+        self._samples = np.zeros((window, channels))
+        self._times = np.zeros(window)
+        self._spectrum = np.zeros((len(self.bins), channels), complex)
+        self._next = 0 # Row of the oldest sample, overwritten next
+        # Frames older than a window would be overwritten anyway, so at
+        # most a window is queued when nothing is reading
+        self._queue = deque(maxlen=window)
+        self.frames = 0 # Frames folded into the bins
+
+    def update(self, time, values):
+        """Queues a frame. Cheap enough for the listener thread.
+
+        Keyword arguments:
+        time -- time of the frame in seconds
+        values -- one value per channel, such as the palm position
+        """
+        self._queue.append((time, values))
+
+    def _advance(self):
+        """Folds the queued frames into the window and the bins."""
+        queue = self._queue
+        frames = []
+        # popleft is atomic, so this is safe while the listener appends
+        while True:
+            try:
+                frames.append(queue.popleft())
+            except IndexError:
+                break
+        while frames:
+            # At most up to the end of the ring at a time
+            count = min(len(frames), self.window - self._next)
+            self._add(frames[:count])
+            frames = frames[count:]
+
+    def _add(self, frames):
+        """Adds frames that fit between the oldest row and the end of the
+        ring.
+        """
+        count = len(frames)
+        first = self._next
+        rows = slice(first, first + count)
+        values = np.array([values for time, values in frames], float)
+        change = values - self._samples[rows]
+        self._samples[rows] = values
+        self._times[rows] = [time for time, values in frames]
+        self._next = (first + count) % self.window
+        self.frames += count
+        if self._next == 0:
+            # The samples are in time order again: start over from an FFT
+            self._spectrum = np.fft.rfft(self._samples, axis=0)[self.bins]
+        else:
+            # Each frame adds its change and turns every bin by one twiddle
+            # factor, so the j-th of count frames is turned count - j times
+            powers = self._powers
+            self._spectrum = self._spectrum * powers[:, count:count + 1] + \
+                             np.dot(powers[:, count:0:-1], change)
+
+    @property
+    def ready(self):
+        """True once a whole window of frames has been seen."""
+        return self.frames >= self.window
+
+    def spectrum(self):
+        """Returns the frequency of each band bin and the amplitude of a
+        sinusoid at that frequency, combined over the channels, using a Hann
+        window. Frequencies come from the measured frame rate.
+        """
+        self._advance()
+        spectrum = self._spectrum
+        hann = 0.5 * spectrum[1:-1] - 0.25 * (spectrum[:-2] + spectrum[2:])
+        amplitude = 4.0 / self.window * \
+                    np.sqrt((hann.real ** 2 + hann.imag ** 2).sum(axis=1))
+        return self.bins[1:-1] * self.rate / self.window, amplitude
+
+    @property
+    def rate(self):
+        """Frame rate over the current window, in frames per second."""
+        times = self._times
+        newest = times[self._next - 1]
+        oldest = times[self._next] if self.ready else times[0]
+        count = min(self.frames, self.window) - 1
+        if count < 1 or newest <= oldest:
+            return 0.0
+        return count / (newest - oldest)
+
+    def estimate(self):
+        """Returns the dominant frequency in the band in Hz and its amplitude
+        in the units of the channels, or None until the window is full. Both
+        are interpolated between bins.
+        """
+        freqs, amplitude = self.spectrum()
+        if not self.ready:
+            return None
+        peak = int(np.argmax(amplitude))
+        height = amplitude[peak]
+        offset = 0.0
+        if 0 < peak < len(amplitude) - 1:
+            # Vertex of the parabola through the peak and its neighbours
+            a, b, c = amplitude[peak - 1:peak + 2]
+            if a - 2 * b + c < 0:
+                offset = 0.5 * (a - c) / (a - 2 * b + c)
+                height = b - 0.25 * (a - c) * offset
+        step = freqs[1] - freqs[0] if len(freqs) > 1 else 0.0
+        return freqs[peak] + offset * step, height
+
+
+class TremorWindow(object):
+    """Small pygame window showing the live tremor spectrum, the dominant
+    frequency and its amplitude.
+    """
+
+    def __init__(self, spectrum, size=(480, 260), units='mm'):
+        """Keyword arguments:
+        spectrum -- SlidingSpectrum to show
+        size (optional) -- window size in pixels
+        units (optional) -- units of the channels, for the amplitude label
+        """
+        import pygame
+        from render import TextCache
+        self._pygame = pygame
+        self.spectrum = spectrum
+        self.units = units
+        self.size = size
+        pygame.display.init()
+        pygame.font.init()
+        self.screen = pygame.display.set_mode(size)
+        pygame.display.set_caption("Live Tremor")
+        self.text = TextCache()
+        self.scale = 1.0 # Amplitude at the top of the plot, only grows
+
+    def draw(self):
+        """Redraws the window. Cheap enough to call ten times a second from
+        the main thread while the listener records.
+        """
+        pygame = self._pygame
+        pygame.event.pump() # Keeps the window responsive
+        width, height = self.size
+        screen = self.screen
+        screen.fill((255, 255, 255))
+        estimate = self.spectrum.estimate()
+        if estimate is None:
+            self.text.blit(screen, "Collecting %d of %d frames" %
+                           (self.spectrum.frames, self.spectrum.window),
+                           (width // 2, height // 2), (0, 0, 0), 20)
+        else:
+            freqs, amplitude = self.spectrum.spectrum()
+            self.scale = max(self.scale, float(amplitude.max()))
+            top, bottom = 40, height - 30
+            bar = float(width - 20) / len(freqs)
+            for n, value in enumerate(amplitude):
+                h = int((bottom - top) * value / self.scale)
+                pygame.draw.rect(screen, (0, 0, 255),
+                                 (10 + int(n * bar), bottom - h,
+                                  max(int(bar) - 1, 1), h))
+            for f in (freqs[0], freqs[len(freqs) // 2], freqs[-1]):
+                x = 10 + int((f - freqs[0]) / (freqs[-1] - freqs[0]) *
+                             (len(freqs) - 1) * bar + bar / 2)
+                self.text.blit(screen, "%d Hz" % round(f),
+                               (x, bottom + 15), (0, 0, 0), 16)
+            frequency, peak = estimate
+            self.text.blit(screen, "%.1f Hz   %.2f %s" %
+                           (frequency, peak, self.units),
+                           (width // 2, 20), (255, 0, 0), 24)
+        pygame.display.flip()
+
+    def close(self):
+        """Closes the window."""
+        self._pygame.display.quit()
+
+
+def _benchmark(files=300, seconds=10.0, rate=200.0):
+    """Writes a folder of synthetic Postural sessions with a known tremor
+    frequency and times analyze_directory on it, as CSV and session files.
+
+    Keyword arguments:
+    files (optional) -- number of sessions
+    seconds (optional) -- length of each session
+    rate (optional) -- nominal frame rate of the synthetic Leap
+    """
+    import shutil, tempfile
+    from timeit import default_timer
+
+    folder = tempfile.mkdtemp()
+    rng = np.random.RandomState(0)
+    frames = int(seconds * rate)
+    for n in range(files):
+        # Jittered sample times like the Leap callback produces
+        t = np.cumsum(rng.uniform(0.5, 1.5, frames)) / rate
+        tremor = 4.0 + 8.0 * n / files
+        data = np.full((frames, len(session.POSTURAL_COLUMNS)), np.nan)
+        data[:, 0] = t
+        data[:, 1:26] = rng.normal(0, 0.2, (frames, 25)) + \
+                        np.sin(2 * np.pi * tremor * t)[:, np.newaxis]
+        data[:, 10] = 5
+        session.write_session(os.path.join(folder, 'postural%d.nmls' % n),
+                              session.make_header('postural',
+                                                  session.POSTURAL_COLUMNS),
+                              data)
+        with open(os.path.join(folder, 'postural%d.csv' % n), 'w') as f:
+            f.write('Postural Tremor Data for One Hand\n\n\n')
+            for row in np.delete(data[:, :26], 10, axis=1).tolist():
+                f.write(','.join(map(str, row)) + ',\n')
+
+    for pattern in ('*.csv', '*' + session.EXTENSION):
+        start = default_timer()
+        results = analyze_directory(folder, pattern)
+        elapsed = default_timer() - start
+        print('%-8s %d sessions in %6.2f s (%5.1f ms each)' %
+              (pattern, len(results), elapsed, 1e3 * elapsed / len(results)))
+    peaks = [results['postural%d.nmls' % n]['peak_frequency'][0]
+             for n in range(0, files, files // 3)]
+    print('palm_x peak frequencies: ' +
+          ', '.join('%.2f Hz' % p for p in peaks))
+    shutil.rmtree(folder)
+
+
+def _live_benchmark(seconds=60.0, rate=200.0, refresh=0.1):
+    """Feeds SlidingSpectrum a simulated palm with a known tremor at
+    jittered frame times, checks its bins against an FFT and its estimate
+    against the tremor, and times the listener's update, the display's
+    estimate and an FFT of the whole window.
+
+    Keyword arguments:
+    seconds (optional) -- length of the simulated trial
+    rate (optional) -- nominal frame rate
+    refresh (optional) -- seconds between estimates, as in Postural
+    """
+    from timeit import default_timer
+    rng = np.random.RandomState(0)
+    frames = int(seconds * rate)
+    t = np.cumsum(rng.uniform(0.9, 1.1, frames)) / rate
+    tremor, amplitude = 6.3, 0.8
+    palm = np.array([0.0, 200.0, 0.0]) + rng.normal(0, 0.05, (frames, 3)) + \
+           amplitude / np.sqrt(3) * \
+           np.sin(2 * np.pi * tremor * t)[:, np.newaxis] + \
+           np.linspace(0, 5, frames)[:, np.newaxis] # slow drift
+    rows = palm.tolist()
+    times = t.tolist()
+    batch = int(refresh * rate)
+
+    live = SlidingSpectrum(rate=rate)
+    # Batches of every size, including ones longer than the window, must
+    # leave the same bins as an FFT of the window
+    n = 0
+    for size in (1, 7, batch, live.window - 3, 2 * live.window + 5, 1, 3):
+        for row in range(n, n + size):
+            live.update(times[row], rows[row])
+        n += size
+        live.spectrum()
+        window = np.roll(live._samples, -live._next, axis=0)
+        exact = np.fft.rfft(window, axis=0)[live.bins]
+        error = np.abs(live._spectrum - exact).max() / np.abs(exact).max()
+        assert error < 1e-9, (size, error)
+
+    live = SlidingSpectrum(rate=rate)
+    update = estimate = 0.0
+    for first in range(0, frames, batch):
+        start = default_timer()
+        for n in range(first, min(first + batch, frames)):
+            live.update(times[n], rows[n])
+        update += default_timer() - start
+        start = default_timer()
+        result = live.estimate()
+        estimate += default_timer() - start
+    frequency, peak = result
+    assert abs(frequency - tremor) < 0.25 and abs(peak - amplitude) < 0.2, \
+           (frequency, peak)
+
+    samples = palm[:live.window]
+    start = default_timer()
+    for n in range(1000):
+        np.fft.rfft(samples - samples.mean(axis=0), axis=0)
+    full = (default_timer() - start) / 1000
+
+    print('Live estimate of a %.1f Hz, %.2f mm tremor: %.2f Hz, %.2f mm '
+          '(sliding bins agree with an FFT to %.0e)' %
+          (tremor, amplitude, frequency, peak, error))
+    print('    update %.2f us per frame in the listener; estimate every %d '
+          'frames %.1f us (%.2f us per frame, %d bins); FFT of the window '
+          '%.1f us' % (1e6 * update / frames, batch,
+                       1e6 * estimate / (frames // batch),
+                       1e6 * estimate / frames, len(live.bins), 1e6 * full))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for name, result in sorted(analyze_directory(sys.argv[1]).items()):
+            print(name)
+            for channel, peak, power in zip(result['channels'],
+                                            result['peak_frequency'],
+                                            result['band_power']):
+                print('    %-10s %6.2f Hz  %10.4g mm^2' %
+                      (channel, peak, power))
+    else:
+        _benchmark()
+        _live_benchmark()
@@ -1,4 +1,8 @@
 import pygame, Leap, nml
+from acquisition import wait_for_device
+from capture import palm_position
+from framebus import DROP_OLDEST, Subscriber
+from render import StaticLayer, TextCache
 
 
 # Colors assigned by RGB values
@@ -13,51 +17,57 @@ CURSOR = 15
 FONT_SIZE = 20
 SCREEN_X = 525
 SCREEN_Y = 500
+# Show the frames published by "python framebus.py serve" instead of opening
+# a controller here, so a logger running alongside records the same frames
+FRAME_BUS = False
+
+def draw_views(surface, w, h, d):
+    """Draws the outline and label of each view of the interaction box."""
+    pygame.draw.rect(surface, RED, (BUFF,BUFF,w,d), STROKE) #Top
+    pygame.draw.rect(surface, RED, (BUFF,2*BUFF+d,w,h), STROKE) # Front
+    pygame.draw.rect(surface, RED, (2*BUFF+w,2*BUFF+d,d,h), STROKE) # Right
+    text.blit(surface, "Top View", (BUFF+w/2, BUFF/2), BLACK, FONT_SIZE)
+    text.blit(surface, "Front View", (BUFF+w/2, 3*BUFF/2+d), BLACK, FONT_SIZE)
+    text.blit(surface, "Right View", (2*BUFF+w+d/2, 3*BUFF/2+d), BLACK,
+              FONT_SIZE)
 
 pygame.init()
 screen_size = (SCREEN_X,SCREEN_Y)
 screen = pygame.display.set_mode(screen_size)
 pygame.display.set_caption("Visual Feedback")
 screen.fill(WHITE)
+# Outlines and labels only change with the interaction box, so they are
+# drawn once and copied to the screen each frame
+text = TextCache()
+views = StaticLayer(screen_size, draw_views, WHITE)
 
 clock = pygame.time.Clock()
-controller = Leap.Controller()
-while controller.frame().interaction_box.width == 0:
-    pass
-box = controller.frame().interaction_box
+if FRAME_BUS:
+    # The display only needs the newest frame, so older ones may be dropped
+    subscriber = Subscriber(policy=DROP_OLDEST)
+    box = subscriber.box
+else:
+    controller = Leap.Controller()
+    box = wait_for_device(controller).interaction_box
 running = True
 while running:
     for event in pygame.event.get(): 
         if event.type == pygame.QUIT:
             running = False
-    frame = controller.frame()
-    box = frame.interaction_box
+    if FRAME_BUS:
+        pos = palm_position(subscriber.latest())
+        running = running and not subscriber.closed
+    else:
+        frame = controller.frame()
+        box = frame.interaction_box
+        pos = None
+        if len(frame.hands) == 1:
+            pos = frame.hands[0].palm_position
     w = box.width
     h = box.height
     d = box.depth
-    screen.fill(WHITE)
-    pygame.draw.rect(screen, RED, (BUFF,BUFF,w,d), STROKE) #Top
-    pygame.draw.rect(screen, RED, (BUFF,2*BUFF+d,w,h), STROKE) # Front
-    pygame.draw.rect(screen, RED, (2*BUFF+w,2*BUFF+d,d,h), STROKE) # Right
-
-    # Writing text on the screen is suprisingly complex
-    font = pygame.font.Font(None, FONT_SIZE)
-    text = font.render("Top View", 1, BLACK)
-    textpos = text.get_rect()
-    textpos.center = (int(BUFF +w/2),int(BUFF/2))
-    screen.blit(text, textpos)
-    text = font.render("Front View", 1, BLACK)
-    textpos = text.get_rect()
-    textpos.center = (int(BUFF +w/2),int(3*BUFF/2+d))
-    screen.blit(text, textpos)
-    text = font.render("Right View", 1, BLACK)
-    textpos = text.get_rect()
-    textpos.center = (int(2*BUFF+w+d/2),int(3*BUFF/2+d))
-    screen.blit(text, textpos)
-    if len(frame.hands) == 1:
-        hand = frame.hands[0]
-        pos = hand.palm_position
-
+    views.blit(screen, w, h, d)
+    if pos is not None:
         x = pos[0]
         y = pos[1]
         z = pos[2]
@@ -82,6 +92,8 @@ while running:
     pygame.display.flip()
         
     clock.tick(50)
+if FRAME_BUS:
+    subscriber.close()
 pygame.quit()
 
 
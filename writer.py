@@ -0,0 +1,211 @@
+"""Neuromechanics Lab Streaming Writer
+
+Writes session data to disk from a background thread while a trial is still
+running. Rows are handed over through a bounded queue, encoded a batch at a
+time and written in large blocks, so a long session no longer costs millions
+of tiny write calls at the end and is not lost if the program crashes.
+
+Run this file directly to benchmark against the old per-element write loop.
+"""
+
+import os, struct, threading
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+# Rows encoded and written together by the writer thread
+BATCH_ROWS = 1024
+# Rows or blocks of rows allowed to wait in the queue before the caller
+# blocks
+QUEUE_ITEMS = 4096
+
+_NAN = float('nan')
+
+
+class CsvEncoder(object):
+    """Encodes rows as comma separated text in the layout the loggers have
+    always written, including the trailing comma on every row.
+    """
+
+    def encode(self, rows):
+        """Returns the rows as a single block of bytes.
+
+        Keyword argument:
+        rows -- list of rows, each a sequence of numbers or strings
+        """
+        text = ''.join([','.join(map(str, row)) + ',\n' for row in rows])
+        return text.encode('ascii')
+
+
+class BinaryEncoder(object):
+    """Encodes rows as packed little-endian float records of a fixed number
+    of columns. Short rows are padded with NaN.
+    """
+
+    def __init__(self, columns, type_code='d'):
+        """Keyword arguments:
+        columns -- number of values in each record
+        type_code (optional) -- struct type of each value, 'd' for float64
+                                or 'f' for float32
+        """
+        self.columns = columns
+        self._record = struct.Struct('<%d%s' % (columns, type_code))
+
+    def encode(self, rows):
+        """Returns the rows as a single block of bytes.
+
+        Keyword argument:
+        rows -- list of rows, each a sequence of at most columns numbers
+        """
+        pack = self._record.pack
+        pad = [_NAN] * self.columns
+        out = []
+        for row in rows:
+            if len(row) < self.columns:
+                row = list(row) + pad[len(row):]
+            out.append(pack(*row))
+        return b''.join(out)
+
+
+class StreamWriter(object):
+    """Writes rows to a file from a background thread. Call close() at the
+    end of the trial to flush the remaining rows and fsync the file.
+    """
+
+    def __init__(self, filename, encoder=None, header='',
+                 batch_rows=BATCH_ROWS, queue_items=QUEUE_ITEMS):
+        """Opens the file, writes the header and starts the writer thread.
+
+        Keyword arguments:
+        filename -- path of the file to create
+        encoder (optional) -- object with an encode(rows) method returning
+                              bytes, CsvEncoder by default
+        header (optional) -- text or bytes written before any rows
+        batch_rows (optional) -- rows encoded per write call
+        queue_items (optional) -- rows or blocks of rows that may be waiting
+                                  before the caller blocks
+        """
+        self.filename = filename
+        self.encoder = encoder or CsvEncoder()
+        self.batch_rows = batch_rows
+        self.rows_written = 0
+        self._file = open(filename, 'wb')
+        if header:
+            if not isinstance(header, bytes):
+                header = header.encode('ascii')
+            self._file.write(header)
+        self._queue = Queue(queue_items)
+        self._error = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, row):
+        """Queues a single row. Blocks only if the queue is full.
+
+        Keyword argument:
+        row -- sequence of values to write
+        """
+        self._queue.put((row,))
+
+    def write_rows(self, rows):
+        """Queues every row of an iterable, in order, handing them to the
+        writer thread in blocks of batch_rows.
+
+        Keyword argument:
+        rows -- iterable of rows
+        """
+        block = []
+        for row in rows:
+            block.append(row)
+            if len(block) == self.batch_rows:
+                self._queue.put(block)
+                block = []
+        if block:
+            self._queue.put(block)
+
+    def close(self):
+        """Writes all queued rows, fsyncs and closes the file. Raises any
+        error the writer thread ran into.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        if self._error:
+            raise self._error
+
+    def _run(self):
+        queue = self._queue
+        done = False
+        while not done:
+            # Block for the first rows, then take whatever else is waiting
+            batch = []
+            item = queue.get()
+            try:
+                while item is not None:
+                    batch.extend(item)
+                    if len(batch) >= self.batch_rows:
+                        break
+                    item = queue.get_nowait()
+            except Empty:
+                pass
+            done = item is None
+            if batch and not self._error:
+                try:
+                    self._file.write(self.encoder.encode(batch))
+                    # Hand the block to the OS so a crash loses little data
+                    self._file.flush()
+                    self.rows_written += len(batch)
+                except Exception as e:
+                    self._error = e
+
+
+def _benchmark(rows=1000000, columns=16):
+    """Writes a synthetic session with the old per-element loop and with
+    StreamWriter, printing the time each takes.
+
+    Keyword arguments:
+    rows (optional) -- frames in the synthetic session
+    columns (optional) -- values per frame
+    """
+    import random, tempfile
+    from timeit import default_timer
+
+    random.seed(0)
+    base = [[random.uniform(-200, 200) for c in range(columns)]
+            for r in range(1000)]
+    data = [base[r % 1000] for r in range(rows)]
+    folder = tempfile.mkdtemp()
+
+    def report(name, filename, elapsed):
+        size = os.path.getsize(filename) / 1e6
+        print('%-22s %7.2f s  %8.1f MB' % (name, elapsed, size))
+        os.remove(filename)
+
+    filename = os.path.join(folder, 'loop.csv')
+    start = default_timer()
+    writeFile = open(filename, 'w')
+    for row in data:
+        for element in row:
+            writeFile.write(str(element) + ',')
+        writeFile.write('\n')
+    writeFile.close()
+    report('per-element loop', filename, default_timer() - start)
+
+    for name, encoder in (('StreamWriter csv', CsvEncoder()),
+                          ('StreamWriter binary', BinaryEncoder(columns))):
+        filename = os.path.join(folder, 'stream.dat')
+        start = default_timer()
+        writer = StreamWriter(filename, encoder)
+        writer.write_rows(data)
+        writer.close()
+        report(name, filename, default_timer() - start)
+    os.rmdir(folder)
+
+
+if __name__ == "__main__":
+    _benchmark()